@@ -0,0 +1,7 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 14:30
+@Version: v1.0
+@Description: 性能基准脚本
+    每个脚本都可以通过 python -m chatgpt.benchmark.<脚本名> 运行
+"""
@@ -0,0 +1,82 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 22:05
+@Version: v1.0
+@Description: find_category_and_product_only 提示词大小随目录规模的变化
+    按内置 products.json 的类别和品牌合成 30 ~ 10 万个商品的目录，对比提示词中放入完整的
+    类别 → 商品名称 字典与只放入检索候选（catalog_retrieval）时的 token 数，
+    并给出索引构建耗时、每次检索耗时和召回率（查询中提到的商品是否在候选中）。
+
+    python -m chatgpt.benchmark.catalog_prompt --sizes 30,1000,10000,100000
+"""
+import argparse
+import random
+import time
+
+from chatgpt.phase02 import util_zh
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.catalog_retrieval import CatalogRetriever
+from chatgpt.token_count import count_message_tokens, uses_tiktoken
+
+SERIES = ["Pro", "Max", "Air", "Ultra", "Lite", "Neo", "Plus", "Mini", "Edge", "Prime", "Flex", "Nova"]
+QUERIES = ["请问 {name} 的价格是多少？", "{name} 和 {other} 哪个保修期更长？", "我想了解一下 {name}"]
+
+
+def synthesize(size, seed=0):
+    """按内置目录的类别和品牌合成 size 个商品，名称形如 "SmartX Nova 1234" """
+    rng = random.Random(seed)
+    base = list(util_zh.get_catalog())
+    products = []
+    for index in range(size):
+        template = base[index % len(base)]
+        brand = template.brand or "Generic"
+        name = f"{brand} {rng.choice(SERIES)} {index}"
+        products.append({
+            'name': name,
+            'category': template.category,
+            'brand': brand,
+            'model_number': f"{brand[:2].upper()}-{index:06d}",
+            'price': round(rng.uniform(50, 3000), 2),
+        })
+    return Catalog(products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="find_category_and_product_only 提示词大小随目录规模的变化")
+    parser.add_argument("--sizes", default="30,1000,10000,100000", help="逗号分隔的目录规模")
+    parser.add_argument("--queries", type=int, default=200, help="每个规模的查询数")
+    parser.add_argument("--top-n", type=int, default=util_zh.RETRIEVAL_TOP_N)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args()
+
+    counter = "tiktoken" if uses_tiktoken() else "按字符估算（未安装 tiktoken）"
+    print(f"top_n={args.top_n}，token 计数方式：{counter}")
+    print(f"{'商品数':>8}{'完整 token':>12}{'检索 token':>12}{'构建(s)':>10}{'检索(ms)':>10}{'召回率':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        catalog = synthesize(size)
+        started = time.perf_counter()
+        retriever = CatalogRetriever(catalog)
+        build = time.perf_counter() - started
+
+        rng = random.Random(size)
+        names = [product.name for product in catalog]
+        full_tokens = retrieved_tokens = hits = 0
+        elapsed = 0.0
+        for _ in range(args.queries):
+            name, other = rng.choice(names), rng.choice(names)
+            query = rng.choice(QUERIES).format(name=name, other=other)
+            started = time.perf_counter()
+            candidates = retriever.candidates(query, args.top_n)
+            elapsed += time.perf_counter() - started
+            hits += any(name in products for products in candidates.values())
+            retrieved_tokens += count_message_tokens(
+                util_zh.build_category_and_product_messages(query, candidates), args.model)
+        # 完整字典的提示词与查询无关，只计算一次
+        full_tokens = count_message_tokens(
+            util_zh.build_category_and_product_messages(query, catalog.category_names), args.model)
+        print(f"{size:>8}{full_tokens:>12}{retrieved_tokens // args.queries:>12}{build:>10.2f}"
+              f"{elapsed / args.queries * 1e3:>10.2f}{hits / args.queries:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 15:10
+@Version: v1.0
+@Description: HTTP 连接池基准
+    在独立进程中启动 chatgpt.stub_server 桩服务，分别用 1、16、128 个并发调用方通过 tool.get_completion_from_messages 压测，
+    对比共享 keep-alive 连接池与每次请求都新建连接（max_keepalive_connections=0）时的每秒请求数。
+    每个请求的内容各不相同，并关闭在途请求合并和补全缓存，保证每次调用都经过连接池真正发往桩服务。
+
+    python -m chatgpt.benchmark.http_pool
+    python -m chatgpt.benchmark.http_pool --requests 2000 --latency-ms 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def start_stub_server(latency=0.0):
+    """
+    在独立进程中启动 chatgpt.stub_server（随机端口），避免桩服务与压测线程争用同一个 GIL
+    返回:
+        (process, base_url)
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "chatgpt.stub_server", "--port", "0", "--latency", f"fixed:{latency}"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    # 桩服务第一行输出服务地址
+    base_url = process.stdout.readline().strip()
+    return process, base_url
+
+
+def run(tool, callers, total):
+    # 预热，建立连接
+    tool.get_completion_from_messages([{'role': 'user', 'content': 'ping'}])
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        list(executor.map(lambda i: tool.get_completion_from_messages([{'role': 'user', 'content': f'ping {i}'}]),
+                          range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 连接池吞吐基准")
+    parser.add_argument("--requests", type=int, default=1000, help="每种配置的请求总数")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="桩服务的固定响应延迟")
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 16, 128])
+    args = parser.parse_args()
+
+    process, base_url = start_stub_server(args.latency_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    from chatgpt import tool
+
+    tool.set_request_coalescing(False)
+    configs = {
+        "共享 keep-alive 连接池": {'max_keepalive_connections': max(args.callers)},
+        "每次新建连接": {'max_keepalive_connections': 0},
+    }
+    print(f"桩服务 {base_url}，响应延迟 {args.latency_ms} ms，每组 {args.requests} 个请求")
+    for name, options in configs.items():
+        tool.configure_http_pool(max_connections=max(args.callers), **options)
+        # 在 configure_http_pool 加载环境变量之后关闭，OPENAI_CACHE_PATH 开启的缓存也会被关闭
+        tool.disable_completion_cache()
+        for callers in args.callers:
+            rps = run(tool, callers, args.requests)
+            print(f"{name:<16} 并发 {callers:>4}：{rps:8.1f} req/s")
+    print(f"在途请求合并：{tool.get_coalescing_stats()}")
+    process.terminate()
+    process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 14:30
+@Version: v1.0
+@Description: 导入耗时基准
+    在全新的子进程中以 python -X importtime 导入目标模块，取多次运行的中位数，并列出耗时最多的依赖模块。
+    可用 --max-ms 设置阈值，超过阈值时返回非零退出码，方便在 CI 中跟踪启动耗时回归。
+
+    python -m chatgpt.benchmark.import_time
+    python -m chatgpt.benchmark.import_time chatgpt.tool --runs 10 --max-ms 150
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(module):
+    """
+    导入一次模块
+    返回:
+        total_us: 目标模块的累计导入耗时（微秒）
+        entries: [(cumulative_us, self_us, name)]，-X importtime 输出的每一行
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    entries = []
+    total_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        entries.append((int(cumulative_us), int(self_us), name))
+        if name == module:
+            total_us = int(cumulative_us)
+    return total_us, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量模块的导入耗时")
+    parser.add_argument("module", nargs="?", default="chatgpt.tool")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="中位数超过该值时以非零状态退出")
+    args = parser.parse_args()
+
+    totals = []
+    entries = []
+    for _ in range(args.runs):
+        total_us, entries = measure(args.module)
+        totals.append(total_us / 1000)
+    median_ms = statistics.median(totals)
+    print(f"{args.module} 导入耗时：中位数 {median_ms:.1f} ms，最小 {min(totals):.1f} ms，最大 {max(totals):.1f} ms")
+    print(f"最后一次运行中自身耗时最多的 {args.top} 个模块：")
+    for cumulative_us, self_us, name in sorted(entries, key=lambda e: e[1], reverse=True)[:args.top]:
+        print(f"    {self_us / 1000:8.1f} ms  (累计 {cumulative_us / 1000:8.1f} ms)  {name}")
+    for heavy in ("openai", "httpx", "dotenv", "langchain"):
+        if any(name.strip() == heavy for _, _, name in entries):
+            print(f"警告：导入 {args.module} 时加载了 {heavy}")
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"导入耗时 {median_ms:.1f} ms 超过阈值 {args.max_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 21:20
+@Version: v1.0
+@Description: 商品序列化的 token 与耗时对比
+    对内置的 products.json，比较 generate_output_string 原来的写法（每次 json.dumps(indent=4) 并用 += 拼接）
+    与缓存的紧凑序列化（json、table）在提示词 token 数和每次请求耗时上的差异。
+
+    python -m chatgpt.benchmark.product_serialization
+"""
+import argparse
+import json
+import time
+
+from chatgpt.phase02 import util_zh
+from chatgpt.token_count import count_text_tokens, uses_tiktoken
+
+
+def legacy_output_string(products):
+    """原来的实现：每个商品都重新 json.dumps(indent=4)，用 += 拼接"""
+    output_string = ""
+    for product in products:
+        output_string += json.dumps(product.to_dict(), indent=4, ensure_ascii=False) + "\n"
+    return output_string
+
+
+def timed(fn, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="商品序列化的 token 与耗时对比")
+    parser.add_argument("--rounds", type=int, default=2000, help="计时的重复次数")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args()
+
+    catalog = util_zh.get_catalog()
+    products = list(catalog)
+    # 一次请求提到目录中的全部商品
+    data_list = [{'category': category} for category in catalog.categories()]
+
+    legacy = legacy_output_string(products)
+    baseline_tokens = count_text_tokens(legacy, args.model)
+    counter = "tiktoken" if uses_tiktoken() else "按字符估算（未安装 tiktoken）"
+    print(f"products.json：{len(products)} 个商品，token 计数方式：{counter}")
+    print(f"{'格式':<12}{'字符数':>8}{'token':>8}{'节省':>8}{'每次耗时(us)':>14}")
+    print(f"{'indent=4':<12}{len(legacy):>8}{baseline_tokens:>8}{'-':>8}"
+          f"{timed(lambda: legacy_output_string(products), args.rounds):>14.1f}")
+    for fmt in ("json", "table"):
+        output = util_zh.generate_output_string(data_list, fmt)
+        tokens = count_text_tokens(output, args.model)
+        elapsed = timed(lambda: util_zh.generate_output_string(data_list, fmt), args.rounds)
+        saving = 1 - tokens / baseline_tokens
+        print(f"{fmt:<12}{len(output):>8}{tokens:>8}{saving:>8.0%}{elapsed:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 00:50
+@Version: v1.0
+@Description: SQLite FTS5 商品库与内存目录的查询延迟对比
+    按内置 products.json 合成 --size 个商品（默认 100 万），分别导入内存中的 Catalog（及 CatalogRetriever 倒排索引）
+    和 ProductStore，比较导入耗时、内存增量以及 get（精确 / 规范化名称）、category_sample、全文检索的延迟。
+
+    python -m chatgpt.benchmark.product_store --size 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from chatgpt.phase02 import util_zh
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.catalog_retrieval import CatalogRetriever
+from chatgpt.phase02.product_store import ProductStore
+
+SERIES = ["Pro", "Max", "Air", "Ultra", "Lite", "Neo", "Plus", "Mini", "Edge", "Prime", "Flex", "Nova"]
+
+
+def synthesize(size, seed=0):
+    """按内置目录的类别、品牌、特性和描述合成 size 个商品字典"""
+    rng = random.Random(seed)
+    base = [product.to_dict() for product in util_zh.get_catalog()]
+    for index in range(size):
+        template = base[index % len(base)]
+        yield dict(template,
+                   name=f"{template['brand']} {rng.choice(SERIES)} {index}",
+                   model_number=f"{template['brand'][:2].upper()}-{index:07d}",
+                   price=round(rng.uniform(50, 3000), 2))
+
+
+def rss_mib():
+    """当前进程的常驻内存（MiB），不支持的平台返回 None"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def latency(fn, args_list):
+    """返回每次调用耗时的 (p50, p99)，单位微秒"""
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def timed_build(fn):
+    before = rss_mib()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    after = rss_mib()
+    return result, elapsed, (after - before) if before is not None and after is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite FTS5 商品库与内存目录的查询延迟对比")
+    parser.add_argument("--size", type=int, default=1_000_000, help="商品数")
+    parser.add_argument("--queries", type=int, default=2000, help="每种查询的次数")
+    parser.add_argument("--path", default=None, help="商品库文件路径，默认使用临时目录")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    products = list(synthesize(args.size))
+    names = [rng.choice(products)['name'] for _ in range(args.queries)]
+    categories = sorted({product['category'] for product in products[:100]})
+    queries = [(f"{name.split()[0]} {name.split()[1]} camera 4K",) for name in names]
+
+    memory_catalog, build, memory = timed_build(lambda: Catalog(products))
+    retriever, retriever_build, retriever_memory = timed_build(lambda: CatalogRetriever(memory_catalog))
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "products.db")
+    store, store_build, store_memory = timed_build(lambda: ProductStore(path))
+    _, load, load_memory = timed_build(lambda: store.load_products(products))
+    size_mib = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix)) / 2 ** 20
+    del products
+
+    def fmt_memory(value):
+        return "-" if value is None else f"{value:.0f} MiB"
+
+    print(f"{args.size} 个商品")
+    print(f"内存目录：构建 {build:.1f}s，内存 +{fmt_memory(memory)}；倒排索引：构建 {retriever_build:.1f}s，"
+          f"内存 +{fmt_memory(retriever_memory)}")
+    print(f"SQLite 商品库：导入 {store_build + load:.1f}s，进程内存 +{fmt_memory(load_memory)}，文件 {size_mib:.0f} MiB")
+    print(f"{'查询':<28}{'内存 p50(us)':>14}{'内存 p99(us)':>14}{'SQLite p50(us)':>16}{'SQLite p99(us)':>16}")
+    cases = [
+        ("get 精确名称", lambda c, n: c.get(n), [(name,) for name in names]),
+        ("get 规范化名称", lambda c, n: c.get(n), [(name.lower().replace(" ", ""),) for name in names]),
+        ("category_sample(20)", lambda c, n: c.category_sample(n, 20),
+         [(rng.choice(categories),) for _ in names]),
+    ]
+    for label, fn, args_list in cases:
+        memory_p50, memory_p99 = latency(lambda *a: fn(memory_catalog, *a), args_list)
+        store_p50, store_p99 = latency(lambda *a: fn(store, *a), args_list)
+        print(f"{label:<28}{memory_p50:>14.1f}{memory_p99:>14.1f}{store_p50:>16.1f}{store_p99:>16.1f}")
+    memory_p50, memory_p99 = latency(lambda q: retriever.search(q, 20), queries)
+    store_p50, store_p99 = latency(lambda q: store.search(q, 20), queries)
+    print(f"{'检索 top 20（BM25 / FTS5）':<28}{memory_p50:>14.1f}{memory_p99:>14.1f}{store_p50:>16.1f}{store_p99:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
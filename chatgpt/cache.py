@@ -0,0 +1,166 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 09:30
+@Version: v1.0
+@Description: 持久化的内容寻址补全缓存
+    以 模型、消息、温度、max_tokens 的哈希值作为键，将补全内容和 token 用量保存到 SQLite 中；
+    命中时直接返回内容并回放当时的 token 用量字典，按条目数、总字节数和存活时间做 LRU 淘汰。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_cache_key(model, messages, temperature, max_tokens=None):
+    """
+    计算一次 ChatCompletion 请求的内容寻址键
+    参数:
+        model: 调用的模型
+        messages: 消息列表
+        temperature: 温度
+        max_tokens: 输出的最大 token 数，未指定时为 None
+    返回:
+        sha256 十六进制字符串
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    基于 SQLite 的补全缓存，可被多个线程（以及通过 WAL 被多个进程）共享
+    参数:
+        path: SQLite 文件路径
+        max_entries: 最多保留的条目数
+        max_bytes: 最多保留的内容字节数
+        max_age: 条目的最长存活时间（秒），None 表示不过期
+        evict_interval: 每写入多少次检查一次容量
+    """
+
+    def __init__(self, path, max_entries=100_000, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600,
+                 evict_interval=100):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions(accessed_at)")
+
+    def get(self, key):
+        """
+        查询缓存
+        返回:
+            (content, token_dict) 或 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, usage, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age is not None and now - row[2] > self.max_age):
+                if row is not None:
+                    self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            # 更新访问时间，用于 LRU 淘汰
+            self._conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0], json.loads(row[1])
+
+    def set(self, key, content, token_dict):
+        """
+        写入缓存
+        参数:
+            key: make_cache_key 计算出的键
+            content: 补全内容
+            token_dict: token 用量字典，命中时原样回放
+        """
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, content, usage, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content, json.dumps(token_dict), size, now, now),
+            )
+            self._writes += 1
+            if self._writes % self.evict_interval == 0:
+                self._evict_locked(now)
+
+    def evict(self):
+        """按存活时间、条目数和字节数淘汰条目"""
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def _evict_locked(self, now):
+        if self.max_age is not None:
+            self._conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.max_age,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到满足容量限制
+        overflow = max(count - self.max_entries, 0)
+        removed_bytes = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM completions ORDER BY accessed_at"):
+            if len(victims) >= overflow and total - removed_bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            removed_bytes += size
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", victims)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+
+    def stats(self):
+        """
+        返回:
+            包含 hits、misses、hit_rate、entries、bytes 的字典
+        """
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count,
+            'bytes': total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
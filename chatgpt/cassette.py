@@ -0,0 +1,324 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 17:05
+@Version: v1.0
+@Description: OpenAI 流量的录制/回放（cassette）
+    在 HTTP 传输层拦截请求：录制模式下把请求和响应写入压缩的 cassette 文件，回放模式下直接从文件返回响应，
+    并可按录制时的延迟（乘以系数）模拟网络耗时。流式响应（text/event-stream）边转发边录制每个分块相对请求开始的
+    时间，回放时同样分块返回，首 token 耗时与录制时一致，而不是等于总耗时。tool.py、ChatOpenAI、OpenAIEmbeddings 只要使用
+    tool.get_http_client() 返回的 HTTP 客户端，就都会经过这一层。
+
+    通过环境变量开启：
+        OPENAI_CASSETTE_MODE: record（总是请求并录制）、replay（只回放，缺失时报错）、auto（有则回放，无则录制）
+        OPENAI_CASSETTE: cassette 文件路径，默认 cassettes/openai.jsonl.gz
+        OPENAI_CASSETTE_LATENCY: 回放时模拟延迟的系数，0 表示不模拟，1 表示按录制时的延迟
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+
+MODES = ("record", "replay", "auto")
+
+
+class CassetteMiss(LookupError):
+    """回放模式下 cassette 中没有对应的请求"""
+
+
+def request_key(method, url, body):
+    """
+    请求的键：方法、路径和规范化后的 JSON 请求体（不含鉴权头、域名），换代理地址不影响回放
+    """
+    try:
+        payload = json.dumps(json.loads(body), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except (ValueError, UnicodeDecodeError):
+        payload = hashlib.sha256(body).hexdigest()
+    digest = hashlib.sha256(f"{method} {url.path}\n{payload}".encode("utf-8")).hexdigest()
+    return digest
+
+
+class Cassette:
+    """
+    参数:
+        path: cassette 文件路径（gzip 压缩的 JSON Lines）
+        mode: record、replay 或 auto
+        latency_scale: 回放时模拟延迟的系数
+    """
+
+    def __init__(self, path, mode="auto", latency_scale=0.0):
+        if mode not in MODES:
+            raise ValueError(f"未知的 cassette 模式：{mode}，可选 {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.replayed = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._cursor = {}
+        self._overwritten = set()
+        self._dirty = False
+        if mode != "record" and os.path.exists(path):
+            self.load()
+        atexit.register(self.save)
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._entries.setdefault(entry["key"], []).append(entry)
+
+    def save(self):
+        """原子地写回 cassette 文件（先写临时文件再替换）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp = f"{self.path}.{os.getpid()}.tmp"
+            with gzip.open(temp, "wt", encoding="utf-8") as f:
+                for entries in self._entries.values():
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(temp, self.path)
+            self._dirty = False
+
+    def lookup(self, key):
+        """
+        返回该请求的下一条录制响应；同一请求录制了多次（如 temperature>0）时按顺序循环回放
+        """
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            self.replayed += 1
+            return entries[index % len(entries)]
+
+    def record(self, key, status_code, headers, body, latency, header_latency=None, chunks=None):
+        """
+        参数:
+            latency: 从发出请求到读完响应体的秒数
+            header_latency: 从发出请求到收到响应头的秒数，流式响应才记录
+            chunks: 流式响应的分块 [(相对请求开始的秒数, 字节数)]，按顺序拼接即为 body
+        """
+        try:
+            text, encoding = body.decode("utf-8"), "text"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode("ascii"), "base64"
+        entry = {
+            "key": key,
+            "status": status_code,
+            "content_type": headers.get("content-type", "application/json"),
+            "body": text,
+            "encoding": encoding,
+            "latency": round(latency, 4),
+        }
+        if chunks is not None:
+            entry["header_latency"] = round(header_latency, 4)
+            entry["chunks"] = [[round(offset, 4), size] for offset, size in chunks]
+        with self._lock:
+            if self.mode == "record" and key not in self._overwritten:
+                # record 模式下覆盖旧的录制结果
+                self._entries[key] = []
+                self._overwritten.add(key)
+            self._entries.setdefault(key, []).append(entry)
+            self.recorded += 1
+            self._dirty = True
+
+    def delay(self, entry):
+        """返回响应头之前模拟的秒数；流式响应的分块在读取时按录制的时间返回"""
+        if "chunks" in entry:
+            return entry["header_latency"] * self.latency_scale
+        return entry["latency"] * self.latency_scale
+
+    def to_response(self, entry, request, started):
+        """
+        参数:
+            started: 回放开始的 time.perf_counter()，分块的时间相对它计算
+        """
+        body = entry["body"].encode("utf-8") if entry["encoding"] == "text" else base64.b64decode(entry["body"])
+        headers = {"content-type": entry["content_type"]}
+        if "chunks" in entry:
+            stream = _ReplayStream(body, entry["chunks"], self.latency_scale, started)
+            return httpx.Response(entry["status"], headers=headers, stream=stream, request=request)
+        return httpx.Response(entry["status"], headers=headers, content=body, request=request)
+
+
+def _is_stream(response):
+    return response.headers.get("content-type", "").startswith("text/event-stream")
+
+
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """按录制时的时间（乘以系数）逐块返回响应体"""
+
+    def __init__(self, body, chunks, latency_scale, started):
+        self.body = body
+        self.chunks = chunks
+        self.latency_scale = latency_scale
+        self.started = started
+
+    def _pieces(self):
+        """依次返回 (需要等待的秒数, 分块)"""
+        position = 0
+        for offset, size in self.chunks:
+            wait = self.started + offset * self.latency_scale - time.perf_counter()
+            yield max(wait, 0.0), self.body[position:position + size]
+            position += size
+        if position < len(self.body):
+            yield 0.0, self.body[position:]
+
+    def __iter__(self):
+        for wait, piece in self._pieces():
+            if wait:
+                time.sleep(wait)
+            yield piece
+
+    async def __aiter__(self):
+        import asyncio
+
+        for wait, piece in self._pieces():
+            if wait:
+                await asyncio.sleep(wait)
+            yield piece
+
+
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """
+    边转发边录制流式响应：调用方照常逐块读取，读完后把完整的响应体和各分块的时间写入 cassette；
+    调用方提前关闭时不录制不完整的响应
+    """
+
+    def __init__(self, cassette, key, response, started):
+        self.cassette = cassette
+        self.key = key
+        self.response = response
+        self.started = started
+        self.header_latency = time.perf_counter() - started
+        self.parts = []
+        self.chunks = []
+
+    def _collect(self, chunk):
+        self.parts.append(chunk)
+        self.chunks.append((time.perf_counter() - self.started, len(chunk)))
+
+    def _finish(self):
+        self.cassette.record(self.key, self.response.status_code, self.response.headers, b"".join(self.parts),
+                             time.perf_counter() - self.started, self.header_latency, self.chunks)
+
+    def __iter__(self):
+        for chunk in self.response.iter_bytes():
+            self._collect(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        self.response.close()
+
+    async def __aiter__(self):
+        async for chunk in self.response.aiter_bytes():
+            self._collect(chunk)
+            yield chunk
+        self._finish()
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+def _clean_headers(headers):
+    # 响应体已经解压（流式响应逐块解压），去掉与原始传输相关的头
+    return [(k, v) for k, v in headers.items() if k.lower() not in ("content-encoding", "content-length",
+                                                                      "transfer-encoding")]
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """同步 httpx 传输层，包装真实的传输层"""
+
+    def __init__(self, cassette, transport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request):
+        key = request_key(request.method, request.url, request.read())
+        started = time.perf_counter()
+        if self.cassette.mode != "record":
+            entry = self.cassette.lookup(key)
+            if entry is not None:
+                delay = self.cassette.delay(entry)
+                if delay:
+                    time.sleep(delay)
+                return self.cassette.to_response(entry, request, started)
+            if self.cassette.mode == "replay":
+                raise CassetteMiss(f"cassette 中没有该请求：{request.method} {request.url.path}")
+        response = self.transport.handle_request(request)
+        if _is_stream(response):
+            stream = _RecordingStream(self.cassette, key, response, started)
+            return httpx.Response(response.status_code, headers=_clean_headers(response.headers), stream=stream,
+                                  request=request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        self.cassette.record(key, response.status_code, response.headers, body, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=_clean_headers(response.headers), content=body,
+                              request=request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """异步 httpx 传输层，包装真实的传输层"""
+
+    def __init__(self, cassette, transport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        import asyncio
+
+        key = request_key(request.method, request.url, await request.aread())
+        started = time.perf_counter()
+        if self.cassette.mode != "record":
+            entry = self.cassette.lookup(key)
+            if entry is not None:
+                delay = self.cassette.delay(entry)
+                if delay:
+                    await asyncio.sleep(delay)
+                return self.cassette.to_response(entry, request, started)
+            if self.cassette.mode == "replay":
+                raise CassetteMiss(f"cassette 中没有该请求：{request.method} {request.url.path}")
+        response = await self.transport.handle_async_request(request)
+        if _is_stream(response):
+            stream = _RecordingStream(self.cassette, key, response, started)
+            return httpx.Response(response.status_code, headers=_clean_headers(response.headers), stream=stream,
+                                  request=request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        self.cassette.record(key, response.status_code, response.headers, body, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=_clean_headers(response.headers), content=body,
+                              request=request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def cassette_from_env():
+    """按环境变量创建 Cassette，未开启时返回 None"""
+    mode = os.environ.get("OPENAI_CASSETTE_MODE", "").lower()
+    if not mode or mode == "off":
+        return None
+    return Cassette(
+        os.environ.get("OPENAI_CASSETTE") or os.path.join("cassettes", "openai.jsonl.gz"),
+        mode=mode,
+        latency_scale=float(os.environ.get("OPENAI_CASSETTE_LATENCY") or 0),
+    )
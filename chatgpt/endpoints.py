@@ -0,0 +1,200 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 19:30
+@Version: v1.0
+@Description: 多个 OpenAI 兼容端点之间的负载均衡与故障转移
+    .env 中的 OPENAI_BASE_URL 只能指向一个端点（官方 API 或某个聚合代理）。配置多个端点后，
+    每次请求先选出 在途请求数 / 权重 最低（或与最低值相差不超过 tie_tolerance）的端点，再在其中按平滑加权轮询
+    （smooth weighted round-robin）选择，轮询使用的权重由策略决定：
+        least_outstanding: 端点的权重
+        ewma: 权重 / 延迟 EWMA，变慢的代理按比例少分流量
+    串行或低并发时请求按上述权重比例分到各端点，每个端点都持续有真实请求，健康状态能被及时发现。
+    熔断：连续失败 failure_threshold 次（连接错误、超时、429、5xx）的端点被摘除，cooldown 秒后
+    放行一个探测请求（半开状态），探测成功则恢复，失败则继续摘除。
+
+    通过环境变量配置，多个端点以逗号分隔，每个端点为 "URL|权重|API Key 的环境变量名"，后两项可省略：
+        OPENAI_ENDPOINTS=https://api.openai.com/v1|1,https://proxy.example.com/v1|3|PROXY_API_KEY
+        OPENAI_ENDPOINT_STRATEGY=ewma
+"""
+import os
+import threading
+import time
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class Endpoint:
+    """
+    参数:
+        base_url: 端点地址，如 https://api.openai.com/v1
+        weight: 权重，越大分到的请求越多
+        api_key: 该端点的 API Key，None 表示使用 OPENAI_API_KEY
+    """
+
+    def __init__(self, base_url, weight=1.0, api_key=None):
+        self.base_url = base_url
+        self.weight = float(weight)
+        self.api_key = api_key
+        self.outstanding = 0
+        self.ewma = None
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0.0
+        # 由 tool.py 按需创建并缓存的 OpenAI / AsyncOpenAI 客户端
+        self.client = None
+        self.async_client = None
+
+    def __repr__(self):
+        return f"Endpoint({self.base_url!r}, weight={self.weight}, state={self.state})"
+
+
+def parse_endpoints(spec):
+    """解析 OPENAI_ENDPOINTS 格式的字符串，返回 Endpoint 列表"""
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split("|")
+        weight = float(parts[1]) if len(parts) > 1 and parts[1] else 1.0
+        api_key = os.environ.get(parts[2]) if len(parts) > 2 and parts[2] else None
+        endpoints.append(Endpoint(parts[0], weight, api_key))
+    return endpoints
+
+
+class EndpointPool:
+    """
+    参数:
+        endpoints: Endpoint 列表，也可以是 URL 字符串或 {'base_url', 'weight', 'api_key'} 字典
+        strategy: least_outstanding 或 ewma
+        failure_threshold: 连续失败多少次后摘除端点
+        cooldown: 摘除多少秒后放行探测请求
+        ewma_alpha: 延迟 EWMA 的平滑系数，越大越看重最近的请求
+        tie_tolerance: 在途请求数 / 权重 不超过最低值 + tie_tolerance 的端点视为并列，按权重轮流选择
+    """
+
+    def __init__(self, endpoints, strategy="least_outstanding", failure_threshold=5, cooldown=10.0, ewma_alpha=0.3,
+                 tie_tolerance=0.1):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的负载均衡策略：{strategy}，可选 {STRATEGIES}")
+        self.endpoints = [self._coerce(e) for e in endpoints]
+        if not self.endpoints:
+            raise ValueError("至少需要一个端点")
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.tie_tolerance = tie_tolerance
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _coerce(endpoint):
+        if isinstance(endpoint, Endpoint):
+            return endpoint
+        if isinstance(endpoint, str):
+            return Endpoint(endpoint)
+        return Endpoint(**endpoint)
+
+    def _effective_weights(self, candidates):
+        if self.strategy != "ewma":
+            return [e.weight for e in candidates]
+        # 还没有延迟样本的端点按候选中最快的延迟计算，尽快得到样本
+        samples = [e.ewma for e in candidates if e.ewma]
+        fastest = min(samples) if samples else 1.0
+        return [e.weight / (e.ewma or fastest) for e in candidates]
+
+    def _weighted_round_robin(self, candidates):
+        """平滑加权轮询：每轮各端点加上自身权重，选当前权重最大的端点并减去总权重"""
+        weights = self._effective_weights(candidates)
+        for endpoint, weight in zip(candidates, weights):
+            endpoint.current_weight += weight
+        chosen = max(candidates, key=lambda e: e.current_weight)
+        chosen.current_weight -= sum(weights)
+        return chosen
+
+    def acquire(self):
+        """
+        选择一个端点并计入在途请求，请求结束后必须调用 release
+        所有端点都被摘除时，选择最早被摘除的端点，而不是直接失败
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+                    # 冷却结束，转为半开状态，放行一个探测请求
+                    endpoint.state = HALF_OPEN
+                    chosen = endpoint
+                    break
+                if endpoint.state == CLOSED:
+                    candidates.append(endpoint)
+            else:
+                if candidates:
+                    loads = [e.outstanding / e.weight for e in candidates]
+                    limit = min(loads) + self.tie_tolerance
+                    chosen = self._weighted_round_robin([e for e, load in zip(candidates, loads) if load <= limit])
+                else:
+                    chosen = min(self.endpoints, key=lambda e: e.opened_at)
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, endpoint, latency=None, ok=True):
+        """
+        请求结束
+        参数:
+            endpoint: acquire 返回的端点
+            latency: 请求耗时（秒），None 表示请求被取消，不计入统计
+            ok: 是否成功；None 表示结果与端点健康无关（如请求参数错误）
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if latency is None or ok is None:
+                if endpoint.state == HALF_OPEN:
+                    # 探测没有得出结论，下次重新探测
+                    endpoint.state = OPEN
+                return
+            if ok:
+                sample = latency
+                if endpoint.state == HALF_OPEN:
+                    # 探测成功，丢弃摘除前累积的失败惩罚，否则 ewma 策略会一直避开刚恢复的端点
+                    endpoint.ewma = None
+                endpoint.failures = 0
+                endpoint.state = CLOSED
+            else:
+                # 失败的请求按较高的延迟计入 EWMA，使 ewma 策略更快地避开该端点
+                sample = max(latency, 2 * (endpoint.ewma or latency))
+                endpoint.failures += 1
+                endpoint.errors += 1
+                if endpoint.state == HALF_OPEN or endpoint.failures >= self.failure_threshold:
+                    endpoint.state = OPEN
+                    endpoint.opened_at = time.monotonic()
+            alpha = self.ewma_alpha
+            endpoint.ewma = sample if endpoint.ewma is None else alpha * sample + (1 - alpha) * endpoint.ewma
+
+    def stats(self):
+        """返回每个端点的状态、在途请求数、延迟 EWMA、请求数和错误数"""
+        with self._lock:
+            return [{
+                'base_url': e.base_url,
+                'weight': e.weight,
+                'state': e.state,
+                'outstanding': e.outstanding,
+                'ewma_latency': e.ewma,
+                'requests': e.requests,
+                'errors': e.errors,
+            } for e in self.endpoints]
+
+
+def endpoint_pool_from_env():
+    """按环境变量 OPENAI_ENDPOINTS、OPENAI_ENDPOINT_STRATEGY 创建 EndpointPool，未配置时返回 None"""
+    spec = os.environ.get("OPENAI_ENDPOINTS")
+    if not spec:
+        return None
+    return EndpointPool(parse_endpoints(spec), strategy=os.environ.get("OPENAI_ENDPOINT_STRATEGY") or "least_outstanding")
@@ -0,0 +1,99 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 18:55
+@Version: v1.0
+@Description: LangChain 调用的指标统计
+    ChatOpenAI 不经过 tool.py，通过回调把延迟、token 数与费用记录到 chatgpt.metrics 的注册表；
+    OpenAIEmbeddings 没有回调，用 MeteredEmbeddings 包装：
+
+    llm = ChatOpenAI(model="gpt-4o-mini", http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
+    embeddings = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
+"""
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from chatgpt import metrics
+from chatgpt.token_count import count_text_tokens
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """记录每次 LLM / ChatModel 调用，调用方在调用开始时从调用栈推断"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+
+    def _start(self, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), model, metrics.infer_call_site())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, model, site = run
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or model
+        usage = llm_output.get("token_usage")
+        if usage:
+            usage = {'prompt_tokens': usage.get("prompt_tokens", 0),
+                     'completion_tokens': usage.get("completion_tokens", 0)}
+        else:
+            # 流式调用没有 llm_output，从消息的 usage_metadata 读取
+            usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    usage['prompt_tokens'] += metadata.get("input_tokens", 0)
+                    usage['completion_tokens'] += metadata.get("output_tokens", 0)
+        metrics.record_since("chat", model, "ok", started, site, usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            started, model, site = run
+            metrics.record_since("chat", model, "error", started, site)
+
+
+class MeteredEmbeddings(Embeddings):
+    """
+    包装任意 LangChain Embeddings，记录每次向量化的延迟与估算 token 数（Embeddings 接口不返回用量）
+    参数:
+        embeddings: 被包装的 Embeddings，如 OpenAIEmbeddings
+        model: 指标中的模型名，默认读取 embeddings.model
+    """
+
+    def __init__(self, embeddings, model=None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", "unknown")
+
+    def _call(self, fn, texts):
+        started = time.perf_counter()
+        site = metrics.infer_call_site()
+        try:
+            result = fn()
+        except Exception:
+            metrics.record_since("embedding", self.model, "error", started, site)
+            raise
+        tokens = sum(count_text_tokens(text, self.model) for text in texts)
+        metrics.record_since("embedding", self.model, "ok", started, site, {'prompt_tokens': tokens})
+        return result
+
+    def embed_documents(self, texts):
+        return self._call(lambda: self.embeddings.embed_documents(texts), texts)
+
+    def embed_query(self, text):
+        return self._call(lambda: self.embeddings.embed_query(text), [text])
@@ -0,0 +1,289 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 18:40
+@Version: v1.0
+@Description: 模型调用的指标统计
+    tool.py 中的每次补全、流式补全、Embedding 和 Moderation 调用，以及 LangChain 的回调（见 chatgpt/langchain_metrics.py），
+    都会把延迟、token 数和估算费用记录到进程内的注册表，按以下标签分组：
+        kind: chat、embedding 或 moderation
+        model: 模型名
+        call_site: 调用方，默认从调用栈推断为 "模块.函数"，也可以用 call_site_scope 指定
+        outcome: ok、error、cache_hit、coalesced（被在途请求合并）、cancelled（流式补全被调用方中途关闭）；token 与费用只统计真正计费的 ok 调用
+
+    导出方式：
+        start_http_server(port) 以 Prometheus 文本格式在 http://127.0.0.1:port/metrics 暴露指标
+        dump_json(path) 写出 JSON 快照
+    也可以通过环境变量开启（在首次调用模型时生效）：
+        OPENAI_METRICS_PORT: Prometheus 端口
+        OPENAI_METRICS_JSON: 进程退出时写出 JSON 的路径
+"""
+import atexit
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+# 每百万 token 的美元价格 (输入, 输出)，按模型名前缀匹配，最长前缀优先
+PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+    'text-embedding-ada-002': (0.10, 0.0),
+}
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+OUTCOMES = ("ok", "error", "cache_hit", "coalesced", "cancelled")
+
+# 推断调用方时跳过的模块：本项目的基础设施以及 SDK、LangChain、标准库中的调度代码
+_SKIPPED_MODULES = (
+    "chatgpt.tool", "chatgpt.metrics", "chatgpt.langchain_metrics", "chatgpt.resilience", "chatgpt.singleflight",
+    "openai", "httpx", "langchain", "langchain_core", "langchain_openai", "langchain_community",
+    "concurrent", "threading", "asyncio", "contextlib", "functools",
+)
+
+_call_site = contextvars.ContextVar("openai_call_site", default=None)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    """按 PRICES 估算一次调用的美元费用，未知模型返回 0"""
+    matches = [name for name in PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = PRICES[max(matches, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+@contextlib.contextmanager
+def call_site_scope(name):
+    """
+    为代码块内的所有模型调用指定 call_site 标签，例如按流水线阶段统计：
+        with call_site_scope("evaluate"):
+            eval_response_with_ideal(...)
+    """
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+
+def infer_call_site():
+    """返回当前调用方的标签：call_site_scope 指定的名称，或调用栈中第一个业务代码帧的 "模块.函数" """
+    name = _call_site.get()
+    if name is not None:
+        return name
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_SKIPPED_MODULES):
+            if module == "__main__":
+                module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class _Series:
+    __slots__ = ("count", "buckets", "latency_sum", "prompt_tokens", "completion_tokens", "cost")
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, kind, model, outcome, latency, prompt_tokens=0, completion_tokens=0, call_site=None):
+        """
+        记录一次调用
+        参数:
+            kind: chat、embedding 或 moderation
+            model: 模型名
+            outcome: ok、error、cache_hit、coalesced 或 cancelled
+            latency: 调用耗时（秒）
+            prompt_tokens: 提示 token 数，只有 ok 调用计入
+            completion_tokens: 输出 token 数，只有 ok 调用计入
+            call_site: 调用方标签，None 表示按 infer_call_site() 推断
+        """
+        if call_site is None:
+            call_site = infer_call_site()
+        labels = (kind, model, call_site, outcome)
+        billed = outcome == "ok"
+        cost = estimate_cost(model, prompt_tokens, completion_tokens) if billed else 0.0
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _Series()
+            series.count += 1
+            series.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            series.latency_sum += latency
+            if billed:
+                series.prompt_tokens += prompt_tokens
+                series.completion_tokens += completion_tokens
+                series.cost += cost
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """
+        返回:
+            列表，每项为一组标签的统计：kind、model、call_site、outcome、count、latency_sum、
+            latency_buckets（{上界: 累计次数}）、prompt_tokens、completion_tokens、cost_usd
+        """
+        with self._lock:
+            items = [(labels, series.count, list(series.buckets), series.latency_sum, series.prompt_tokens,
+                      series.completion_tokens, series.cost) for labels, series in self._series.items()]
+        result = []
+        for (kind, model, site, outcome), count, buckets, latency_sum, prompt, completion, cost in items:
+            cumulative, running = {}, 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                running += n
+                cumulative[str(bound)] = running
+            result.append({
+                'kind': kind, 'model': model, 'call_site': site, 'outcome': outcome,
+                'count': count, 'latency_sum': round(latency_sum, 6), 'latency_buckets': cumulative,
+                'prompt_tokens': prompt, 'completion_tokens': completion, 'cost_usd': round(cost, 8),
+            })
+        return result
+
+    def summary(self):
+        """按 call_site 汇总调用次数、token 数与费用，便于查看哪个阶段花费最多"""
+        totals = {}
+        for item in self.snapshot():
+            total = totals.setdefault(item['call_site'], {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                          'cost_usd': 0.0})
+            total['calls'] += item['count']
+            total['prompt_tokens'] += item['prompt_tokens']
+            total['completion_tokens'] += item['completion_tokens']
+            total['cost_usd'] += item['cost_usd']
+        return dict(sorted(totals.items(), key=lambda kv: kv[1]['cost_usd'], reverse=True))
+
+    def render_prometheus(self):
+        """以 Prometheus 文本格式输出全部指标"""
+        lines = [
+            "# HELP llm_requests_total Number of model calls.",
+            "# TYPE llm_requests_total counter",
+        ]
+        snapshot = self.snapshot()
+
+        def label_text(item, **extra):
+            labels = {k: item[k] for k in ('kind', 'model', 'call_site', 'outcome')}
+            labels.update(extra)
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+        for item in snapshot:
+            lines.append(f"llm_requests_total{label_text(item)} {item['count']}")
+        lines += [
+            "# HELP llm_request_latency_seconds Latency of model calls.",
+            "# TYPE llm_request_latency_seconds histogram",
+        ]
+        for item in snapshot:
+            for bound, count in item['latency_buckets'].items():
+                lines.append(f"llm_request_latency_seconds_bucket{label_text(item, le=bound)} {count}")
+            lines.append(f"llm_request_latency_seconds_sum{label_text(item)} {item['latency_sum']}")
+            lines.append(f"llm_request_latency_seconds_count{label_text(item)} {item['count']}")
+        lines += [
+            "# HELP llm_tokens_total Billed tokens.",
+            "# TYPE llm_tokens_total counter",
+        ]
+        for item in snapshot:
+            lines.append(f"llm_tokens_total{label_text(item, type='prompt')} {item['prompt_tokens']}")
+            lines.append(f"llm_tokens_total{label_text(item, type='completion')} {item['completion_tokens']}")
+        lines += [
+            "# HELP llm_cost_usd_total Estimated cost in US dollars.",
+            "# TYPE llm_cost_usd_total counter",
+        ]
+        for item in snapshot:
+            lines.append(f"llm_cost_usd_total{label_text(item)} {item['cost_usd']}")
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        """把快照和按调用方的汇总写入 JSON 文件"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'series': self.snapshot(), 'summary': self.summary()}, f, ensure_ascii=False, indent=2)
+
+
+registry = MetricsRegistry()
+
+
+def record(kind, model, outcome, latency, prompt_tokens=0, completion_tokens=0, call_site=None):
+    """在全局注册表中记录一次调用，参数同 MetricsRegistry.record"""
+    registry.record(kind, model, outcome, latency, prompt_tokens, completion_tokens, call_site)
+
+
+def record_since(kind, model, outcome, started, site, usage=None):
+    """以 time.perf_counter() 起始时间记录一次调用，usage 为 token_dict"""
+    usage = usage or {}
+    registry.record(kind, model, outcome, time.perf_counter() - started, usage.get('prompt_tokens', 0),
+                    usage.get('completion_tokens', 0), site)
+
+
+def start_http_server(port=9464, host="127.0.0.1"):
+    """
+    在后台线程启动 Prometheus 指标端点
+    返回:
+        ThreadingHTTPServer 实例，用完后调用 shutdown()
+    """
+    # 只在需要暴露端点时导入，避免拖慢 tool.py 的导入
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump_json(path):
+    registry.dump_json(path)
+
+
+def configure_from_env():
+    """按环境变量 OPENAI_METRICS_PORT、OPENAI_METRICS_JSON 开启导出"""
+    port = os.environ.get("OPENAI_METRICS_PORT")
+    if port:
+        start_http_server(int(port))
+    path = os.environ.get("OPENAI_METRICS_JSON")
+    if path:
+        atexit.register(dump_json, path)
@@ -6,7 +6,8 @@
 """
 # ChatGPT 这样的聊天模型实际上是组装成以一系列消息作为输入，并返回一个模型生成的消息作为输出的
 
-from chatgpt.tool import get_completion, get_completion_from_messages
+from chatgpt.tool import get_completion, get_completion_from_messages, stream_completion_from_messages, \
+    fit_messages_to_budget
 import panel as pn  # GUI
 
 result = "未运行AI"
@@ -49,16 +50,26 @@ def collect_messages(_):
     prompt = inp.value_input
     inp.value = ''
     context.append({'role': 'user', 'content': f"{prompt}"})
-    response = get_completion_from_messages(context)
-    context.append({'role': 'assistant', 'content': f"{response}"})
     panels.append(
         pn.Row('User:', pn.pane.Markdown(prompt, width=600)))
+    # 流式输出：边生成边渲染，避免界面长时间空白
+    answer = pn.pane.Markdown("", width=600)
     panels.append(
-        pn.Row('Assistant:', pn.pane.Markdown(response, width=600)))
-    return pn.Column(*panels)
+        pn.Row('Assistant:', answer))
+    # context 会随对话不断增长，发送前按预算裁剪：保留菜单（system）和最近几轮，较早的对话替换为摘要
+    stream = stream_completion_from_messages(fit_messages_to_budget(context, budget=PROMPT_BUDGET, keep_last=4))
+    for delta in stream:
+        answer.object += delta
+        yield pn.Column(*panels)
+    context.append({'role': 'assistant', 'content': f"{stream.content}"})
+    # 模型没有输出任何内容时没有首 token 耗时
+    ttft = "无" if stream.time_to_first_token is None else f"{stream.time_to_first_token:.2f}s"
+    print(f"首 token 耗时：{ttft}，总耗时：{stream.latency:.2f}s，token 用量：{stream.usage}")
+    yield pn.Column(*panels)
 
 
 pn.extension()
+PROMPT_BUDGET = 2000  # 每次请求的提示词 token 预算
 panels = []  # collect display
 context = [
     {
@@ -3,19 +3,29 @@
 @Date: 2025-02-11 16:
 @Version: v1.0
 @Description: 加载.env文件
+    .env 文件只在第一次需要时加载一次，导入本模块本身没有任何副作用
 """
 import os
-import openai
-from dotenv import load_dotenv, find_dotenv
+import threading
 
-_ = load_dotenv(find_dotenv())
+_env_lock = threading.Lock()
+_env_loaded = False
 
-# 获取环境变量 OPENAI_API_KEY
-openai.api_key = os.environ['OPENAI_API_KEY']
+
+def load_env():
+    """加载 .env 文件到环境变量（线程安全，只加载一次）"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv, find_dotenv
+            _ = load_dotenv(find_dotenv())
+            _env_loaded = True
 
 
 # 将读取环境的代码封装为函数
 def get_openai_api_key():
-    _ = load_dotenv(find_dotenv())
+    load_env()
+    # 获取环境变量 OPENAI_API_KEY
     return os.environ['OPENAI_API_KEY']
-
@@ -7,7 +7,7 @@
 """
 from IPython.display import display, Markdown, Latex, HTML, JSON
 import time
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_completions_batch
 
 # 引入 Redlines 包，详细显示并对比纠错过程
 from redlines import Redlines
@@ -68,6 +68,16 @@ for i in range(len(text)):
     # response = get_completion(prompt)
     # print(i, response)
 
+# 文本量很大时，可以用 get_completions_batch 并发校对，结果与输入顺序一致，并汇总 token 用量
+proofread_prompts = [
+    f"""请校对并更正以下文本，注意纠正文本保持原始语种，无需输出原始文本。如果您没有发现任何错误，请说“未发现错误”。
+    ```{t}```""" for t in text
+]
+# results, usage = get_completions_batch(proofread_prompts, max_concurrency=8)
+# for i, item in enumerate(results):
+#     print(i, item['content'] if item['error'] is None else item['error'])
+# print(usage)
+
 # 大语言模型进行语法纠错
 error_grammar_txt = f'''
 事实证语法明错误并不影响会阅读效果
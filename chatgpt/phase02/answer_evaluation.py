@@ -0,0 +1,206 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 22:40
+@Version: v1.0
+@Description: 回答评估策略
+    端到端问答的第六步让模型判断"回复是否足够回答问题"，每轮对话的模型调用费用因此翻倍。
+    评估策略决定哪些回答交给模型评估：
+        always: 每个回答都由模型评估（原来的做法）
+        sampled: 按 sample_rate 抽样由模型评估，未抽中的回答直接通过（不计入通过率）
+        local: 本地打分，检查回答与商品信息的一致性，得分低于阈值时才交给模型评估
+    本地打分：
+        1. 商品名覆盖：回答中提到了商品信息中的哪些商品（规范化后子串匹配）
+        2. 价格一致：回答中的价格（$799.99、799.99 美元等）必须是商品信息中的价格或两个价格之差
+    只提到商品名、没有任何可核对价格的回答（包括拒答和"没有保修"之类无法在本地核对的说法）价格项得 0 分，
+    总分不超过 NAME_WEIGHT，低于默认阈值，交给模型评估；本地只放行至少有一个价格能与商品信息对上的回答。
+    通过率等汇总指标定期写入日志，也可以通过 stats() 读取，用少量的模型调用保持对回答质量的可见性。
+"""
+import json
+import logging
+import random
+import re
+import threading
+
+from chatgpt.phase02.catalog import parse_table
+from chatgpt.phase02.product_matcher import normalize
+
+logger = logging.getLogger(__name__)
+
+MODES = ("always", "sampled", "local")
+
+# 评估方式：llm 为模型评估，local 为本地打分通过，skipped 为抽样未抽中
+LLM, LOCAL, SKIPPED = "llm", "local", "skipped"
+
+# 本地得分中商品名覆盖与价格一致的权重
+NAME_WEIGHT = 0.6
+PRICE_WEIGHT = 0.4
+# 只靠商品名覆盖无法通过本地打分，local 模式的 threshold 应大于 NAME_WEIGHT
+# 商品名覆盖计满分需要提到的商品数
+NAMES_FOR_FULL_SCORE = 3
+
+_PRICE = re.compile(r"[$＄￥¥]\s?(\d[\d,]*(?:\.\d+)?)|(\d[\d,]*(?:\.\d+)?)\s?(?:美元|美金|元|dollars?|USD)", re.I)
+
+
+def parse_product_information(product_information):
+    """
+    从 generate_output_string 的输出（每行一个商品，json 或 table 格式）中取出商品名和价格
+    返回:
+        [(商品名, 价格)]，价格缺失时为 None
+    """
+    facts = []
+    for line in product_information.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+        else:
+            data = parse_table(line)
+        name = data.get("name")
+        if not name:
+            continue
+        try:
+            price = round(float(data["price"]), 2)
+        except (KeyError, TypeError, ValueError):
+            price = None
+        facts.append((name, price))
+    return facts
+
+
+def extract_prices(text):
+    """回答中出现的价格列表"""
+    prices = []
+    for match in _PRICE.finditer(text):
+        value = (match.group(1) or match.group(2)).replace(",", "")
+        try:
+            prices.append(round(float(value), 2))
+        except ValueError:
+            continue
+    return prices
+
+
+def _is_known_price(cents, known):
+    """价格是商品信息中的价格，或两个价格之差（比较两个商品时回答里常出现差价）；对每个已知价格查一次集合，是线性的"""
+    if cents in known:
+        return True
+    return cents > 0 and any(price + cents in known for price in known)
+
+
+def local_score(answer, product_information):
+    """
+    参数:
+        answer: 模型的回答
+        product_information: 生成回答时提供的商品信息
+    返回:
+        0 ~ 1 的得分，回答中没有价格时价格项为 0；商品信息中没有商品、无法在本地判断时返回 None
+    """
+    facts = parse_product_information(product_information)
+    if not facts:
+        return None
+    text = normalize(answer)
+    mentioned = sum(1 for name, _ in facts if normalize(name) in text)
+    name_score = min(1.0, mentioned / min(len(facts), NAMES_FOR_FULL_SCORE))
+
+    prices = extract_prices(answer)
+    if prices:
+        # 以分为单位比较，避免浮点误差
+        known = {round(price * 100) for _, price in facts if price is not None}
+        price_score = sum(1 for price in prices if _is_known_price(round(price * 100), known)) / len(prices)
+    else:
+        # 没有可核对的事实，本地无法判断回答是否正确
+        price_score = 0.0
+    return NAME_WEIGHT * name_score + PRICE_WEIGHT * price_score
+
+
+class EvaluationPolicy:
+    """
+    参数:
+        llm_grader: 模型评估函数 (user_input, answer) -> bool
+        mode: always、sampled 或 local
+        sample_rate: sampled 模式下交给模型评估的比例
+        threshold: local 模式下本地得分达到该值即通过，否则交给模型评估；应大于 NAME_WEIGHT
+        log_every: 每评估多少个回答把汇总指标写入一次日志，0 表示不写
+        seed: 抽样的随机种子
+    """
+
+    def __init__(self, llm_grader, mode="always", sample_rate=0.1, threshold=0.7, log_every=50, seed=None):
+        if mode not in MODES:
+            raise ValueError(f"未知的评估模式：{mode}，可选 {MODES}")
+        if mode == "local" and threshold <= NAME_WEIGHT:
+            logger.warning("threshold=%s 不大于 NAME_WEIGHT=%s，只提到商品名、没有可核对价格的回答也会在本地通过",
+                           threshold, NAME_WEIGHT)
+        self.llm_grader = llm_grader
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.log_every = log_every
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {}   # (评估方式, 是否通过) → 次数
+        self._total = 0
+
+    def evaluate(self, user_input, answer, product_information=""):
+        """
+        参数:
+            user_input: 用户输入
+            answer: 模型的回答
+            product_information: 生成回答时提供的商品信息，local 模式据此打分
+        返回:
+            {'passed': 是否通过, 'method': llm、local 或 skipped, 'score': 本地得分（未计算时为 None）}
+        """
+        score = None
+        if self.mode == "sampled":
+            with self._lock:
+                sampled = self._random.random() < self.sample_rate
+            method = LLM if sampled else SKIPPED
+        elif self.mode == "local":
+            score = local_score(answer, product_information)
+            method = LOCAL if score is not None and score >= self.threshold else LLM
+        else:
+            method = LLM
+        passed = bool(self.llm_grader(user_input, answer)) if method == LLM else True
+        self._record(method, passed)
+        return {'passed': passed, 'method': method, 'score': score}
+
+    def _record(self, method, passed):
+        with self._lock:
+            key = (method, passed)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._total += 1
+            report = self.log_every and self._total % self.log_every == 0
+        if report:
+            stats = self.stats()
+            logger.info("回答评估（%s）：%d 个回答，模型评估 %d 次（%.0f%%），通过率 %.1f%%，模型评估通过率 %.1f%%",
+                        self.mode, stats['evaluated'], stats['llm_calls'], stats['llm_call_rate'] * 100,
+                        stats['pass_rate'] * 100, stats['llm_pass_rate'] * 100)
+
+    def stats(self):
+        """
+        返回:
+            evaluated: 评估的回答数
+            llm_calls: 模型评估次数，llm_call_rate 为其占比
+            local_passed: 本地打分直接通过的次数
+            skipped: 抽样未抽中的次数
+            pass_rate: 实际评估过（模型或本地）的回答的通过率
+            llm_pass_rate: 模型评估的通过率
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            total = self._total
+        llm_passed = counts.get((LLM, True), 0)
+        llm_calls = llm_passed + counts.get((LLM, False), 0)
+        local_passed = counts.get((LOCAL, True), 0)
+        graded = llm_calls + local_passed
+        return {
+            'mode': self.mode,
+            'evaluated': total,
+            'llm_calls': llm_calls,
+            'llm_call_rate': llm_calls / total if total else 0.0,
+            'local_passed': local_passed,
+            'skipped': counts.get((SKIPPED, True), 0),
+            'pass_rate': (llm_passed + local_passed) / graded if graded else 0.0,
+            'llm_pass_rate': llm_passed / llm_calls if llm_calls else 0.0,
+        }
@@ -0,0 +1,188 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 20:10
+@Version: v1.0
+@Description: 带索引的商品目录
+    products.json 只加载一次，建立按名称、规范化名称、类别的字典索引（O(1) 查找），
+    并预先计算 类别 → 商品名称列表，直接作为 find_category_and_product_only 的允许商品。
+    商品记录使用 __slots__，类别、品牌等重复字符串驻留（intern）共享，百万级商品目录的内存也是有界的。
+    每个商品的紧凑序列化（用于拼接到提示词中）在第一次使用时生成并缓存在记录上。
+"""
+import json
+import sys
+import unicodedata
+
+# 与 products.json 中字段的顺序一致，to_dict 按此顺序输出
+FIELDS = ("name", "category", "brand", "model_number", "warranty", "rating", "features", "description", "price")
+
+# 紧凑序列化的格式：json 为去掉缩进和空格的 JSON，table 为 "字段:值" 以 | 分隔的单行表格，
+# 值中的反斜杠、| 和换行以反斜杠转义，见 escape_table_value、parse_table
+SERIALIZATION_FORMATS = ("json", "table")
+
+# 取值重复度高的字段，驻留后所有商品共享同一个字符串对象
+_INTERNED = ("category", "brand", "warranty")
+
+
+def normalize_name(name):
+    """规范化名称：NFKC（全角转半角等）、忽略大小写、去掉所有空白，"smartx pro phone" 与 "SmartX ProPhone" 相同"""
+    return "".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def escape_table_value(value):
+    """table 格式中的值：反斜杠、| 和换行前加反斜杠，值中的 | 不会被当作字段分隔符"""
+    return str(value).replace("\\", "\\\\").replace("|", "\\|").replace("\n", "\\n")
+
+
+def parse_table(line):
+    """
+    解析 serialize("table") 生成的一行
+    返回:
+        字段 → 值（字符串）的字典
+    """
+    fields = []
+    current = []
+    chars = iter(line)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            current.append("\n" if escaped == "n" else escaped)
+        elif char == "|":
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    fields.append("".join(current))
+    return dict(field.split(":", 1) for field in fields if ":" in field)
+
+
+class Product:
+    __slots__ = FIELDS + ("_json", "_table")
+
+    def __init__(self, name, category, brand=None, model_number=None, warranty=None, rating=None, features=(),
+                 description=None, price=None):
+        self.name = name
+        self.category = category
+        self.brand = brand
+        self.model_number = model_number
+        self.warranty = warranty
+        self.rating = rating
+        self.features = features
+        self.description = description
+        self.price = price
+        self._json = None
+        self._table = None
+
+    @classmethod
+    def from_dict(cls, data):
+        values = {field: data.get(field) for field in FIELDS}
+        for field in _INTERNED:
+            if isinstance(values[field], str):
+                values[field] = sys.intern(values[field])
+        values['features'] = tuple(values['features'] or ())
+        return cls(**values)
+
+    def to_dict(self):
+        """转换为与 products.json 相同结构的字典"""
+        data = {field: getattr(self, field) for field in FIELDS}
+        data['features'] = list(self.features)
+        return data
+
+    def serialize(self, fmt="json"):
+        """
+        返回商品的紧凑序列化文本（缓存），比 json.dumps(indent=4) 节省大量提示词 token
+        参数:
+            fmt: json 或 table
+        """
+        if fmt == "json":
+            if self._json is None:
+                self._json = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+            return self._json
+        if fmt == "table":
+            if self._table is None:
+                values = self.to_dict()
+                values['features'] = ",".join(self.features)
+                self._table = "|".join(f"{field}:{escape_table_value(value)}"
+                                       for field, value in values.items() if value is not None)
+            return self._table
+        raise ValueError(f"未知的序列化格式：{fmt}，可选 {SERIALIZATION_FORMATS}")
+
+    def __repr__(self):
+        return f"Product({self.name!r}, {self.category!r})"
+
+
+class Catalog:
+    """
+    商品目录
+    参数:
+        products: 商品字典或 Product 的可迭代对象
+        version: 目录的版本号，下游缓存以此作为键的一部分
+    """
+
+    def __init__(self, products=(), version=0):
+        self.version = version
+        self.products = []
+        self._by_name = {}
+        self._by_normalized = {}
+        self._by_category = {}
+        self._by_normalized_category = {}
+        self.category_names = {}
+        for product in products:
+            self.add(product if isinstance(product, Product) else Product.from_dict(product))
+
+    @classmethod
+    def from_json(cls, path, version=0):
+        with open(path, "r", encoding="utf-8") as file:
+            raw = json.load(file)
+        catalog = cls(version=version)
+        # 边转换边释放原始字典，峰值内存不会同时持有两份完整的目录
+        for index, item in enumerate(raw):
+            catalog.add(Product.from_dict(item))
+            raw[index] = None
+        return catalog
+
+    def add(self, product):
+        self.products.append(product)
+        self._by_name[product.name] = product
+        self._by_normalized.setdefault(normalize_name(product.name), product)
+        category = product.category
+        if category not in self._by_category:
+            self._by_category[category] = []
+            self._by_normalized_category[normalize_name(category)] = category
+            self.category_names[category] = []
+        self._by_category[category].append(product)
+        self.category_names[category].append(product.name)
+
+    def get(self, name):
+        """按名称查找商品，精确匹配失败时按规范化名称匹配，找不到返回 None"""
+        product = self._by_name.get(name)
+        if product is None and isinstance(name, str):
+            product = self._by_normalized.get(normalize_name(name))
+        return product
+
+    def by_category(self, category, limit=None):
+        """返回类别下的商品（limit 为 None 时返回全部），类别名称同样支持规范化匹配"""
+        products = self._by_category.get(category)
+        if products is None and isinstance(category, str):
+            products = self._by_category.get(self._by_normalized_category.get(normalize_name(category)))
+        if not products:
+            return []
+        return products if limit is None else products[:limit]
+
+    def categories(self):
+        return list(self._by_category)
+
+    def category_sample(self, category, limit):
+        """类别下前 limit 个商品的名称"""
+        return self.category_names.get(category, [])[:limit]
+
+    def __getitem__(self, index):
+        return self.products[index]
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
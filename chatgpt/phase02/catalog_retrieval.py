@@ -0,0 +1,144 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 21:50
+@Version: v1.0
+@Description: 商品目录的检索预筛选
+    find_category_and_product_only 把整个 类别 → 商品名称 字典写进系统提示词，提示词的 token 数、
+    延迟和费用都随目录规模线性增长。目录只需建立一次词法索引，每次查询只把最相关的 top-N 个
+    候选商品及其类别放进提示词，目录从 30 个商品增长到 10 万个时提示词大小基本不变。
+    检索方法：
+        1. 商品名、品牌、型号规范化后切分为字符三元组（中文额外切分二元组），建立倒排索引
+        2. 查询同样切分，按 BM25 给商品打分（词项在字段中只计一次），numpy 向量化累加
+        3. 查询中出现的类别名或中文别名（"电脑"、"手机"）直接选中该类别，附带该类别的若干商品作为示例
+    没有任何命中时返回每个类别的若干示例商品，由模型判断是否提到了类别。
+"""
+import math
+from array import array
+
+import numpy as np
+
+from chatgpt.phase02.product_matcher import CATEGORY_ALIASES, normalize
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+def _is_ascii(char):
+    return char < "\x80"
+
+
+def terms(text):
+    """规范化文本的检索词项：字符三元组，以及由非 ASCII 字符（中文）组成的二元组"""
+    grams = {text[i:i + 3] for i in range(len(text) - 2)}
+    grams.update(text[i:i + 2] for i in range(len(text) - 1)
+                 if not _is_ascii(text[i]) and not _is_ascii(text[i + 1]))
+    if not grams and text:
+        # 过短的字段（如两个字母的品牌）整体作为一个词项
+        grams.add(text)
+    return grams
+
+
+class CatalogRetriever:
+    """
+    参数:
+        catalog: chatgpt.phase02.catalog.Catalog
+        category_aliases: 类别 → 别名列表，默认 CATEGORY_ALIASES
+    """
+
+    def __init__(self, catalog, category_aliases=None):
+        self.catalog = catalog
+        # 只保存下标，命中时再向目录取商品，内存映射的目录不必在每个进程中物化全部商品
+        self._count = len(catalog)
+        postings = {}
+        lengths = array("I")
+        for index, product in enumerate(catalog):
+            doc = set()
+            for field in (product.name, product.brand, product.model_number):
+                if field:
+                    doc |= terms(normalize(field))
+            lengths.append(len(doc))
+            for term in doc:
+                posting = postings.get(term)
+                if posting is None:
+                    posting = postings[term] = array("I")
+                posting.append(index)
+
+        count = self._count
+        lengths = np.frombuffer(lengths, dtype=np.uint32).astype(np.float32) if count else np.zeros(0, np.float32)
+        average = float(lengths.mean()) if count else 1.0
+        # 词项在商品中只计一次（tf = 1），BM25 的长度归一化部分可以对每个商品预先算好
+        self._norms = ((K1 + 1) / (1 + K1 * (1 - B + B * lengths / max(average, 1.0)))).astype(np.float32)
+        self._postings = {term: (np.frombuffer(ids, dtype=np.uint32),
+                                 math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5)))
+                          for term, ids in postings.items()}
+
+        self._index_categories(category_aliases)
+
+    def _index_categories(self, category_aliases):
+        aliases = CATEGORY_ALIASES if category_aliases is None else category_aliases
+        self._category_keys = []
+        for category in self.catalog.categories():
+            keys = {normalize(alias) for alias in [category] + list(aliases.get(category, ()))}
+            self._category_keys.append((category, [key for key in keys if len(key) >= 2]))
+
+    def __len__(self):
+        return self._count
+
+    def search(self, query, top_n=20):
+        """
+        参数:
+            query: 用户输入
+            top_n: 最多返回的商品数
+        返回:
+            按 BM25 得分降序的 [(Product, 得分)]，只包含得分大于 0 的商品
+        """
+        if not self._count or top_n <= 0:
+            return []
+        scores = None
+        for term in terms(normalize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            ids, idf = entry
+            if scores is None:
+                scores = np.zeros(self._count, dtype=np.float32)
+            # 同一词项的倒排表中商品不重复，可以直接用花式索引累加
+            scores[ids] += idf * self._norms[ids]
+        if scores is None:
+            return []
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_n:
+            hits = hits[np.argpartition(scores[hits], -top_n)[-top_n:]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.catalog[int(i)], float(scores[i])) for i in hits]
+
+    def match_categories(self, query):
+        """返回查询中直接提到的类别（类别名或别名是查询的子串）"""
+        text = normalize(query)
+        return [category for category, keys in self._category_keys if any(key in text for key in keys)]
+
+    def candidates(self, query, top_n=20, per_category=5):
+        """
+        为 find_category_and_product_only 生成精简的允许商品
+        参数:
+            query: 用户输入
+            top_n: 检索的商品数
+            per_category: 查询提到类别时（或没有任何命中时）每个类别附带的示例商品数
+        返回:
+            类别 → 商品名称列表 的字典，结构与 Catalog.category_names 相同
+        """
+        if self._count <= top_n:
+            # 目录本身不超过 top_n 个商品，没有必要筛选
+            return self.catalog.category_names
+        result = {}
+        for category in self.match_categories(query):
+            result[category] = self.catalog.category_sample(category, per_category)
+        for product, _ in self.search(query, top_n):
+            names = result.setdefault(product.category, [])
+            if product.name not in names:
+                names.append(product.name)
+        if not result:
+            for category in self.catalog.categories()[:top_n]:
+                result[category] = self.catalog.category_sample(category, per_category)
+        return result
@@ -0,0 +1,390 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 23:40
+@Version: v1.0
+@Description: 内存映射的商品目录快照与热更新
+    原来 products.json 在进程内只解析一次，目录更新需要重启，每个工作进程还各自持有一份解析后的目录。
+    快照是一个紧凑的二进制文件，通过 mmap 只读映射：
+        1. 多个工作进程映射同一个快照文件，共享操作系统的页缓存，不必各自解析 JSON、持有全部商品对象
+        2. 按名称查找在快照内的有序索引上二分查找，按类别查找读取连续的下标区间，商品在访问时才解码
+        3. 快照头记录源文件的修改时间和大小，以及单调递增的版本号，共享快照的进程看到的版本号一致
+    ReloadableCatalog 按 stat 轮询源文件（可在访问时顺带检查，也可以启动后台线程），发现变化后
+    重新生成快照，以一次引用赋值原子地切换到新版本，并通知订阅者；正在使用旧版本的请求不受影响。
+    快照的内容会原样进入提示词，ReloadableCatalog 只映射当前用户所有、其他用户不可写的快照，
+    否则在内存中加载 products.json。
+
+    快照文件布局（小端）：
+        头部    MAGIC、版本号、源文件 mtime_ns、源文件大小、商品数、各段的偏移
+        records 每个商品的紧凑 JSON（与 Product.serialize("json") 相同），record_offsets 为 count + 1 个 u64
+        names   规范化名称按 UTF-8 字节排序后的 (名称, 商品下标) 索引，name_offsets 为 count + 1 个 u64
+        category_ids    按类别分组的商品下标（u32）
+        categories      类别列表的 JSON（[类别, 起始, 结束]，起止为 category_ids 中的位置），以 u32 长度开头
+    各段按 8 字节对齐。
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from functools import lru_cache
+
+from chatgpt.phase02.catalog import Catalog, Product, normalize_name
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PCSNAP01"
+# 版本号、源 mtime_ns、源大小、商品数，records、record_offsets、names、name_offsets、name_ids、category_ids、
+# categories 各段的偏移
+_HEADER = struct.Struct("<8sQqQI7Q")
+
+# 每个快照目录缓存的已解码商品数
+DECODED_CACHE_SIZE = 4096
+
+# 与 Product.serialize("json") 输出相同；复用同一个编码器，省去 json.dumps 每次构造编码器的开销
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _pack(typecode, values):
+    packed = values if isinstance(values, array) else array(typecode, values)
+    if sys.byteorder == "big":
+        packed = array(typecode, packed)
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def write_snapshot(catalog, path, version, source_signature=(0, 0)):
+    """
+    把目录写成快照文件：先写入同目录下的临时文件，再用 os.replace 原子替换，读者不会看到写了一半的文件
+    参数:
+        catalog: Catalog 或任意可迭代的 Product
+        path: 快照路径
+        version: 写入快照头的版本号
+        source_signature: 源文件的 (mtime_ns, size)，用于判断快照是否过期
+    """
+    products = list(catalog)
+    names = sorted(((normalize_name(product.name).encode("utf-8"), index) for index, product in enumerate(products)))
+    groups = {}
+    for index, product in enumerate(products):
+        groups.setdefault(product.category, []).append(index)
+    category_ids, category_table = [], []
+    for category, ids in groups.items():
+        category_table.append([category, len(category_ids), len(category_ids) + len(ids)])
+        category_ids.extend(ids)
+    category_json = json.dumps(category_table, ensure_ascii=False).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(b"\0" * _HEADER.size)
+            offsets = []
+
+            def section(chunks):
+                # 各段按 8 字节对齐，偏移表可以直接 cast 为 u64 数组
+                file.write(b"\0" * (-file.tell() % 8))
+                offsets.append(file.tell())
+                for chunk in chunks:
+                    file.write(chunk)
+
+            def offset_table(blobs, table):
+                # 边写入边记录偏移，不必同时持有全部记录
+                for blob in blobs:
+                    table.append(table[-1] + len(blob))
+                    yield blob
+
+            record_offsets, name_offsets = array("Q", [0]), array("Q", [0])
+            section(offset_table((_ENCODER.encode(product.to_dict()).encode("utf-8") for product in products),
+                                 record_offsets))
+            section([_pack("Q", record_offsets)])
+            section(offset_table((name for name, _ in names), name_offsets))
+            section([_pack("Q", name_offsets)])
+            section([_pack("I", (index for _, index in names))])
+            section([_pack("I", category_ids)])
+            section([struct.pack("<I", len(category_json)), category_json])
+            file.seek(0)
+            file.write(_HEADER.pack(MAGIC, version, source_signature[0], source_signature[1], len(products), *offsets))
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp 创建的文件只有属主可读；快照不含敏感信息，放开读权限，写权限仍只属于属主
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_snapshot_header(path):
+    """返回快照头 {'version', 'source_signature', 'count'}，文件不存在或不是快照时返回 None"""
+    try:
+        with open(path, "rb") as file:
+            header = file.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _HEADER.size or header[:8] != MAGIC:
+        return None
+    _, version, mtime_ns, size, count, *_ = _HEADER.unpack(header)
+    return {'version': version, 'source_signature': (mtime_ns, size), 'count': count}
+
+
+def _check_owner(stat, path):
+    """快照须属于当前用户且其他用户不可写，否则其他用户可以替换商品信息，抛出 PermissionError"""
+    geteuid = getattr(os, "geteuid", None)
+    if geteuid is not None and stat.st_uid != geteuid():
+        raise PermissionError(f"快照 {path} 不属于当前用户")
+    if stat.st_mode & 0o022:
+        raise PermissionError(f"快照 {path} 可被其他用户写入")
+
+
+class SnapshotCatalog:
+    """
+    只读映射快照文件的商品目录，接口与 Catalog 相同（get、by_category、categories、category_names 等）
+    参数:
+        path: write_snapshot 生成的快照路径
+        verify_owner: 是否在映射前检查文件属主和权限，见 _check_owner
+    """
+
+    def __init__(self, path, verify_owner=False):
+        self.path = path
+        with open(path, "rb") as file:
+            # 检查已经打开的文件，而不是路径，检查之后路径被替换也不影响映射的内容
+            if verify_owner:
+                _check_owner(os.fstat(file.fileno()), path)
+            # 映射建立后即使快照被新版本替换，这里仍然读取旧的 inode，直到对象被回收
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, mtime_ns, size, self._count, records, record_offsets, names, name_offsets, name_ids,
+         category_ids, categories) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是商品目录快照")
+        self.source_signature = (mtime_ns, size)
+        view = memoryview(self._map)
+        count = self._count
+        self._records = records
+        self._record_offsets = view[record_offsets:record_offsets + 8 * (count + 1)].cast("Q")
+        self._names = names
+        self._name_offsets = view[name_offsets:name_offsets + 8 * (count + 1)].cast("Q")
+        self._name_ids = view[name_ids:name_ids + 4 * count].cast("I")
+        (length,) = struct.unpack_from("<I", self._map, categories)
+        table = json.loads(self._map[categories + 4:categories + 4 + length].decode("utf-8"))
+        self._category_ids = view[category_ids:category_ids + 4 * count].cast("I")
+        self._categories = {category: (start, end) for category, start, end in table}
+        self._normalized_categories = {normalize_name(category): category for category in self._categories}
+        self._category_names = None
+        self._product = lru_cache(maxsize=DECODED_CACHE_SIZE)(self._decode)
+
+    def _decode(self, index):
+        start = self._records + self._record_offsets[index]
+        end = self._records + self._record_offsets[index + 1]
+        record = self._map[start:end].decode("utf-8")
+        product = Product.from_dict(json.loads(record))
+        # 快照中的记录就是紧凑 JSON，序列化时直接复用
+        product._json = record
+        return product
+
+    def _normalized_name(self, position):
+        start = self._names + self._name_offsets[position]
+        return self._map[start:self._names + self._name_offsets[position + 1]]
+
+    def get(self, name):
+        """按名称查找商品：规范化名称二分查找，同名时优先名称完全相同的商品，找不到返回 None"""
+        if not isinstance(name, str):
+            return None
+        key = normalize_name(name).encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._normalized_name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        first = None
+        while low < self._count and self._normalized_name(low) == key:
+            product = self._product(self._name_ids[low])
+            if product.name == name:
+                return product
+            if first is None:
+                first = product
+            low += 1
+        return first
+
+    def by_category(self, category, limit=None):
+        start, end = self._category_range(category)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self._product(self._category_ids[i]) for i in range(start, end)]
+
+    def _category_range(self, category):
+        bounds = self._categories.get(category)
+        if bounds is None and isinstance(category, str):
+            bounds = self._categories.get(self._normalized_categories.get(normalize_name(category)))
+        return bounds or (0, 0)
+
+    def categories(self):
+        return list(self._categories)
+
+    def category_sample(self, category, limit):
+        start, end = self._category_range(category)
+        return [self._product(self._category_ids[i]).name for i in range(start, min(end, start + limit))]
+
+    @property
+    def category_names(self):
+        """类别 → 商品名称列表，首次访问时解码全部商品名称；大目录请使用 category_sample 或检索"""
+        if self._category_names is None:
+            self._category_names = {category: self.category_sample(category, end - start)
+                                    for category, (start, end) in self._categories.items()}
+        return self._category_names
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._product(index)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # 顺序遍历不经过缓存，避免把大目录逐出缓存中的热点商品
+        return (self._decode(index) for index in range(self._count))
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+class ReloadableCatalog:
+    """
+    可热更新的商品目录
+    参数:
+        source: products.json 的路径
+        snapshot_path: 快照路径，多个工作进程使用同一路径即可共享，应位于只有当前用户可写的目录；
+            None 表示不使用快照，直接在内存中解析 JSON
+        poll_interval: 访问时最多每隔多少秒检查一次源文件
+    """
+
+    def __init__(self, source, snapshot_path=None, poll_interval=2.0):
+        self.source = source
+        self.snapshot_path = snapshot_path
+        self.poll_interval = poll_interval
+        self._state = None          # (目录, 源文件签名)，整体替换
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+        self._subscribers = []
+        self._watcher = None
+        self._stopped = threading.Event()
+
+    def current(self):
+        """返回当前版本的目录；距上次检查超过 poll_interval 时顺带检查源文件是否变化"""
+        if self._state is None:
+            self.reload()
+        elif time.monotonic() - self._checked_at >= self.poll_interval:
+            # 只有一个线程负责重新加载，其余线程继续使用旧版本
+            if self._reload_lock.acquire(blocking=False):
+                try:
+                    self._reload_locked()
+                finally:
+                    self._reload_lock.release()
+        return self._state[0]
+
+    @property
+    def version(self):
+        return self.current().version
+
+    def reload(self, force=False):
+        """
+        检查源文件，变化时加载新版本
+        参数:
+            force: 为 True 时即使源文件没有变化也重新加载
+        返回:
+            是否切换到了新版本
+        """
+        with self._reload_lock:
+            return self._reload_locked(force)
+
+    def _reload_locked(self, force=False):
+        self._checked_at = time.monotonic()
+        try:
+            signature = _source_signature(self.source)
+        except OSError:
+            if self._state is None:
+                raise
+            logger.warning("无法读取商品目录 %s，继续使用版本 %d", self.source, self._state[0].version, exc_info=True)
+            return False
+        if self._state is not None and self._state[1] == signature and not force:
+            return False
+        previous = self._state[0].version if self._state is not None else 0
+        try:
+            catalog = self._load(signature, previous, force)
+        except Exception:
+            if self._state is None:
+                raise
+            logger.warning("加载商品目录 %s 失败，继续使用版本 %d", self.source, previous, exc_info=True)
+            return False
+        # 一次赋值完成切换，读者要么拿到旧版本，要么拿到新版本
+        self._state = (catalog, signature)
+        logger.info("商品目录切换到版本 %d（%d 个商品）", catalog.version, len(catalog))
+        for callback in list(self._subscribers):
+            try:
+                callback(catalog)
+            except Exception:
+                logger.warning("商品目录变更通知失败", exc_info=True)
+        return True
+
+    def _load(self, signature, previous, force):
+        if self.snapshot_path is None:
+            return Catalog.from_json(self.source, version=previous + 1)
+        header = read_snapshot_header(self.snapshot_path)
+        if header is not None and header['source_signature'] == signature and not force:
+            # 其他进程已经为同一份源文件生成了快照，直接映射
+            return self._map_snapshot(previous + 1)
+        version = max(previous, header['version'] if header else 0) + 1
+        try:
+            write_snapshot(Catalog.from_json(self.source), self.snapshot_path, version, signature)
+        except OSError:
+            logger.warning("无法写入快照 %s，在内存中加载商品目录", self.snapshot_path, exc_info=True)
+            return Catalog.from_json(self.source, version=version)
+        return self._map_snapshot(version)
+
+    def _map_snapshot(self, version):
+        """映射快照；快照不属于当前用户或可被其他用户写入时不信任其内容，在内存中加载源文件"""
+        try:
+            return SnapshotCatalog(self.snapshot_path, verify_owner=True)
+        except PermissionError:
+            logger.warning("快照 %s 不可信，在内存中加载商品目录", self.snapshot_path, exc_info=True)
+            return Catalog.from_json(self.source, version=version)
+
+    def subscribe(self, callback):
+        """注册变更通知：切换到新版本后以新目录为参数调用 callback"""
+        self._subscribers.append(callback)
+
+    def watch(self, interval=None):
+        """启动后台线程按 interval（默认 poll_interval）秒轮询源文件，不依赖请求触发检查"""
+        if self._watcher is not None:
+            return
+        interval = interval or self.poll_interval
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    logger.warning("商品目录轮询失败", exc_info=True)
+
+        self._watcher = threading.Thread(target=run, name="catalog_watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """停止后台轮询线程"""
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
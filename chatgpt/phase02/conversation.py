@@ -0,0 +1,199 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 23:10
+@Version: v1.0
+@Description: 多轮对话的滚动状态
+    process_user_message_ch 原来每轮都执行 histories + messages 并返回新的列表，整段会话的复制开销是 O(n²)，
+    历史也会无限增长。ConversationState 用双端队列保存消息：
+        1. 追加消息是均摊 O(1)，每条消息的 token 数在追加时计算一次，并维护总数
+        2. 窗口有界：超过 max_tokens 或 max_messages 时从最早的消息开始淘汰（至少保留最近 min_messages 条）
+        3. 可选的后台摘要：被淘汰的消息在线程池中增量合并进摘要，不阻塞当前轮的回答，
+           摘要与 tool.fit_messages_to_budget 共用 tool.summarize_messages
+        4. 紧凑序列化：to_bytes 为 zlib 压缩的 JSON，会话可以暂存到磁盘或缓存，之后用 from_bytes 恢复
+    传给 process_user_message_ch 时由 ConversationState 负责历史的 token 预算，不再按 PROMPT_BUDGET 裁剪历史。
+    用法:
+        conversation = ConversationState(max_tokens=3000, summarize=True)
+        response, conversation = process_user_message_ch(user_input, conversation)
+        data = conversation.to_bytes()
+        conversation = ConversationState.from_bytes(data)
+"""
+import json
+import logging
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from chatgpt import metrics
+from chatgpt.token_count import TOKENS_PER_MESSAGE, count_text_tokens
+from chatgpt.tool import summarize_messages
+
+logger = logging.getLogger(__name__)
+
+# 序列化格式的版本号
+FORMAT_VERSION = 1
+
+# 所有会话共用的摘要线程池，没有摘要任务时不会创建线程
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation_summary")
+
+
+class ConversationState:
+    """
+    参数:
+        max_tokens: 窗口内消息的 token 上限，None 表示不限制
+        max_messages: 窗口内消息的条数上限，None 表示不限制
+        min_messages: 淘汰时至少保留的最近消息数
+        summarize: 是否在后台为被淘汰的消息生成摘要
+        model: 用于 token 计数和生成摘要的模型
+    """
+
+    def __init__(self, max_tokens=None, max_messages=None, min_messages=2, summarize=False, model="gpt-4o-mini"):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.min_messages = min_messages
+        self.summarize = summarize
+        self.model = model
+        self.summary = None
+        self.evicted = 0
+        self._messages = deque()
+        self._tokens = deque()
+        self._total = 0
+        self._pending = []          # 已淘汰、尚未合并进摘要的消息
+        self._inflight = []         # 正在合并进摘要的消息
+        self._future = None
+        self._lock = threading.Lock()
+
+    def _count(self, content):
+        return TOKENS_PER_MESSAGE + count_text_tokens(content or "", self.model)
+
+    def append(self, message):
+        """追加一条消息（{'role', 'content'} 字典），超出窗口时淘汰最早的消息"""
+        self.extend((message,))
+
+    def extend(self, messages):
+        """追加多条消息"""
+        with self._lock:
+            for message in messages:
+                message = {'role': message['role'], 'content': message.get('content')}
+                tokens = self._count(message['content'])
+                self._messages.append(message)
+                self._tokens.append(tokens)
+                self._total += tokens
+            self._evict()
+
+    def _evict(self):
+        evicted = []
+        while len(self._messages) > self.min_messages and (
+                (self.max_tokens is not None and self._total > self.max_tokens)
+                or (self.max_messages is not None and len(self._messages) > self.max_messages)):
+            evicted.append(self._messages.popleft())
+            self._total -= self._tokens.popleft()
+        if not evicted:
+            return
+        self.evicted += len(evicted)
+        if self.summarize:
+            self._pending.extend(evicted)
+            self._schedule_summary()
+
+    def _schedule_summary(self):
+        # 调用方持有 self._lock；同一会话同时只有一个摘要任务，任务结束前新淘汰的消息会在同一任务中继续合并
+        if self._future is None and self._pending:
+            self._inflight, self._pending = self._pending, []
+            self._future = _summary_executor.submit(self._run_summary, self._inflight)
+
+    def _run_summary(self, batch):
+        while True:
+            summary = self._summarize(self.summary, batch)
+            with self._lock:
+                if summary:
+                    self.summary = summary
+                if not self._pending:
+                    self._inflight = []
+                    self._future = None
+                    return
+                batch = self._inflight = self._pending
+                self._pending = []
+
+    def _summarize(self, previous, batch):
+        """把新淘汰的消息合并进已有摘要，失败时返回 None（保留原摘要，丢弃这批消息）"""
+        try:
+            with metrics.call_site_scope("conversation_summary"):
+                return summarize_messages(batch, self.model, previous)
+        except Exception:
+            logger.warning("会话摘要失败，丢弃 %d 条较早的消息", len(batch), exc_info=True)
+            return None
+
+    def wait_for_summary(self, timeout=None):
+        """等待后台摘要完成"""
+        future = self._future
+        if future is not None:
+            # 任务会在返回前合并期间新淘汰的消息
+            future.exception(timeout)
+
+    def messages(self):
+        """
+        返回:
+            发送给模型的消息列表：有摘要时以一条 system 消息开头，其后为窗口内的消息
+        """
+        with self._lock:
+            window = list(self._messages)
+            summary = self.summary
+        if summary:
+            window.insert(0, {'role': 'system', 'content': f"此前对话的摘要：{summary}"})
+        return window
+
+    @property
+    def total_tokens(self):
+        """窗口内消息的 token 总数（不含摘要）"""
+        return self._total
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __bool__(self):
+        return bool(self._messages) or bool(self.summary)
+
+    def __iter__(self):
+        return iter(self.messages())
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'version': FORMAT_VERSION,
+                'max_tokens': self.max_tokens,
+                'max_messages': self.max_messages,
+                'min_messages': self.min_messages,
+                'summarize': self.summarize,
+                'model': self.model,
+                'summary': self.summary,
+                'evicted': self.evicted,
+                # 消息存为 [role, content, tokens]，恢复时不必重新计数
+                'messages': [[m['role'], m['content'], t] for m, t in zip(self._messages, self._tokens)],
+                'pending': [[m['role'], m['content']] for m in self._inflight + self._pending],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"不支持的会话格式版本：{data.get('version')}")
+        state = cls(data['max_tokens'], data['max_messages'], data['min_messages'], data['summarize'], data['model'])
+        state.summary = data['summary']
+        state.evicted = data['evicted']
+        for role, content, tokens in data['messages']:
+            state._messages.append({'role': role, 'content': content})
+            state._tokens.append(tokens)
+            state._total += tokens
+        with state._lock:
+            state._pending = [{'role': role, 'content': content} for role, content in data['pending']]
+            state._schedule_summary()
+        return state
+
+    def to_bytes(self, level=6):
+        """序列化为 zlib 压缩的 JSON；不等待正在进行的摘要，尚未合并进摘要的消息随状态一起保存，恢复后重新摘要"""
+        text = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+        return zlib.compress(text.encode("utf-8"), level)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """从 to_bytes 的结果恢复会话"""
+        return cls.from_dict(json.loads(zlib.decompress(data).decode("utf-8")))
@@ -4,7 +4,10 @@
 @Version: v1.0
 @Description: 处理输入
 """
-from chatgpt.tool import get_completion_from_messages
+import re
+import time
+
+from chatgpt.tool import get_completion_from_messages, stream_completion_from_messages
 
 result = "AI未运行"
 
@@ -94,6 +97,129 @@ messages = [
 
 # result = get_completion_from_messages(messages)
 
+
+# ------------------------ 流式提取回复客户的内容 ----------------------
+'''
+思维链的推理步骤只是内部过程，不应展示给用户。如果等模型生成完整回答再截取"回复客户"部分，
+用户要等待全部推理步骤生成完毕。流式消费时，推理步骤边生成边丢弃，一旦出现"回复客户: ===="，
+立即把后续内容推送给用户。
+'''
+_REPLY_MARKER = re.compile(r"回复客户\s*[:：]")
+
+
+class CustomerReplyExtractor:
+    """
+    增量解析思维链输出：feed 每个内容增量，返回其中应展示给用户的部分（回复客户之前的内容返回空串）
+    参数:
+        delimiter: 步骤与推理之间的分隔符
+    """
+
+    def __init__(self, delimiter="===="):
+        self.delimiter = delimiter
+        self.buffer = ""
+        self.reply_start = None  # 回复内容在 buffer 中的起始位置
+        self._scan_from = 0
+        self._emitted = False
+
+    def feed(self, delta):
+        self.buffer += delta
+        if self.reply_start is not None:
+            return self._emit(delta)
+        match = _REPLY_MARKER.search(self.buffer, self._scan_from)
+        if match is None:
+            # 标记可能被拆在两个增量之间，下次从末尾往前一点开始查找
+            self._scan_from = max(0, len(self.buffer) - 8)
+            return ""
+        rest = self.buffer[match.end():].lstrip()
+        if self.delimiter.startswith(rest):
+            # 分隔符还没有完整出现（可能只出现了一半），等待下一个增量
+            self._scan_from = match.start()
+            return ""
+        if rest.startswith(self.delimiter):
+            rest = rest[len(self.delimiter):]
+        self.reply_start = len(self.buffer) - len(rest)
+        return self._emit(rest)
+
+    def _emit(self, text):
+        # 跳过回复开头的空白
+        if not self._emitted:
+            text = text.lstrip()
+            self._emitted = bool(text)
+        return text
+
+    def finish(self):
+        """
+        流结束时调用：模型没有按格式输出"回复客户"时，与非流式写法一样取最后一个分隔符之后的内容
+        返回:
+            尚未返回给用户的内容
+        """
+        if self.reply_start is not None:
+            return ""
+        return self.buffer.split(self.delimiter)[-1].strip()
+
+    @property
+    def reasoning(self):
+        """被丢弃的推理步骤"""
+        return self.buffer if self.reply_start is None else self.buffer[:self.reply_start]
+
+    @property
+    def reply(self):
+        if self.reply_start is None:
+            return self.finish()
+        return self.buffer[self.reply_start:].strip()
+
+
+class CustomerReplyStream:
+    """
+    流式调用思维链 Prompt，只迭代出回复客户的内容
+    迭代结束后可以读取：
+        reply: 回复客户的完整内容
+        reasoning: 被丢弃的推理步骤
+        time_to_first_token: 收到模型第一个 token（推理步骤）的秒数
+        time_to_first_visible_token: 用户看到第一个字的秒数
+        latency: 总秒数
+    """
+
+    def __init__(self, messages, model="gpt-4o-mini", temperature=0, delimiter="===="):
+        self.stream = stream_completion_from_messages(messages, model, temperature)
+        self.extractor = CustomerReplyExtractor(delimiter)
+        self.time_to_first_visible_token = None
+        self.latency = None
+
+    def __iter__(self):
+        started = time.perf_counter()
+        for delta in self.stream:
+            visible = self.extractor.feed(delta)
+            if visible:
+                if self.time_to_first_visible_token is None:
+                    self.time_to_first_visible_token = time.perf_counter() - started
+                yield visible
+        tail = self.extractor.finish()
+        if tail:
+            if self.time_to_first_visible_token is None:
+                self.time_to_first_visible_token = time.perf_counter() - started
+            yield tail
+        self.latency = time.perf_counter() - started
+
+    @property
+    def reply(self):
+        return self.extractor.reply
+
+    @property
+    def reasoning(self):
+        return self.extractor.reasoning
+
+    @property
+    def time_to_first_token(self):
+        return self.stream.time_to_first_token
+
+
+# reply_stream = CustomerReplyStream(messages)
+# for delta in reply_stream:
+#     print(delta, end="", flush=True)
+# print(f"\n首 token 耗时：{reply_stream.time_to_first_token:.2f}s，"
+#       f"首个可见 token 耗时：{reply_stream.time_to_first_visible_token:.2f}s，总耗时：{reply_stream.latency:.2f}s")
+
 # ------------------------ 链式 ----------------------
 '''
 链式提示是将复杂任务分解为多个简单Prompt的策略。链式提示它具有以下优点：
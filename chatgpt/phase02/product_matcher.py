@@ -0,0 +1,259 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 20:45
+@Version: v1.0
+@Description: 本地商品/类别匹配
+    find_category_and_product_only 每次都要一次完整的模型调用，只为找出用户提到了目录中的哪些商品。
+    大多数提问直接写出了商品名、型号或类别，本地匹配即可得到相同结构的结果：
+        [{'category': 类别, 'products': [商品名, ...]}, {'category': 只提到类别时不带 products}]
+    匹配方法：
+        1. 规范化：NFKC（全角转半角）、忽略大小写、去掉空白和标点，"smartx pro phone" 与 "SmartX ProPhone" 相同，
+           同时记录原文中的词边界
+        2. 精确匹配：商品名、型号、品牌、类别名及中英文别名建立 "规范化文本 → 条目" 的哈希表，按模式长度枚举
+           用户输入的子串查表（模式长度种类有限，查询耗时与目录大小无关），重叠时取最长的匹配；
+           以英文字母或数字开头（结尾）的模式必须从词边界开始（在词边界结束），"phones" 落在 "earphones"、
+           "microphones" 这样更长的单词中间时视为不确定
+        3. 模糊匹配：商品名的字符三元组倒排索引，覆盖率足够高时视为提到了该商品（容忍拼写错误）
+    只有高置信度时才使用本地结果；没有任何匹配、品牌对应多个商品、模式落在单词中间、模糊匹配不够确定时返回 None，
+    由调用方回退到模型。
+    别名为 CATEGORY_ALIASES 中的全部类别注册（包括目录中暂时没有商品的类别），"headphones" 匹配音频设备，
+    不会因为包含 "phones" 被当成智能手机。
+"""
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+# 类别的中英文别名，与 find_category_and_product_only 提示词中的中文类别对应
+CATEGORY_ALIASES = {
+    "Computers and Laptops": ["电脑和笔记本", "电脑", "笔记本", "计算机", "computer", "computers", "laptop", "laptops"],
+    "Smartphones and Accessories": ["智能手机和配件", "智能手机", "手机", "smartphone", "smartphones", "phones"],
+    "Televisions and Home Theater Systems": ["电视和家庭影院系统", "电视", "家庭影院", "tvs", "television",
+                                             "televisions", "home theater"],
+    "Gaming Consoles and Accessories": ["游戏机和配件", "游戏机", "gaming console", "consoles"],
+    "Audio Equipment": ["音频设备", "耳机", "音箱", "audio", "headphones", "speakers"],
+    "Cameras and Camcorders": ["相机和摄像机", "相机", "摄像机", "cameras", "camcorder", "camcorders"],
+}
+
+# 由商品字段生成的模式至少包含的字符数，过短的名称容易误匹配
+MIN_PATTERN_LENGTH = 3
+STRONG_FUZZY = 0.85
+WEAK_FUZZY = 0.5
+# 出现在过多商品中的三元组区分度低，不参与模糊匹配
+MAX_POSTING = 5000
+
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+
+PRODUCT, BRAND, CATEGORY = "product", "brand", "category"
+
+
+def normalize(text):
+    """NFKC、忽略大小写、去掉空白和标点"""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+
+def normalize_words(text):
+    """
+    与 normalize 相同，同时返回原文中词边界（空白和标点）在规范化文本中的位置
+    返回:
+        (规范化文本, 词边界位置的集合)
+    """
+    parts = [part for part in _PUNCTUATION.split(unicodedata.normalize("NFKC", text).casefold()) if part]
+    boundaries, position = {0}, 0
+    for part in parts:
+        position += len(part)
+        boundaries.add(position)
+    return "".join(parts), boundaries
+
+
+def _is_word_char(char):
+    # 英文单词和数字之间没有空格就连在一起；中文与英文相邻处本身就是词边界
+    return char.isascii() and char.isalnum()
+
+
+def _at_boundary(text, boundaries, position):
+    return position in boundaries or not (_is_word_char(text[position - 1]) and _is_word_char(text[position]))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductMatcher:
+    """
+    参数:
+        catalog: chatgpt.phase02.catalog.Catalog
+        category_aliases: 类别 → 别名列表，默认 CATEGORY_ALIASES
+        fuzzy: 是否开启三元组模糊匹配
+    """
+
+    def __init__(self, catalog, category_aliases=None, fuzzy=True):
+        self.catalog = catalog
+        self.fuzzy = fuzzy
+        self._patterns = {}
+        self._names = []
+        self._trigram_counts = array("H")
+        self._postings = {}
+        self.local = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+        brands = {}
+        for product in catalog:
+            self._add(product.name, (PRODUCT, product.name, product.category))
+            if product.model_number:
+                self._add(product.model_number, (PRODUCT, product.name, product.category))
+            if product.brand:
+                brands.setdefault(product.brand, []).append(product)
+            if fuzzy:
+                self._index_trigrams(product.name)
+        for brand, products in brands.items():
+            self._add(brand, (BRAND, brand, tuple((p.name, p.category) for p in products)))
+        aliases = CATEGORY_ALIASES if category_aliases is None else category_aliases
+        # 目录中没有商品的类别同样注册别名，"headphones" 才不会被更短的 "phones" 抢先匹配
+        for category in dict.fromkeys(list(catalog.categories()) + list(aliases)):
+            for alias in [category] + list(aliases.get(category, ())):
+                # 别名是人工维护的，允许 "tv" 这样的短词
+                self._add(alias, (CATEGORY, category, None), min_length=2)
+        self._lengths = sorted({len(key) for key in self._patterns}, reverse=True)
+
+    def _add(self, text, entry, min_length=MIN_PATTERN_LENGTH):
+        key = normalize(text)
+        if len(key) < min_length:
+            return
+        entries = self._patterns.setdefault(key, [])
+        if entry not in entries:
+            entries.append(entry)
+
+    def _index_trigrams(self, name):
+        grams = _trigrams(normalize(name))
+        index = len(self._names)
+        self._names.append(name)
+        self._trigram_counts.append(min(len(grams), 65535))
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("I")
+            posting.append(index)
+
+    def _exact_matches(self, text, boundaries):
+        """
+        枚举各模式长度的子串查表
+        返回:
+            (按位置排序、互不重叠的最长匹配 [(start, end, entries)], 是否有模式落在单词中间)
+        """
+        found = []
+        for length in self._lengths:
+            for start in range(len(text) - length + 1):
+                entries = self._patterns.get(text[start:start + length])
+                if entries:
+                    found.append((start, start + length, entries))
+        chosen = []
+        partial = False
+        taken = bytearray(len(text))
+        # 模式长度已按降序枚举，先出现的就是更长的匹配
+        for start, end, entries in found:
+            if any(taken[start:end]):
+                continue
+            if not (_at_boundary(text, boundaries, start) and (end == len(text) or _at_boundary(text, boundaries, end))):
+                # 如 "earphones" 中的 "phones"：可能是目录外的商品，交给模型判断
+                partial = True
+                continue
+            taken[start:end] = b"\x01" * (end - start)
+            chosen.append((start, end, entries))
+        return sorted(chosen, key=lambda match: match[0]), partial
+
+    def _fuzzy_matches(self, segments):
+        """返回 {商品名: 覆盖率}，覆盖率为商品名三元组出现在输入片段中的比例"""
+        grams = set()
+        for segment in segments:
+            grams |= _trigrams(segment)
+        hits = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is not None and len(posting) <= MAX_POSTING:
+                hits.update(posting)
+        return {self._names[i]: count / self._trigram_counts[i] for i, count in hits.items()
+                if count / self._trigram_counts[i] >= WEAK_FUZZY}
+
+    def match(self, user_input):
+        """
+        参数:
+            user_input: 用户输入
+        返回:
+            高置信度时返回 [{'category': ..., 'products': [...]}] 结构的列表，不确定时返回 None
+        """
+        text, boundaries = normalize_words(user_input)
+        products = {}       # 商品名 → 类别
+        categories = []
+        brands = []         # 对应多个商品的品牌，需要模糊匹配进一步确定
+        matches, ambiguous = self._exact_matches(text, boundaries)
+        segments, position = [], 0
+        for start, end, entries in matches:
+            if len(entries) > 1:
+                # 同一段文本对应多个条目（如两个商品同名、型号与品牌相同）
+                ambiguous = True
+                continue
+            kind, value, extra = entries[0]
+            if kind == BRAND and len(extra) > 1:
+                brands.append(extra)
+                continue
+            if kind == PRODUCT:
+                products[value] = extra
+            elif kind == CATEGORY:
+                if value not in categories:
+                    categories.append(value)
+            else:
+                # 品牌下只有一个商品，提到品牌即提到该商品
+                products[extra[0][0]] = extra[0][1]
+            # 已确定的片段不参与模糊匹配，避免 "CineView 4K TV" 模糊命中 "CineView 8K TV"
+            segments.append(text[position:start])
+            position = end
+        segments.append(text[position:])
+
+        if self.fuzzy:
+            for name, score in self._fuzzy_matches(segments).items():
+                if name in products:
+                    continue
+                if score >= STRONG_FUZZY:
+                    products[name] = self.catalog.get(name).category
+                else:
+                    ambiguous = True
+        for brand_products in brands:
+            if not any(name in products for name, _ in brand_products):
+                ambiguous = True
+
+        if ambiguous or not (products or categories):
+            return None
+        result = [{'category': category} for category in categories]
+        grouped = {}
+        for name, category in products.items():
+            # 已经整体提到的类别包含其中的全部商品
+            if category not in categories:
+                grouped.setdefault(category, []).append(name)
+        result += [{'category': category, 'products': names} for category, names in grouped.items()]
+        return result
+
+    def record(self, local):
+        """记录一次抽取是否由本地匹配完成"""
+        with self._lock:
+            if local:
+                self.local += 1
+            else:
+                self.fallbacks += 1
+
+    def stats(self):
+        """
+        返回:
+            local: 本地匹配完成的次数，即节省的模型调用次数
+            llm_fallback: 回退到模型的次数
+            local_rate: 本地匹配的比例
+        """
+        total = self.local + self.fallbacks
+        return {
+            'local': self.local,
+            'llm_fallback': self.fallbacks,
+            'llm_calls_saved': self.local,
+            'local_rate': self.local / total if total else 0.0,
+        }
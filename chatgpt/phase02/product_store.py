@@ -0,0 +1,449 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 00:20
+@Version: v1.0
+@Description: 基于 SQLite FTS5 的商品库
+    phase02 的流程假设整个商品目录能放进 Python 字典和提示词。商品数到百万级时，改用 SQLite 存储：
+        1. products 表按名称、规范化名称、类别建立 B 树索引，get / by_category 只读取命中的行
+        2. FTS5 全文索引覆盖名称、品牌、型号、特性和描述，search 先按所有查询词检索，不足时用少见词补足，按 bm25 排序；
+           中文没有空格分词，索引和查询时都把连续的中日韩文字改写为二元组，"手机"、"超极本" 这样的子串也能命中
+        3. 批量导入 JSON / CSV：单个事务内分批 executemany，整体替换时导入前删除索引、导入后重建，
+           WAL 模式下其他连接在提交前读到的仍是旧数据，提交即原子切换，版本号加一
+    ProductStore 实现与 Catalog 相同的接口，可以直接作为 util_zh 的商品目录后端（设置 PRODUCT_STORE_PATH）；
+    FullTextRetriever、FullTextMatcher 分别代替内存中的检索索引和本地匹配器，进程内存不随商品数增长。
+    每个线程使用独立的连接，数据库文件通过 mmap 读取，多个工作进程共享页缓存。
+"""
+import csv
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from itertools import islice
+
+from chatgpt.phase02.catalog import FIELDS, Product, normalize_name
+from chatgpt.phase02.catalog_retrieval import CatalogRetriever
+from chatgpt.phase02.product_matcher import ProductMatcher, normalize
+
+# 批量导入时每批写入的行数
+BATCH_SIZE = 10_000
+# FTS5 的分词器：
+#     unicode61（默认）按空白和标点切词，中日韩文字预先改写为二元组，索引小、常见词的检索快
+#     trigram 支持英文单词内的任意子串，但查询词至少 3 个字符，索引更大，常见词的检索慢数倍
+TOKENIZERS = ("unicode61", "trigram")
+# bm25 中名称、品牌、型号、特性、描述的权重
+BM25_WEIGHTS = (10.0, 5.0, 5.0, 2.0, 1.0)
+# 每个连接的 mmap 大小
+MMAP_SIZE = 1 << 30
+# search 的 OR 回退只使用命中商品数不超过该值的词，常见词（品牌、"camera"）会让 bm25 给大量商品逐一打分
+MAX_TERM_DOCS = 2000
+# 每个版本缓存的词频条数上限
+TERM_CACHE_SIZE = 50_000
+# FullTextMatcher 每次匹配检索的候选商品数
+MATCH_CANDIDATES = 30
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# 中日韩文字（含假名、谚文）的连续片段
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    normalized_name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    normalized_category TEXT NOT NULL,
+    brand TEXT,
+    price REAL,
+    record TEXT NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS products_name ON products (name);
+CREATE INDEX IF NOT EXISTS products_normalized_name ON products (normalized_name);
+CREATE INDEX IF NOT EXISTS products_category ON products (normalized_category, id);
+CREATE INDEX IF NOT EXISTS products_brand ON products (brand, id);
+"""
+
+_DROP_INDEXES = """
+DROP INDEX IF EXISTS products_name;
+DROP INDEX IF EXISTS products_normalized_name;
+DROP INDEX IF EXISTS products_category;
+DROP INDEX IF EXISTS products_brand;
+"""
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _execute_script(connection, script):
+    # executescript 会先提交当前事务，批量导入需要在同一个事务内执行 DDL
+    for statement in script.split(";"):
+        if statement.strip():
+            connection.execute(statement)
+
+
+def _cjk_bigram_run(match):
+    run = match.group()
+    grams = [run] if len(run) < 2 else [run[i:i + 2] for i in range(len(run) - 1)]
+    return " " + " ".join(grams) + " "
+
+
+def cjk_bigrams(text):
+    """把中日韩文字的连续片段改写为以空格分隔的二元组：'智能手机' → ' 智能 能手 手机 '，其余文字不变"""
+    return _CJK.sub(_cjk_bigram_run, text) if text else text
+
+
+def _phrase(word):
+    """把查询词写成 FTS5 的短语，避免其中的运算符和引号被解析为查询语法"""
+    return '"{}"'.format(word.replace('"', '""'))
+
+
+def _coerce_csv_row(row):
+    """CSV 的单元格都是字符串：features 可以是 JSON 数组或以分号分隔，rating、price 转为数字，空单元格视为缺失"""
+    data = {field: (row.get(field) or None) for field in FIELDS}
+    features = data['features']
+    if features:
+        data['features'] = json.loads(features) if features.lstrip().startswith("[") else \
+            [item.strip() for item in features.split(";") if item.strip()]
+    for field in ("rating", "price"):
+        if data[field] is not None:
+            data[field] = float(data[field])
+    return data
+
+
+class ProductStore:
+    """
+    参数:
+        path: 数据库文件路径
+        tokenize: FTS5 分词器，unicode61 或 trigram，只在创建数据库时生效
+    """
+
+    def __init__(self, path, tokenize="unicode61"):
+        if tokenize not in TOKENIZERS:
+            raise ValueError(f"未知的分词器：{tokenize}，可选 {TOKENIZERS}")
+        self.path = path
+        self._local = threading.local()
+        self._load_lock = threading.Lock()
+        self._categories = None     # (版本号, {类别: 规范化类别})
+        self._term_docs = (None, {})  # (版本号, {词: 命中商品数})
+        connection = self._connection()
+        with connection:
+            connection.executescript(_SCHEMA)
+            connection.executescript(_INDEXES)
+            # 无内容（contentless）的全文索引：只保存倒排索引，索引的是改写后的文本，检索结果按 rowid 回表
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+                f"name, brand, model_number, features, description, content='', tokenize='{tokenize}')")
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('tokenize', ?)", (tokenize,))
+        self.tokenize = connection.execute("SELECT value FROM meta WHERE key = 'tokenize'").fetchone()[0]
+        # 写入索引和检索时对文本做同样的改写
+        self._index_text = cjk_bigrams if self.tokenize == "unicode61" else (lambda text: text)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            self._local.connection = connection
+        return connection
+
+    # ------------------------ 批量导入 ----------------------
+
+    def load_products(self, products, replace=True):
+        """
+        批量导入商品
+        参数:
+            products: 商品字典或 Product 的可迭代对象，可以是生成器
+            replace: 为 True 时替换全部商品，否则追加
+        返回:
+            导入的商品数
+        """
+        connection = self._connection()
+        with self._load_lock, connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if replace:
+                connection.execute("INSERT INTO products_fts (products_fts) VALUES ('delete-all')")
+                connection.execute("DELETE FROM products")
+                # 逐行维护 B 树索引比导入后一次性建立慢得多
+                _execute_script(connection, _DROP_INDEXES)
+            next_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM products").fetchone()[0] + 1
+            first_id = next_id
+            products = (item if isinstance(item, Product) else Product.from_dict(item) for item in products)
+            while True:
+                batch = list(islice(products, BATCH_SIZE))
+                if not batch:
+                    break
+                ids = range(next_id, next_id + len(batch))
+                connection.executemany(
+                    "INSERT INTO products (id, name, normalized_name, category, normalized_category, brand, price, "
+                    "record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(i,) + self._row(product) for i, product in zip(ids, batch)])
+                connection.executemany(
+                    "INSERT INTO products_fts (rowid, name, brand, model_number, features, description) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(i,) + self._fts_row(product) for i, product in zip(ids, batch)])
+                next_id += len(batch)
+            if replace:
+                _execute_script(connection, _INDEXES)
+                # 分批写入会产生多个索引段，合并为一个段，检索时只需读取一次倒排表
+                connection.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+            connection.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        connection.execute("PRAGMA optimize")
+        return next_id - first_id
+
+    @staticmethod
+    def _row(product):
+        return (product.name, normalize_name(product.name), product.category, normalize_name(product.category),
+                product.brand, product.price, _ENCODER.encode(product.to_dict()))
+
+    def _fts_row(self, product):
+        index_text = self._index_text
+        return (index_text(product.name), index_text(product.brand), index_text(product.model_number),
+                index_text(" ".join(product.features)), index_text(product.description))
+
+    def load_json(self, path, replace=True):
+        """从 products.json 格式的文件导入"""
+        with open(path, "r", encoding="utf-8") as file:
+            return self.load_products(json.load(file), replace)
+
+    def load_csv(self, path, replace=True):
+        """从 CSV 导入，表头为 products.json 的字段名，逐行读取不会把整个文件载入内存"""
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            return self.load_products((_coerce_csv_row(row) for row in csv.DictReader(file)), replace)
+
+    # ------------------------ 与 Catalog 相同的查询接口 ----------------------
+
+    @property
+    def version(self):
+        """每次导入后加一，下游缓存据此失效"""
+        return int(self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    @staticmethod
+    def _product(record):
+        product = Product.from_dict(json.loads(record))
+        # record 就是紧凑 JSON，序列化时直接复用
+        product._json = record
+        return product
+
+    def get(self, name):
+        """按名称查找商品，精确匹配失败时按规范化名称匹配，找不到返回 None"""
+        if not isinstance(name, str):
+            return None
+        connection = self._connection()
+        row = connection.execute("SELECT record FROM products WHERE name = ? ORDER BY id LIMIT 1", (name,)).fetchone()
+        if row is None:
+            row = connection.execute("SELECT record FROM products WHERE normalized_name = ? ORDER BY id LIMIT 1",
+                                     (normalize_name(name),)).fetchone()
+        return self._product(row[0]) if row is not None else None
+
+    def _category_map(self):
+        version = self.version
+        cached = self._categories
+        if cached is None or cached[0] != version:
+            # 同一类别可能有多种写法（大小写、空白不同），取每个类别第一个商品的写法
+            rows = self._connection().execute(
+                "SELECT p.category, p.normalized_category FROM products p JOIN ("
+                "SELECT MIN(id) AS id FROM products GROUP BY normalized_category) AS first ON p.id = first.id "
+                "ORDER BY p.id")
+            cached = self._categories = (version, dict(rows.fetchall()))
+        return cached[1]
+
+    def _normalized_category(self, category):
+        categories = self._category_map()
+        if category in categories:
+            return categories[category]
+        return normalize_name(category) if isinstance(category, str) else None
+
+    def by_category(self, category, limit=None):
+        """返回类别下的商品，类别名称支持规范化匹配"""
+        rows = self._connection().execute(
+            "SELECT record FROM products WHERE normalized_category = ? ORDER BY id LIMIT ?",
+            (self._normalized_category(category), -1 if limit is None else limit))
+        return [self._product(record) for (record,) in rows]
+
+    def by_brand(self, brand, limit=None):
+        """返回品牌下的商品（品牌名称精确匹配）"""
+        rows = self._connection().execute(
+            "SELECT record FROM products WHERE brand = ? ORDER BY id LIMIT ?", (brand, -1 if limit is None else limit))
+        return [self._product(record) for (record,) in rows]
+
+    def categories(self):
+        return list(self._category_map())
+
+    def category_sample(self, category, limit):
+        rows = self._connection().execute(
+            "SELECT name FROM products WHERE normalized_category = ? ORDER BY id LIMIT ?",
+            (self._normalized_category(category), limit))
+        return [name for (name,) in rows]
+
+    @property
+    def category_names(self):
+        """类别 → 商品名称列表，读取全部商品名称；大目录请使用 category_sample 或 search"""
+        names = {category: [] for category in self.categories()}
+        for category, name in self._connection().execute("SELECT category, name FROM products ORDER BY id"):
+            names.setdefault(category, []).append(name)
+        return names
+
+    def _query_words(self, query):
+        """把查询切分为检索词：按空白和标点切分，中文等不以空格分词的片段按与索引相同的方式切成二元组或三字片段"""
+        text = unicodedata.normalize("NFKC", query).casefold()
+        words = _WORD.findall(self._index_text(text))
+        if self.tokenize != "trigram":
+            return list(dict.fromkeys(words))
+        terms = []
+        for word in words:
+            if word.isascii():
+                if len(word) >= 3:
+                    terms.append(word)
+            else:
+                # "请介绍一下超极本" 整体不会出现在商品字段中，拆成三字片段后 "超极本" 即可命中
+                terms.extend(word[i:i + 3] for i in range(len(word) - 2))
+        return list(dict.fromkeys(terms))
+
+    def _document_frequency(self, words):
+        """返回每个词命中的商品数，按版本缓存"""
+        version = self.version
+        cached_version, docs = self._term_docs
+        if cached_version != version or len(docs) > TERM_CACHE_SIZE:
+            docs = {}
+            self._term_docs = (version, docs)
+        connection = self._connection()
+        for word in words:
+            if word not in docs:
+                docs[word] = connection.execute(
+                    "SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH ?", (_phrase(word),)).fetchone()[0]
+        return {word: docs[word] for word in words}
+
+    def _ranked(self, expression, limit):
+        # 先在全文索引内排序取前 limit 个，再回表读取商品
+        return self._connection().execute(
+            "SELECT p.id, p.record, hits.rank FROM ("
+            f"SELECT rowid, bm25(products_fts, {', '.join('?' * len(BM25_WEIGHTS))}) AS rank FROM products_fts "
+            "WHERE products_fts MATCH ? ORDER BY rank LIMIT ?) AS hits "
+            "JOIN products p ON p.id = hits.rowid ORDER BY hits.rank",
+            BM25_WEIGHTS + (expression, limit)).fetchall()
+
+    def search(self, query, limit=20):
+        """
+        全文检索名称、品牌、型号、特性和描述
+            1. 先检索同时包含所有查询词的商品
+            2. 不足 limit 个时，用较少见的词（命中不超过 MAX_TERM_DOCS 个商品）以 OR 组合补足
+        参数:
+            query: 用户输入，按词切分，不支持 FTS5 的查询语法
+            limit: 最多返回的商品数
+        返回:
+            按 bm25 相关度降序的 [(Product, 得分)]，得分越大越相关；同时包含所有查询词的商品排在前面
+        """
+        words = self._query_words(query)
+        if not words or limit <= 0:
+            return []
+        docs = self._document_frequency(words)
+        words = [word for word in words if docs[word]]
+        if not words:
+            return []
+        rows = self._ranked(" AND ".join(map(_phrase, words)), limit)
+        rare = [word for word in words if docs[word] <= MAX_TERM_DOCS]
+        if len(rows) < limit and rare and len(words) > 1:
+            seen = {row[0] for row in rows}
+            rows += [row for row in self._ranked(" OR ".join(map(_phrase, rare)), limit)
+                     if row[0] not in seen][:limit - len(rows)]
+        # SQLite 的 bm25 越小越相关，取相反数与 CatalogRetriever 保持一致
+        return [(self._product(record), -rank) for _, record, rank in rows]
+
+    def __getitem__(self, index):
+        row = self._connection().execute("SELECT record FROM products WHERE id = ?", (index + 1,)).fetchone()
+        if row is None:
+            raise IndexError(index)
+        return self._product(row[0])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def __iter__(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            for (record,) in connection.execute("SELECT record FROM products ORDER BY id"):
+                yield self._product(record)
+        finally:
+            connection.close()
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def close(self):
+        """关闭当前线程的连接"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class FullTextRetriever(CatalogRetriever):
+    """
+    以 ProductStore 的 FTS5 检索代替 CatalogRetriever 的内存倒排索引，candidates 的行为相同
+    参数:
+        store: ProductStore
+        category_aliases: 类别 → 别名列表，默认 CATEGORY_ALIASES
+    """
+
+    def __init__(self, store, category_aliases=None):
+        self.catalog = store
+        self._count = len(store)
+        self._index_categories(category_aliases)
+
+    def search(self, query, top_n=20):
+        return self.catalog.search(query, top_n)
+
+
+class _CandidateCatalog:
+    """检索出的候选商品，提供 ProductMatcher 用到的目录接口；类别取自整个商品库"""
+
+    def __init__(self, store, products):
+        self._store = store
+        self._products = {product.name: product for product in products}
+
+    def __iter__(self):
+        return iter(self._products.values())
+
+    def get(self, name):
+        product = self._products.get(name)
+        return product if product is not None else self._store.get(name)
+
+    def categories(self):
+        return self._store.categories()
+
+
+class FullTextMatcher(ProductMatcher):
+    """
+    以 ProductStore 为目录的本地匹配器：不为全部商品建立模式表和三元组索引，每次匹配先用 FTS5 检索候选商品，
+    再在候选商品上构建临时的 ProductMatcher，按相同的规则匹配，内存与商品数无关
+    参数:
+        store: ProductStore
+        category_aliases: 类别 → 别名列表，默认 CATEGORY_ALIASES
+        fuzzy: 是否开启三元组模糊匹配
+        candidates: 每次匹配检索的候选商品数
+    """
+
+    def __init__(self, store, category_aliases=None, fuzzy=True, candidates=MATCH_CANDIDATES):
+        self.catalog = store
+        self.category_aliases = category_aliases
+        self.fuzzy = fuzzy
+        self.candidates = candidates
+        self.local = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def match(self, user_input):
+        products = [product for product, _ in self.catalog.search(user_input, self.candidates)]
+        # 只提到一个对应多个商品的品牌时无法确定是哪个商品；候选中可能只检索到该品牌的一个商品，
+        # 为输入中提到的品牌补充该品牌的其他商品，临时匹配器才能识别出这种歧义
+        text = normalize(user_input)
+        for brand in {product.brand for product in products if product.brand and normalize(product.brand) in text}:
+            products += self.catalog.by_brand(brand, limit=2)
+        matcher = ProductMatcher(_CandidateCatalog(self.catalog, products), self.category_aliases, self.fuzzy)
+        return matcher.match(user_input)
+
@@ -5,22 +5,166 @@
 @Description: 
 """
 from chatgpt.tool import get_completion_from_messages
+from chatgpt.phase02.catalog_retrieval import CatalogRetriever
+from chatgpt.phase02.catalog_snapshot import ReloadableCatalog
+from chatgpt.phase02.product_store import FullTextMatcher, FullTextRetriever, ProductStore
+from chatgpt.phase02.product_matcher import ProductMatcher
 import json
+import os
+import threading
 
-with open("products.json", "r") as file:
-    products = json.load(file)
+# 按模块所在目录定位商品目录，不依赖当前工作目录
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.json")
+# generate_output_string 中商品的序列化格式，见 catalog.SERIALIZATION_FORMATS
+OUTPUT_FORMAT = "json"
+# 只提到类别时，generate_output_string 最多列出的该类别商品数，商品信息的大小不随类别规模增长
+CATEGORY_PRODUCT_LIMIT = 20
+# 回退到模型抽取时，提示词中最多列出的检索候选商品数，见 catalog_retrieval
+RETRIEVAL_TOP_N = 30
+# 商品目录的内存映射快照，同一台机器上的工作进程使用同一路径即可共享，见 catalog_snapshot；
+# 默认不使用快照、在进程内解析 products.json。通过环境变量 PRODUCTS_SNAPSHOT_PATH 开启，
+# 路径应位于只有运行服务的用户可写的目录，不要放在 /tmp 这类共享目录中
+SNAPSHOT_PATH = os.environ.get("PRODUCTS_SNAPSHOT_PATH") or None
+# 访问商品目录时最多每隔多少秒检查一次 products.json 是否变化
+CATALOG_POLL_INTERVAL = 2.0
+# 设置环境变量 PRODUCT_STORE_PATH 后，商品目录改用 SQLite FTS5 商品库（见 product_store），适合百万级商品；
+# 商品库为空时自动从 products.json 导入，之后通过 ProductStore.load_json / load_csv 更新
+PRODUCT_STORE_PATH = os.environ.get("PRODUCT_STORE_PATH") or None
 
+_catalog_source = None
+_product_store = None
+_matcher = None
+_retriever = None
+_catalog_lock = threading.Lock()
 
-def get_product_by_name(name):
-    return products.get(name, None)
+
+def get_catalog_source():
+    """
+    返回可热更新的商品目录源（ReloadableCatalog），可以用它订阅变更通知（subscribe）
+    或启动后台轮询线程（watch）
+    """
+    global _catalog_source
+    if _catalog_source is None:
+        with _catalog_lock:
+            if _catalog_source is None:
+                _catalog_source = ReloadableCatalog(PRODUCTS_PATH, SNAPSHOT_PATH, CATALOG_POLL_INTERVAL)
+    return _catalog_source
+
+
+def get_product_store():
+    """返回 PRODUCT_STORE_PATH 对应的商品库，首次调用时打开，库为空时从 products.json 导入"""
+    global _product_store
+    if _product_store is None:
+        with _catalog_lock:
+            if _product_store is None:
+                store = ProductStore(PRODUCT_STORE_PATH)
+                if len(store) == 0:
+                    store.load_json(PRODUCTS_PATH)
+                _product_store = store
+    return _product_store
+
+
+def get_catalog():
+    """
+    返回当前版本的商品目录：配置了 PRODUCT_STORE_PATH 时为 SQLite 商品库，
+    否则为 products.json 的快照，文件变化后自动切换到新版本
+    """
+    if PRODUCT_STORE_PATH:
+        return get_product_store()
+    return get_catalog_source().current()
+
+
+def get_catalog_version():
+    """
+    当前商品目录的版本号（单调递增的整数），目录变化时下游的缓存据此失效
+    """
+    return get_catalog().version
 
 
 def get_product_by_name(name):
-    return products.get(name, None)
+    """按名称查找商品（忽略大小写和空白），返回商品字典，找不到返回 None"""
+    product = get_catalog().get(name)
+    return product.to_dict() if product is not None else None
 
 
-def get_products_by_category(category):
-    return [product for product in products.values() if product["category"] == category]
+def get_products_by_category(category, limit=None):
+    """返回类别下商品的字典列表，limit 为 None 时返回全部"""
+    return [product.to_dict() for product in get_catalog().by_category(category, limit)]
+
+
+def get_products_and_category():
+    """
+    返回:
+        类别 → 商品名称列表 的字典（预先计算，不要修改），作为 find_category_and_product_only 的允许商品
+    """
+    return get_catalog().category_names
+
+
+def _is_stale(derived, catalog):
+    """派生的索引是否落后于当前目录：目录对象被替换，或商品库重新导入后版本号变化"""
+    return derived is None or derived.catalog is not catalog or derived.catalog_version != catalog.version
+
+
+def get_product_matcher():
+    """
+    返回基于当前商品目录的本地匹配器，首次调用或目录切换到新版本后重新构建；
+    SQLite 商品库每次匹配时通过 FTS5 检索候选商品，不在内存中为全部商品建立索引
+    """
+    global _matcher
+    matcher = _matcher
+    if _is_stale(matcher, get_catalog()):
+        with _catalog_lock:
+            catalog = get_catalog()
+            if _is_stale(_matcher, catalog):
+                previous = _matcher
+                # 先取版本号，构建期间重新导入时下次访问会再次重建
+                version = catalog.version
+                matcher_class = FullTextMatcher if isinstance(catalog, ProductStore) else ProductMatcher
+                matcher = matcher_class(catalog)
+                matcher.catalog_version = version
+                if previous is not None:
+                    # 统计跨目录版本累计
+                    matcher.local, matcher.fallbacks = previous.local, previous.fallbacks
+                _matcher = matcher
+            matcher = _matcher
+    return matcher
+
+
+def get_catalog_retriever():
+    """
+    返回当前商品目录的检索索引，首次调用或目录切换到新版本后重新构建；
+    SQLite 商品库直接使用 FTS5 检索，不在内存中建立倒排索引
+    """
+    global _retriever
+    retriever = _retriever
+    if _is_stale(retriever, get_catalog()):
+        with _catalog_lock:
+            catalog = get_catalog()
+            if _is_stale(_retriever, catalog):
+                version = catalog.version
+                retriever_class = FullTextRetriever if isinstance(catalog, ProductStore) else CatalogRetriever
+                retriever = retriever_class(catalog)
+                retriever.catalog_version = version
+                _retriever = retriever
+            retriever = _retriever
+    return retriever
+
+
+def get_candidate_products_and_category(user_input, top_n=None):
+    """
+    检索与查询最相关的候选商品，代替完整的 get_products_and_category() 放进提示词
+    参数:
+        user_input: 用户的查询
+        top_n: 候选商品数，默认 RETRIEVAL_TOP_N；目录不超过该数量时返回完整的字典
+    返回:
+        类别 → 商品名称列表 的字典
+    """
+    return get_catalog_retriever().candidates(user_input, top_n or RETRIEVAL_TOP_N)
+
+
+def get_matcher_stats():
+    """返回本地匹配的次数（即节省的模型调用次数）和回退到模型的次数"""
+    return get_product_matcher().stats()
 
 
 def read_string_to_list(input_string):
@@ -43,45 +187,53 @@ def read_string_to_list(input_string):
     return None
 
 
-def generate_output_string(data_list):
+def generate_output_string(data_list, fmt=None):
     """
     根据输入的数据列表生成包含产品或类别信息的字符串。
 
     参数:
     data_list: 包含字典的列表，每个字典都应包含 "products" 或 "category" 的键。
+    fmt: 每个商品的序列化格式，json（紧凑 JSON）或 table，默认为 OUTPUT_FORMAT。
 
     返回:
-    output_string: 包含产品或类别信息的字符串。
+    output_string: 包含产品或类别信息的字符串，每行一个商品，重复提到的商品只输出一次；
+    只提到类别时最多列出该类别的前 CATEGORY_PRODUCT_LIMIT 个商品。
     """
-    output_string = ""
     if data_list is None:
-        return output_string
+        return ""
+    fmt = fmt or OUTPUT_FORMAT
+    catalog = get_catalog()
+    # 商品的序列化结果缓存在商品记录上，这里只收集后一次性拼接
+    parts = []
+    seen = set()
+
+    def append(product):
+        if product.name not in seen:
+            seen.add(product.name)
+            parts.append(product.serialize(fmt))
 
     for data in data_list:
         try:
             if "products" in data and data["products"]:
-                products_list = data["products"]
-                for product_name in products_list:
-                    product = get_product_by_name(product_name)
+                for product_name in data["products"]:
+                    product = catalog.get(product_name)
                     if product:
-                        output_string += json.dumps(product, indent=4,ensure_ascii=False) + "\n"
+                        append(product)
                     else:
                         print(f"Error: Product '{product_name}' not found")
             elif "category" in data:
-                category_name = data["category"]
-                category_products = get_products_by_category(category_name)
-                for product in category_products:
-                    output_string += json.dumps(product, indent=4, ensure_ascii=False) + "\n"
-                else:
-                    print("Error: Invalid object format")
+                for product in catalog.by_category(data["category"], CATEGORY_PRODUCT_LIMIT):
+                    append(product)
+            else:
+                print("Error: Invalid object format")
         except Exception as e:
             print(f"Error: {e}")
-    return output_string
+    return "\n".join(parts)
 
 
-def find_category_and_product_only(user_input,products_and_category):
+def build_category_and_product_messages(user_input, products_and_category):
     """
-    从用户输入中获取到产品和类别
+    构造 find_category_and_product_only 的消息列表
     参数：
         @user_input：用户的查询
         @products_and_category：产品类型和对应产品的字典
@@ -115,5 +267,33 @@ def find_category_and_product_only(user_input,products_and_category):
         {'role': 'assistant', 'content': few_shot_assistant_1},
         {'role': 'user', 'content': f"{delimiter}{user_input}{delimiter}"},
     ]
-    return get_completion_from_messages(messages)
+    return messages
 
+
+def find_category_and_product_only(user_input,products_and_category):
+    """
+    从用户输入中获取到产品和类别
+    参数：
+        @user_input：用户的查询
+        @products_and_category：产品类型和对应产品的字典，目录较大时传入 get_candidate_products_and_category 的检索结果
+    """
+    return get_completion_from_messages(build_category_and_product_messages(user_input, products_and_category))
+
+
+def extract_category_and_products(user_input):
+    """
+    抽取用户输入中提到的类别和商品：本地匹配有把握时直接返回，省去一次模型调用；
+    不确定时回退到 find_category_and_product_only，提示词中只列出检索出的候选商品
+    参数:
+        user_input: 用户的查询
+    返回:
+        [{'category': ..., 'products': [...]}] 结构的列表，模型输出无法解析时返回 None
+    """
+    matcher = get_product_matcher()
+    result = matcher.match(user_input)
+    matcher.record(result is not None)
+    if result is not None:
+        return result
+    # 只把检索出的候选商品放进提示词，提示词大小不随目录规模增长
+    candidates = get_candidate_products_and_category(user_input)
+    return read_string_to_list(find_category_and_product_only(user_input, candidates))
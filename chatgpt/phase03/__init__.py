@@ -6,13 +6,15 @@
     包括处理用户评论、基于文档问答、寻求外部知识等。
 """
 from chatgpt.phase01.load_env import get_openai_api_key
+from chatgpt.tool import get_http_client
+from chatgpt.langchain_metrics import MetricsCallbackHandler
 # 从langchain 0.2.0 版本开始，OpenAI 需通过 langchain-community 包进行导入
 from langchain_community.chat_models import ChatOpenAI
 
 get_openai_api_key()
 
 # 我们将参数temperature设置为0.0，从而减少生成答案的随机性
-chat = ChatOpenAI(temperature = 0.0)
+chat = ChatOpenAI(temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 print(chat)
 
 
@@ -9,14 +9,15 @@
 
     基于文档问答的这个过程，我们会涉及 LangChain 中的其他组件，比如：嵌入模型（EmbeddingModels)和向量储存(Vector Stores)
 """
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 # openai模型
 from langchain_community.chat_models import ChatOpenAI
 
 result = "AI未运行"
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0)
+llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 # ------------------------ 直接使用向量储存查询 ----------------------
 # 检索QA链，在文档上进行检索
@@ -44,7 +45,7 @@ data = pd.read_csv(file, usecols=[1, 2])
 from langchain.indexes import VectorstoreIndexCreator
 from langchain_community.embeddings import OpenAIEmbeddings
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 # 创建指定向量存储类, 创建完成后，从加载器中调用, 通过文档加载器列表加载
 index = VectorstoreIndexCreator(vectorstore_cls=DocArrayInMemorySearch, embedding=embeddings).from_loaders([loader])
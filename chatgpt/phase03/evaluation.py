@@ -9,12 +9,13 @@
         2. 分析改动对于LLM应用性能的影响
     思路就是利用语言模型本身和链本身，来辅助评估其他的语言模型、链和应用程序
 """
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 # openai模型
 from langchain_community.chat_models import ChatOpenAI
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0)
+llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 result = "AI未运行"
 
@@ -39,7 +40,7 @@ test_data = pd.read_csv(file,skiprows=0)
 # print(test_data)
 
 from langchain_community.embeddings import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 # 将指定向量存储类,创建完成后，我们将从加载器中调用,通过文档记载器列表加载
 index = VectorstoreIndexCreator(vectorstore_cls=DocArrayInMemorySearch, embedding=embeddings).from_loaders([loader])
@@ -116,7 +117,7 @@ class ChineseQAGenerateChain(QAGenerateChain):
 
 
 # #通过传递chat open AI语言模型来创建这个链
-example_gen_chain = ChineseQAGenerateChain.from_llm(ChatOpenAI())
+example_gen_chain = ChineseQAGenerateChain.from_llm(ChatOpenAI(http_client=get_http_client(), callbacks=[MetricsCallbackHandler()]))
 # 应用了 QAGenerateChain 的 apply 方法对 data 中的前5条数据创建了2个“问答对”
 new_examples = example_gen_chain.apply([{"doc": t} for t in data[:2]])
 
@@ -5,7 +5,8 @@
 @Description: LangChain介绍
 """
 
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MetricsCallbackHandler
 
 result = "AI未运行"
 
@@ -33,7 +34,7 @@ from langchain.prompts import ChatPromptTemplate
 # 从langchain 0.2.0 版本开始，OpenAI 需通过 langchain-community 包进行导入
 from langchain_community.chat_models import ChatOpenAI
 # 我们将参数temperature设置为0.0，从而减少生成答案的随机性
-chat = ChatOpenAI(temperature = 0.0)
+chat = ChatOpenAI(temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 # ------------------------ 提示模板 ----------------------
 template = """
@@ -7,11 +7,12 @@
     例如，我们可以创建一个链，该链接受用户输入，使用提示模板对其进行格式化，然后将格式化的响应传递给 LLM 。
 我们可以通过将多个链组合在一起，或者通过将链与其他组件组合在一起来构建更复杂的链
 """
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MetricsCallbackHandler
 from langchain_community.chat_models import ChatOpenAI
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0)
+llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 result = "AI未运行"
 
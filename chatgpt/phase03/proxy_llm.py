@@ -8,12 +8,13 @@
 
 基于上述问题，LangChain 框架提出了 “代理”(Agent) 的解决方案。代理作为语言模型的外部模块，可提供计算、逻辑、检索等功能的支持，使语言模型获得异常强大的推理和获取信息的超能力。
 """
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MetricsCallbackHandler
 # openai模型
 from langchain_community.chat_models import ChatOpenAI
 
 # 初始化llm，参数temperature设置为0.0，从而减少生成答案的随机性
-llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0)
+llm = ChatOpenAI(model="gpt-4o-mini",temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 result = "AI未运行"
 
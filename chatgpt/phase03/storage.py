@@ -4,7 +4,8 @@
 @Version: v1.0
 @Description: 存储
 """
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MetricsCallbackHandler
 
 result = "AI未运行"
 
@@ -27,7 +28,7 @@ from langchain.chains import ConversationChain
 from langchain.memory import ConversationBufferMemory
 
 # 初始化llm
-llm = ChatOpenAI(temperature = 0.0)
+llm = ChatOpenAI(temperature = 0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 # ------------------------ 缓存存储 ----------------------
 # 初始化内存
@@ -12,7 +12,8 @@
     5、
 """
 
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 
 from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
@@ -25,9 +26,9 @@ from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders import PyPDFLoader
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 # 初始化模型
-embedding = OpenAIEmbeddings(model="text-embedding-3-small")
+embedding = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 
 def load_db(file, chain_type, k):
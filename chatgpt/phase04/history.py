@@ -9,7 +9,8 @@
     添加聊天历史的功能
 """
 # 导入OpenAI参数
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 # 导入OpenAI
 from langchain_openai import ChatOpenAI
 # 导入向量库
@@ -20,9 +21,9 @@ from langchain_openai.embeddings import OpenAIEmbeddings
 question = "这节课的主要话题是什么？"
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 # 初始化模型
-embedding = OpenAIEmbeddings(model="text-embedding-3-small")
+embedding = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 # 加载向量数据库
 persist_directory = "chroma"
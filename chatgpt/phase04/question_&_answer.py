@@ -16,7 +16,8 @@
     默认情况下，我们将所有的文档切片都传递到同一个上下文窗口中，即同一次语言模型调用中。MapReduce、Refine 和 MapRerank 是三种方法，用于解决短上下文窗口的问题
 """
 # 导入OpenAI参数
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 # 导入OpenAI
 from langchain_openai import ChatOpenAI
 # 导入向量库
@@ -25,9 +26,9 @@ from langchain_chroma.vectorstores import Chroma
 from langchain_openai.embeddings import OpenAIEmbeddings
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 # 初始化模型
-embedding = OpenAIEmbeddings(model="text-embedding-3-small")
+embedding = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 # 加载向量数据库
 persist_directory = "chroma"
@@ -60,6 +61,46 @@ qa_chain = RetrievalQA.from_chain_type(
 # res = qa_chain({"query": question})
 # print(res["result"])
 
+# ------------------------ 语义缓存 ----------------------
+"""
+    相同或换了说法的问题反复出现时，每次都要检索并调用语言模型。语义缓存对问题做 Embedding，与已回答过的问题比较相似度，
+超过阈值直接返回之前的答案。向量数据库的内容变化（文档数量或持久化文件变化）时，缓存整体失效。
+"""
+import os
+from chatgpt.semantic_cache import SemanticCache
+
+qa_caches = {}
+
+
+def vector_store_version():
+    # 向量数据库的版本标识：文档数量和持久化文件的修改时间
+    sqlite_file = os.path.join(persist_directory, "chroma.sqlite3")
+    mtime = os.stat(sqlite_file).st_mtime_ns if os.path.exists(sqlite_file) else None
+    return vectorDb._collection.count(), mtime
+
+
+def cached_query(chain, query):
+    """
+    带语义缓存的检索式问答，每个问答链使用独立的缓存
+    参数:
+        chain: RetrievalQA 问答链
+        query: 用户问题
+    返回:
+        问答链的输出字典
+    """
+    cache = qa_caches.get(id(chain))
+    if cache is None:
+        cache = qa_caches[id(chain)] = SemanticCache(embedding.embed_query, threshold=0.92, ttl=3600)
+    version = vector_store_version()
+    res, query_embedding = cache.lookup(query, version=version)
+    if res is None:
+        res = chain({"query": query})
+        cache.store(query, res, query_embedding, version)
+    return res
+
+# res = cached_query(qa_chain, question)
+# res = cached_query(qa_chain, "这节课主要讲了什么？")  # 语义相近，命中缓存
+
 # ------------------------ 深入探究检索式问答链 ----------------------
 """
     在获取与问题相关的文档后，需要将文档和原始问题一起输入语言模型，生成回答。默认是合并所有文档，一次性输入模型。但存在【上下文长度限制】
@@ -15,7 +15,8 @@
         Question Query  ->     Storage[Vector Store]    ->      Retrieval[Relevant Splits]      ->      Output[Prompt & LLM]    -> Answer
 """
 # 导入OpenAI参数
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings, MetricsCallbackHandler
 
 result = "向量库未运行"
 
@@ -26,7 +27,7 @@ from langchain_openai.embeddings import OpenAIEmbeddings
 # 指定一个持久化路径
 persist_directory_chinese = "chroma"
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 # 加载向量数据库( VectorDB )
 vectordb = Chroma(
@@ -102,7 +103,7 @@ from langchain.retrievers.self_query.base import SelfQueryRetriever
 from langchain.chains.query_constructor.base import AttributeInfo
 
 # 初始化llm
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0, http_client=get_http_client(), callbacks=[MetricsCallbackHandler()])
 
 """
 定义metadata_field_info，包含了元数据的过滤条件 source 和 page , 其中 source 的作用是告诉 LLM 我们想要的数据来自于哪里， page 告诉 LLM 我们需要提取相关的内容在原始文档的哪一页
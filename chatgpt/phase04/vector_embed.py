@@ -8,7 +8,8 @@
         Document Loading[PDF、Database、URLs]    →   Splitting[Splits]   →   Storage[Vectorstore]     →       Retrieval[Question & Relevant Splits]   →   Output[Prompt -> LLM]     →    Answer
 """
 # 导入OpenAI参数
-from chatgpt.tool import get_completion
+from chatgpt.tool import get_completion, get_http_client
+from chatgpt.langchain_metrics import MeteredEmbeddings
 
 # ------------------------ 文档读取 ----------------------
 from langchain_community.document_loaders import PyPDFLoader
@@ -50,7 +51,7 @@ import numpy as np
 # 对切块进行 Embedding 处理
 from langchain_openai.embeddings import OpenAIEmbeddings
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = MeteredEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", http_client=get_http_client()))
 
 
 # 测试句子相似案例
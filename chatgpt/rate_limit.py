@@ -0,0 +1,154 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 10:50
+@Version: v1.0
+@Description: 客户端 RPM/TPM 令牌桶限流
+    同时限制每分钟请求数（RPM）和每分钟 token 数（TPM）。发送前按估算的 prompt token 数扣减，
+    收到响应后再按 response.usage 的实际用量多退少补；额度不足时调用方阻塞等待，而不是直接失败。
+    指定 state_file 时，令牌桶状态保存在本地文件中并通过文件锁在多个工作进程之间共享；
+    没有 fcntl 的平台（Windows）记录警告并回退为进程内限流。
+"""
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只支持进程内限流
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 状态文件格式：请求桶余量、token 桶余量、上次更新时间
+_STATE = struct.Struct("<ddd")
+
+
+class TokenBucketLimiter:
+    """
+    RPM/TPM 双令牌桶
+    参数:
+        rpm: 每分钟最多请求数，None 表示不限制
+        tpm: 每分钟最多 token 数，None 表示不限制
+        state_file: 共享状态文件路径，None 表示只在本进程内（多线程）共享；平台不支持文件锁时忽略
+    """
+
+    def __init__(self, rpm=None, tpm=None, state_file=None):
+        if state_file is not None and fcntl is None:
+            logger.warning("当前平台没有 fcntl，无法跨进程共享限流状态，忽略 %s，改为进程内限流", state_file)
+            state_file = None
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated_at = time.monotonic() if state_file is None else time.time()
+        if state_file is not None:
+            directory = os.path.dirname(os.path.abspath(state_file))
+            os.makedirs(directory, exist_ok=True)
+            # 以追加模式创建文件，避免覆盖其他进程已写入的状态
+            with open(state_file, "ab"):
+                pass
+
+    def _clock(self):
+        # 跨进程时必须使用墙上时间，进程内使用单调时钟
+        return time.monotonic() if self.state_file is None else time.time()
+
+    def _refill(self, requests, tokens, updated_at, now):
+        elapsed = max(now - updated_at, 0.0)
+        if self.rpm:
+            requests = min(float(self.rpm), requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            tokens = min(float(self.tpm), tokens + elapsed * self.tpm / 60.0)
+        return requests, tokens
+
+    def _update(self, fn):
+        """在锁内读取状态、调用 fn(requests, tokens) -> (requests, tokens, result) 并写回"""
+        with self._lock:
+            if self.state_file is None:
+                now = self._clock()
+                requests, tokens = self._refill(self._requests, self._tokens, self._updated_at, now)
+                self._requests, self._tokens, result = fn(requests, tokens)
+                self._updated_at = now
+                return result
+            with open(self.state_file, "r+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    now = self._clock()
+                    raw = f.read(_STATE.size)
+                    if len(raw) == _STATE.size:
+                        requests, tokens, updated_at = _STATE.unpack(raw)
+                        requests, tokens = self._refill(requests, tokens, updated_at, now)
+                    else:
+                        requests, tokens = float(self.rpm or 0), float(self.tpm or 0)
+                    requests, tokens, result = fn(requests, tokens)
+                    f.seek(0)
+                    f.write(_STATE.pack(requests, tokens, now))
+                    f.truncate()
+                    return result
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _try_take(self, tokens):
+        """尝试扣减一次请求和 tokens 个 token，返回还需等待的秒数（0 表示已扣减）"""
+        if self.tpm:
+            # 单次请求超过整个桶容量时按容量扣减，否则永远无法满足
+            tokens = min(tokens, self.tpm)
+
+        def take(requests, available):
+            waits = []
+            if self.rpm and requests < 1:
+                waits.append((1 - requests) * 60.0 / self.rpm)
+            if self.tpm and available < tokens:
+                waits.append((tokens - available) * 60.0 / self.tpm)
+            if waits:
+                return requests, available, max(waits)
+            return (requests - 1 if self.rpm else requests,
+                    available - tokens if self.tpm else available,
+                    0.0)
+
+        return self._update(take)
+
+    def acquire(self, tokens=0):
+        """
+        阻塞直到有足够的额度
+        参数:
+            tokens: 本次请求预计消耗的 token 数
+        返回:
+            等待的总秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens=0):
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        import asyncio
+
+        waited = 0.0
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """
+        收到响应后按实际用量校正 token 桶：估算多了退回，估算少了补扣（余量可以为负，后续请求将等待）
+        参数:
+            estimated_tokens: acquire 时扣减的 token 数
+            actual_tokens: response.usage.total_tokens
+        """
+        if not self.tpm:
+            return
+        delta = min(estimated_tokens, self.tpm) - actual_tokens
+        if delta == 0:
+            return
+        self._update(lambda requests, tokens: (requests, min(float(self.tpm), tokens + delta), None))
@@ -0,0 +1,327 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 13:20
+@Version: v1.0
+@Description: 重试、截止时间与对冲请求
+    1. 可重试的错误（限流、超时、连接错误、5xx）按指数退避加随机抖动重试；
+       读取超时时请求已经发出，服务端可能仍在生成并计费，默认不重试
+    2. 每次调用可以设置截止时间，所有重试共享这一时间预算，超时抛出 DeadlineExceeded
+    3. 对冲请求：请求耗时超过近期 p95 延迟时再发一个相同的请求，谁先返回用谁，以此压低尾延迟
+"""
+import contextlib
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 当前上下文的绝对截止时间（time.monotonic()），由 deadline() 上下文管理器设置
+_deadline_at = contextvars.ContextVar("openai_deadline_at", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用在截止时间内没有完成"""
+
+
+class RetryPolicy:
+    """
+    重试与对冲策略
+    参数:
+        max_retries: 最大重试次数（不含第一次请求）
+        base_delay: 退避的基础秒数，第 n 次重试最多等待 base_delay * 2**n
+        max_delay: 单次退避的最大秒数
+        deadline: 每次调用的默认时间预算（秒），None 表示不限制
+        attempt_timeout: 单次请求的超时秒数，默认与 OpenAI SDK 一致（600 秒），长回答的非流式补全也能完成
+        retry_read_timeouts: 读取超时是否重试，默认不重试，避免一次慢请求被重复计费
+        hedge: 是否开启对冲请求
+        hedge_quantile: 以近期延迟的哪个分位数作为对冲等待时间
+        hedge_min_samples: 至少积累多少个延迟样本后才开始对冲
+        hedge_min_delay: 对冲等待时间的下限（秒）
+    """
+
+    def __init__(self, max_retries=2, base_delay=0.5, max_delay=8.0, deadline=None, attempt_timeout=600.0,
+                 retry_read_timeouts=False, hedge=False, hedge_quantile=0.95, hedge_min_samples=20,
+                 hedge_min_delay=0.05):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retry_read_timeouts = retry_read_timeouts
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+
+    def should_retry(self, error):
+        """判断错误是否按本策略重试"""
+        if not is_retryable(error):
+            return False
+        return self.retry_read_timeouts or not is_read_timeout(error)
+
+    def backoff(self, attempt, error=None):
+        """第 attempt 次重试前的等待秒数，优先遵循服务端返回的 Retry-After"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter：在 [0, base * 2^n] 内均匀取值，避免大量客户端同时重试
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """
+    记录最近若干次成功请求的延迟，用于计算对冲等待时间
+    参数:
+        window: 保留的样本数
+    """
+
+    def __init__(self, window=256):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_retryable(error):
+    """判断错误是否值得重试"""
+    # 延迟导入，避免导入本模块时加载 openai
+    import httpx
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                          openai.InternalServerError)):
+        return True
+    # 读取流式响应时的超时和断连不经过 SDK 的请求封装，直接抛出 httpx 的异常
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def is_read_timeout(error):
+    """判断错误是否为请求发出后等待响应超时；连接超时和连接池等待超时时请求尚未发出，不算在内"""
+    import httpx
+    import openai
+
+    if isinstance(error, openai.APITimeoutError):
+        # SDK 把 httpx 的超时包装为 APITimeoutError，原始异常在 __cause__ 中
+        return not isinstance(error.__cause__, (httpx.ConnectTimeout, httpx.PoolTimeout))
+    return isinstance(error, httpx.ReadTimeout)
+
+
+def _deadline_passed(error, deadline_at):
+    """单次超时被截止时间截短后触发的超时，按超过截止时间处理"""
+    if deadline_at is None or time.monotonic() < deadline_at:
+        return False
+    import httpx
+    import openai
+
+    return isinstance(error, (openai.APITimeoutError, httpx.TimeoutException))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    为代码块内的所有模型调用设置一个共同的截止时间，例如把三次串行调用限制在 10 秒内：
+        with deadline(10):
+            process_user_message_ch(user_input, [])
+    """
+    at = time.monotonic() + seconds
+    current = _deadline_at.get()
+    token = _deadline_at.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline_at.reset(token)
+
+
+def resolve_deadline(policy):
+    """返回本次调用的绝对截止时间（time.monotonic()），取 deadline() 上下文与 policy.deadline 中较早者，None 表示不限制"""
+    at = _deadline_at.get()
+    if policy.deadline is not None:
+        own = time.monotonic() + policy.deadline
+        at = own if at is None else min(at, own)
+    return at
+
+
+def remaining_time(deadline_at):
+    """距截止时间的秒数，None 表示不限制；已超过截止时间时抛出 DeadlineExceeded"""
+    if deadline_at is None:
+        return None
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("调用超过截止时间")
+    return remaining
+
+
+def _attempt_timeout(policy, remaining):
+    if remaining is None:
+        return policy.attempt_timeout
+    return remaining if policy.attempt_timeout is None else min(policy.attempt_timeout, remaining)
+
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="openai-hedge")
+    return _hedge_executor
+
+
+def _hedge_delay(policy, tracker):
+    if not policy.hedge or tracker is None or len(tracker) < policy.hedge_min_samples:
+        return None
+    return max(policy.hedge_min_delay, tracker.quantile(policy.hedge_quantile))
+
+
+def _hedged_call(fn, timeout, hedge_after):
+    """先发一个请求，hedge_after 秒后仍未返回则再发一个，返回最先成功的结果"""
+    executor = _get_hedge_executor()
+    started = time.monotonic()
+    pending = {executor.submit(fn, timeout)}
+    done, _ = wait(pending, timeout=hedge_after)
+    if not done:
+        pending.add(executor.submit(fn, None if timeout is None else max(timeout - hedge_after, 0.001)))
+    first_error = None
+    while pending:
+        left = None if timeout is None else timeout - (time.monotonic() - started)
+        if left is not None and left <= 0:
+            break
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            first_error = first_error or future.exception()
+        if not done:
+            break
+    if first_error is not None:
+        raise first_error
+    raise DeadlineExceeded("调用超过截止时间")
+
+
+def call_with_policy(fn, policy, tracker=None):
+    """
+    按策略执行 fn(timeout)，timeout 为本次请求可用的秒数
+    参数:
+        fn: 发起一次请求的函数
+        policy: RetryPolicy
+        tracker: LatencyTracker，用于记录延迟和计算对冲等待时间
+    """
+    deadline_at = resolve_deadline(policy)
+    attempt = 0
+    while True:
+        timeout = _attempt_timeout(policy, remaining_time(deadline_at))
+        started = time.monotonic()
+        try:
+            hedge_after = _hedge_delay(policy, tracker)
+            if hedge_after is not None and (timeout is None or hedge_after < timeout):
+                result = _hedged_call(fn, timeout, hedge_after)
+            else:
+                result = fn(timeout)
+        except Exception as e:
+            if _deadline_passed(e, deadline_at):
+                raise DeadlineExceeded("调用超过截止时间") from e
+            if isinstance(e, DeadlineExceeded) or not policy.should_retry(e) or attempt >= policy.max_retries:
+                raise
+            delay = policy.backoff(attempt, e)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                raise DeadlineExceeded("调用超过截止时间") from e
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if tracker is not None:
+            tracker.record(time.monotonic() - started)
+        return result
+
+
+async def _ahedged_call(fn, timeout, hedge_after):
+    import asyncio
+
+    tasks = {asyncio.ensure_future(fn(timeout))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.add(asyncio.ensure_future(fn(None if timeout is None else max(timeout - hedge_after, 0.001))))
+        first_error = None
+        pending = set(tasks)
+        loop = asyncio.get_running_loop()
+        ends_at = None if timeout is None else loop.time() + timeout - hedge_after
+        while pending:
+            left = None if ends_at is None else ends_at - loop.time()
+            if left is not None and left <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                first_error = first_error or task.exception()
+            if not done:
+                break
+        if first_error is not None:
+            raise first_error
+        raise DeadlineExceeded("调用超过截止时间")
+    finally:
+        # 异步版本可以取消输掉的请求
+        for task in tasks:
+            task.cancel()
+
+
+async def acall_with_policy(fn, policy, tracker=None):
+    """call_with_policy 的异步版本，fn(timeout) 为协程函数"""
+    import asyncio
+
+    deadline_at = resolve_deadline(policy)
+    attempt = 0
+    while True:
+        timeout = _attempt_timeout(policy, remaining_time(deadline_at))
+        started = time.monotonic()
+        try:
+            hedge_after = _hedge_delay(policy, tracker)
+            if hedge_after is not None and (timeout is None or hedge_after < timeout):
+                result = await _ahedged_call(fn, timeout, hedge_after)
+            else:
+                result = await fn(timeout)
+        except Exception as e:
+            if _deadline_passed(e, deadline_at):
+                raise DeadlineExceeded("调用超过截止时间") from e
+            if isinstance(e, DeadlineExceeded) or not policy.should_retry(e) or attempt >= policy.max_retries:
+                raise
+            delay = policy.backoff(attempt, e)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                raise DeadlineExceeded("调用超过截止时间") from e
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if tracker is not None:
+            tracker.record(time.monotonic() - started)
+        return result
@@ -0,0 +1,134 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 16:20
+@Version: v1.0
+@Description: 语义答案缓存
+    精确匹配的缓存无法命中换了说法的问题（"smartx pro phone 多少钱" 与 "SmartX ProPhone 价格"）。
+    语义缓存对问题做 Embedding，在向量矩阵中查找最相似的已缓存问题，相似度超过阈值即直接返回缓存的答案。
+    条目按 TTL 过期、按 LRU 淘汰；数据源（商品目录、向量数据库）的版本变化时整个缓存失效。
+    措辞几乎相同的问题可能问的是不同的商品（"CineView 4K TV 多少钱" 与 "CineView 8K TV 多少钱"），
+    写入时可以附带 key（如问题中提到的商品和类别），查找时只有 key 相同的条目才能命中。
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    参数:
+        embed_fn: 将文本转换为向量的函数，如 tool.get_embedding 或 OpenAIEmbeddings().embed_query
+        threshold: 余弦相似度阈值，达到该值才视为命中
+        max_entries: 最多缓存的问题数
+        ttl: 条目的存活秒数，None 表示不过期
+    """
+
+    def __init__(self, embed_fn, threshold=0.92, max_entries=1000, ttl=3600):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # 向量矩阵在第一次写入时按维度分配，行向量均已归一化，点积即余弦相似度
+        self._matrix = None
+        self._questions = [None] * self.max_entries
+        self._keys = [None] * self.max_entries
+        self._values = [None] * self.max_entries
+        self._created_at = np.zeros(self.max_entries)
+        self._accessed_at = np.zeros(self.max_entries)
+        self._used = np.zeros(self.max_entries, dtype=bool)
+
+    def embed(self, question):
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version):
+        if version is not None and version != self.version:
+            self._reset()
+            self.version = version
+
+    def lookup(self, question, version=None, key=None):
+        """
+        查找语义相近的已缓存问题
+        参数:
+            question: 用户问题
+            version: 数据源版本，与缓存中的版本不同时清空缓存
+            key: 条目的附加键，只有写入时 key 相同的条目才能命中
+        返回:
+            (value, embedding)：未命中时 value 为 None；embedding 可以传给 store，避免重复计算
+        """
+        embedding = self.embed(question)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None or not self._used.any():
+                self.misses += 1
+                return None, embedding
+            if self.ttl is not None:
+                self._used &= self._created_at >= now - self.ttl
+            scores = self._matrix @ embedding
+            scores[~self._used] = -1.0
+            # 超过阈值的条目按相似度从高到低检查 key，取第一个 key 相同的条目
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for index in candidates[np.argsort(-scores[candidates])]:
+                if self._keys[index] == key:
+                    self._accessed_at[index] = now
+                    self.hits += 1
+                    return self._values[index], embedding
+            self.misses += 1
+            return None, embedding
+
+    def store(self, question, value, embedding=None, version=None, key=None):
+        """
+        写入缓存，满了之后优先淘汰过期条目，其次淘汰最久未访问的条目
+        参数:
+            question: 用户问题
+            value: 缓存的答案，可以是任意对象
+            embedding: lookup 返回的向量，None 时重新计算
+            version: 数据源版本
+            key: 条目的附加键，需可用 == 比较
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            if self.ttl is not None:
+                self._used &= self._created_at >= now - self.ttl
+            free = np.flatnonzero(~self._used)
+            if free.size:
+                index = int(free[0])
+            else:
+                index = int(np.argmin(self._accessed_at))
+            self._matrix[index] = embedding
+            self._questions[index] = question
+            self._keys[index] = key
+            self._values[index] = value
+            self._created_at[index] = self._accessed_at[index] = now
+            self._used[index] = True
+
+    def invalidate(self, version=None):
+        """清空缓存，可同时设置新的数据源版本"""
+        with self._lock:
+            self._reset()
+            self.version = version
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': int(self._used.sum()),
+            'version': self.version,
+        }
@@ -0,0 +1,111 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 15:40
+@Version: v1.0
+@Description: 在途请求合并（single-flight）
+    同一时刻多个调用方发起完全相同的确定性请求时，只有第一个调用方（leader）真正访问上游，
+    其余调用方（follower）等待并共享它的结果或异常。
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    按键合并并发调用，同时统计合并效果：
+        executed: 真正执行的次数
+        coalesced: 被合并、直接共享结果的次数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        执行 fn()，若相同 key 的调用正在进行，则等待并返回它的结果
+        参数:
+            key: 请求的键，相同键视为相同请求
+            fn: 无参函数
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, fn):
+        """
+        do 的异步版本，fn 为无参协程函数；只合并同一事件循环内的调用
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        scoped_key = (id(loop), key)
+        with self._lock:
+            future = self._async_calls.get(scoped_key)
+            leader = future is None
+            if leader:
+                future = self._async_calls[scoped_key] = loop.create_future()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            # shield：某个 follower 被取消时不影响其他等待者
+            return await asyncio.shield(future)
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有 follower 时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[scoped_key]
+
+    def stats(self):
+        """
+        返回:
+            包含 executed、coalesced、coalesce_rate、in_flight 的字典
+        """
+        with self._lock:
+            in_flight = len(self._calls) + len(self._async_calls)
+        total = self.executed + self.coalesced
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'coalesce_rate': self.coalesced / total if total else 0.0,
+            'in_flight': in_flight,
+        }
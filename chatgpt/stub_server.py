@@ -0,0 +1,354 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 18:10
+@Version: v1.0
+@Description: 本地 OpenAI 兼容桩服务
+    实现 tool.py、langchain_openai.ChatOpenAI、OpenAIEmbeddings 用到的端点：
+        POST /v1/chat/completions（支持 stream 与 stream_options.include_usage）
+        POST /v1/embeddings（基于哈希的确定性向量，支持 float 与 base64 编码）
+        POST /v1/moderations、GET /v1/models、GET /stats
+    延迟分布、吞吐上限、429 与 5xx 比例均可配置。把 OPENAI_BASE_URL 指向它，即可在没有网络的机器上压测整个项目：
+
+    python -m chatgpt.stub_server --port 8900 --latency lognormal:-2.5,0.5 --max-rps 50
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=sk-stub python end_to_end_chatbot.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chatgpt.token_count import count_message_tokens, count_text_tokens
+
+DEFAULT_REPLY = "这是来自本地桩服务的模拟回复，用于压测与延迟基准。Y"
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布，单位为秒：
+        fixed:0.05            固定延迟
+        uniform:0.02,0.2      均匀分布
+        normal:0.1,0.02       正态分布（截断到 0 以上）
+        lognormal:-2.5,0.5    对数正态分布，参数为 ln(秒) 的均值和标准差
+    返回:
+        无参函数，每次调用返回一个延迟样本
+    """
+    if not spec:
+        return lambda: 0.0
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"未知的延迟分布：{spec}")
+
+
+def hash_embedding(text, dimensions=1536):
+    """
+    基于哈希的确定性向量：把字符二元组和单词哈希到固定维度（特征哈希），再归一化。
+    相同文本得到相同向量，字面相近的文本相似度也较高，适合压测语义缓存与检索
+    参数:
+        text: 文本，或 token id 列表（OpenAIEmbeddings 默认发送 token id）
+        dimensions: 向量维度
+    """
+    if isinstance(text, list):
+        features = [str(t) for t in text]
+        features += [f"{a} {b}" for a, b in zip(features, features[1:])]
+    else:
+        normalized = re.sub(r"\s+", "", text.lower())
+        features = list(normalized) + [normalized[i:i + 2] for i in range(len(normalized) - 1)]
+        features += re.findall(r"\w+", text.lower())
+    vector = [0.0] * dimensions
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class StubConfig:
+    """
+    参数:
+        latency: 非流式请求的延迟分布，见 parse_latency
+        first_token_latency: 流式请求首个分块前的延迟分布，默认与 latency 相同
+        token_latency: 流式请求相邻分块之间的延迟（秒）
+        max_rps: 每秒最多处理的请求数，超过返回 429，0 表示不限制
+        max_concurrency: 最多同时处理的请求数，超过返回 429，0 表示不限制
+        rate_limit_ratio: 随机返回 429 的比例
+        error_ratio: 随机返回 500 的比例
+        reply: 聊天补全返回的内容
+        dimensions: 向量维度
+    """
+
+    def __init__(self, latency=None, first_token_latency=None, token_latency=0.0, max_rps=0, max_concurrency=0,
+                 rate_limit_ratio=0.0, error_ratio=0.0, reply=DEFAULT_REPLY, dimensions=1536):
+        self.latency = parse_latency(latency)
+        self.first_token_latency = parse_latency(first_token_latency) if first_token_latency else self.latency
+        self.token_latency = token_latency
+        self.max_rps = max_rps
+        self.max_concurrency = max_concurrency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.error_ratio = error_ratio
+        self.reply = reply
+        self.dimensions = dimensions
+
+
+class StubState:
+    """限流状态与计数"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.tokens = float(config.max_rps)
+        self.updated_at = time.monotonic()
+        self.counts = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'errors': 0}
+
+    def admit(self):
+        """返回 None 表示接受请求，否则返回 (状态码, 错误信息, Retry-After 秒数)"""
+        config = self.config
+        with self.lock:
+            self.counts['requests'] += 1
+            if config.max_rps:
+                now = time.monotonic()
+                self.tokens = min(float(config.max_rps), self.tokens + (now - self.updated_at) * config.max_rps)
+                self.updated_at = now
+                if self.tokens < 1:
+                    self.counts['rate_limited'] += 1
+                    return 429, "Rate limit reached for requests", (1 - self.tokens) / config.max_rps
+                self.tokens -= 1
+            if config.max_concurrency and self.in_flight >= config.max_concurrency:
+                self.counts['rate_limited'] += 1
+                return 429, "Too many concurrent requests", 1
+            if config.rate_limit_ratio and random.random() < config.rate_limit_ratio:
+                self.counts['rate_limited'] += 1
+                return 429, "Rate limit reached for requests", 1
+            if config.error_ratio and random.random() < config.error_ratio:
+                self.counts['errors'] += 1
+                return 500, "The server had an error while processing your request", None
+            self.in_flight += 1
+            return None
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.counts['ok'] += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭 Nagle 算法时 keep-alive 连接会被延迟确认拖慢约 40ms
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, retry_after=None):
+        headers = {"Retry-After": f"{retry_after:.3f}"} if retry_after is not None else None
+        error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": error_type}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": name, "object": "model", "created": 0, "owned_by": "stub"}
+                for name in ("gpt-4o-mini", "gpt-4o", "text-embedding-3-small")
+            ]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.state.lock:
+                self._send_json(200, dict(self.state.counts, in_flight=self.state.in_flight))
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.rstrip("/")
+        handlers = {
+            "/chat/completions": self._chat_completions,
+            "/embeddings": self._embeddings,
+            "/moderations": self._moderations,
+        }
+        handler = next((fn for suffix, fn in handlers.items() if path.endswith(suffix)), None)
+        if handler is None:
+            self._send_error(404, f"Unknown path {self.path}")
+            return
+        rejected = self.state.admit()
+        if rejected is not None:
+            self._send_error(*rejected)
+            return
+        try:
+            handler(request)
+        finally:
+            self.state.release()
+
+    def _chat_completions(self, request):
+        config = self.state.config
+        model = request.get("model", "gpt-4o-mini")
+        prompt_tokens = count_message_tokens(request.get("messages", []), model)
+        reply = config.reply
+        if request.get("max_tokens"):
+            reply = reply[:max(1, request["max_tokens"])]
+        completion_tokens = count_text_tokens(reply, model)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        if not request.get("stream"):
+            time.sleep(config.latency())
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                             "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_chunk(choices, chunk_usage=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": choices}
+            if chunk_usage is not None:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(config.first_token_latency())
+        send_chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        # 每 4 个字符一个分块，近似模拟逐 token 输出
+        for i in range(0, len(reply), 4):
+            if i and config.token_latency:
+                time.sleep(config.token_latency)
+            send_chunk([{"index": 0, "delta": {"content": reply[i:i + 4]}, "finish_reason": None}])
+        send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_chunk([], usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, request):
+        config = self.state.config
+        inputs = request.get("input", [])
+        # 单个字符串或单个 token id 列表都视为一条输入
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = request.get("dimensions") or config.dimensions
+        data = []
+        prompt_tokens = 0
+        for index, text in enumerate(inputs):
+            vector = hash_embedding(text, dimensions)
+            prompt_tokens += len(text) if isinstance(text, list) else count_text_tokens(text)
+            if request.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        time.sleep(config.latency())
+        self._send_json(200, {
+            "object": "list", "data": data, "model": request.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    def _moderations(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.state.config.latency())
+        categories = ["harassment", "hate", "self-harm", "sexual", "violence"]
+        self._send_json(200, {
+            "id": f"modr-{uuid.uuid4().hex[:24]}", "model": request.get("model", "omni-moderation-latest"),
+            "results": [{
+                "flagged": False,
+                "categories": {name: False for name in categories},
+                "category_scores": {name: 0.0 for name in categories},
+            } for _ in inputs],
+        })
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    """
+    创建桩服务（未启动）
+    返回:
+        (server, base_url)
+    """
+    config = config or StubConfig()
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"state": StubState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """
+    在后台线程启动桩服务，参数同 StubConfig
+    返回:
+        (server, base_url)，用完后调用 server.shutdown()
+    """
+    server, base_url = make_server(host, port, StubConfig(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900, help="0 表示随机端口")
+    parser.add_argument("--latency", default=None, help="如 fixed:0.05、uniform:0.02,0.2、lognormal:-2.5,0.5")
+    parser.add_argument("--first-token-latency", default=None, help="流式首个分块前的延迟分布")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="流式分块间隔（秒）")
+    parser.add_argument("--max-rps", type=float, default=0)
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--error-ratio", type=float, default=0.0)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency, first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+        max_rps=args.max_rps, max_concurrency=args.max_concurrency, rate_limit_ratio=args.rate_limit_ratio,
+        error_ratio=args.error_ratio, reply=args.reply, dimensions=args.dimensions,
+    )
+    server, base_url = make_server(args.host, args.port, config)
+    # 第一行输出服务地址，方便脚本解析随机端口
+    print(base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-18 10:40
+@Version: v1.0
+@Description: 本地 token 计数
+    安装了 tiktoken 时使用模型对应的分词器精确计数，否则按字符估算：
+    中文一般一个字对应一个 token，英文一般 4 个字符对应一个 token。
+    tiktoken 在第一次计数时才导入，导入 tool.py 不会加载分词器。
+"""
+from functools import lru_cache
+
+# 每条消息的格式开销（role、分隔符等），以及回复的引导 token
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:  # tiktoken 为可选依赖
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def uses_tiktoken(model="gpt-4o-mini"):
+    """是否使用 tiktoken 精确计数，未安装时为 False（按字符估算）"""
+    return _get_encoding(model) is not None
+
+
+def _estimate_tokens(text):
+    # CJK 统一表意文字、CJK 标点和全角字符
+    cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff' or '\u3000' <= ch <= '\u303f' or '\uff00' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_text_tokens(text, model="gpt-4o-mini"):
+    """
+    计算一段文本的 token 数
+    参数:
+        text: 文本
+        model: 模型名称，用于选择分词器
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """
+    计算消息列表作为 prompt 时的 token 数
+    参数:
+        messages: 消息列表，每个消息都是包含 role 和 content 的字典
+        model: 模型名称
+    """
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_text_tokens(message.get('content') or "", model)
+    return total
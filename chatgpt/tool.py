@@ -4,38 +4,770 @@
 @Version: v1.0
 @Description: openai 工具
 """
-from openai import OpenAI
-from chatgpt.phase01.load_env import get_openai_api_key
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-get_openai_api_key()
+from chatgpt import metrics
+from chatgpt.phase01.load_env import get_openai_api_key, load_env
+from chatgpt.cache import CompletionCache, make_cache_key
+from chatgpt.rate_limit import TokenBucketLimiter
+from chatgpt.singleflight import SingleFlight
+from chatgpt.resilience import (LatencyTracker, RetryPolicy, acall_with_policy, call_with_policy, deadline, is_retryable,
+                                 remaining_time, resolve_deadline)
+from chatgpt.token_count import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, count_message_tokens, count_text_tokens
 
-client = OpenAI()
+# 导入本模块时不加载 .env、不导入 openai、也不创建客户端，首次调用模型时才初始化，
+# 这样不调用模型的工作进程可以快速导入，缺少 OPENAI_API_KEY 时也不会在导入阶段报错
+_settings_lock = threading.RLock()
+_settings_loaded = False
+_client_lock = threading.Lock()
+_client = None
+_async_client = None
 
+# 异步调用的全局并发上限，同一事件循环内共享；可通过环境变量 OPENAI_ASYNC_CONCURRENCY 调整
+_async_concurrency = 64
+_async_semaphores = weakref.WeakKeyDictionary()
 
-def get_completion(prompt, model="gpt-4o-mini", temperature=0):
-    # 调用 OpenAI 的ChatCompletion 端点
-    response = client.chat.completions.create(
-        # 所选模型的ID，如：gpt-4、gpt-3.5-turbo等。注意：不是所有可用的模型都与openai.ChatCompletion兼容
-        model=model,
-        # 表示对话的消息对象数组。包含两个属性role（可能的值有：system、user、assistant）和content（包含对话消息的字符串）
-        messages=[
-            {"role": "user", "content": prompt},
-        ],
-        temperature= temperature,
+# 补全缓存，默认关闭；设置环境变量 OPENAI_CACHE_PATH 或调用 enable_completion_cache 开启
+_completion_cache = None
+
+
+def enable_completion_cache(path=None, max_entries=100_000, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600):
+    """
+    开启持久化补全缓存，只有 temperature=0 的确定性请求会被缓存
+    参数:
+        path: SQLite 文件路径，默认读取环境变量 OPENAI_CACHE_PATH，否则为 ~/.cache/aigc/completions.sqlite3
+        max_entries: 最多保留的条目数
+        max_bytes: 最多保留的内容字节数
+        max_age: 条目的最长存活时间（秒）
+    返回:
+        CompletionCache 实例
+    """
+    global _completion_cache
+    _ensure_settings()
+    if path is None:
+        path = os.environ.get("OPENAI_CACHE_PATH") or os.path.expanduser("~/.cache/aigc/completions.sqlite3")
+    _completion_cache = CompletionCache(path, max_entries=max_entries, max_bytes=max_bytes, max_age=max_age)
+    return _completion_cache
+
+
+def disable_completion_cache():
+    global _completion_cache
+    if _completion_cache is not None:
+        _completion_cache.close()
+    _completion_cache = None
+
+
+def get_completion_cache_stats():
+    """返回缓存的命中/未命中计数，未开启缓存时返回 None"""
+    return _completion_cache.stats() if _completion_cache is not None else None
+
+
+# 客户端限流，默认关闭；设置环境变量 OPENAI_RPM / OPENAI_TPM 或调用 set_rate_limiter 开启
+_rate_limiter = None
+
+
+def set_rate_limiter(limiter=None, rpm=None, tpm=None, state_file=None):
+    """
+    设置所有调用共享的 RPM/TPM 限流器，额度不足时调用方阻塞等待
+    参数:
+        limiter: 已构造的 TokenBucketLimiter，传入时忽略其余参数
+        rpm: 每分钟最多请求数
+        tpm: 每分钟最多 token 数
+        state_file: 多进程共享状态文件路径，默认只在本进程内共享
+    返回:
+        当前生效的限流器，rpm 与 tpm 都未指定时关闭限流并返回 None
+    """
+    global _rate_limiter
+    _ensure_settings()
+    if limiter is None and (rpm or tpm):
+        limiter = TokenBucketLimiter(rpm=rpm, tpm=tpm, state_file=state_file)
+    _rate_limiter = limiter
+    return _rate_limiter
+
+
+logger = logging.getLogger(__name__)
+
+# HTTP 连接池配置：所有请求共享同一个连接池，复用 keep-alive 连接，避免频繁重新建立到代理的 TLS 连接
+_http_pool_options = {
+    'max_connections': 100,
+    'max_keepalive_connections': 20,
+    'keepalive_expiry': 30.0,
+    'http2': False,
+    'connect_timeout': 5.0,
+    'read_timeout': 600.0,
+}
+_http_client = None
+_async_http_client = None
+# 录制/回放，由环境变量 OPENAI_CASSETTE_MODE 开启，见 chatgpt/cassette.py
+_cassette = None
+
+
+def configure_http_pool(**options):
+    """
+    调整共享 HTTP 连接池，已创建的客户端会被关闭并在下次调用时按新配置重建
+    参数:
+        max_connections: 最大连接数，应不小于同时在途的请求数
+        max_keepalive_connections: 最多保持的空闲 keep-alive 连接数
+        keepalive_expiry: 空闲连接保持的秒数
+        http2: 是否启用 HTTP/2（需要安装 h2：pip install httpx[http2]）
+        connect_timeout: 建立连接的超时秒数
+        read_timeout: 读取响应的超时秒数，默认与 OpenAI SDK 一致（600 秒），非流式补全要等整段回答生成完
+    返回:
+        当前生效的配置字典
+    """
+    global _client, _async_client, _http_client, _async_http_client
+    _ensure_settings()
+    unknown = set(options) - set(_http_pool_options)
+    if unknown:
+        raise TypeError(f"未知的连接池参数：{', '.join(sorted(unknown))}")
+    with _client_lock:
+        _http_pool_options.update(options)
+        if _http_client is not None:
+            _http_client.close()
+        # 异步连接池只能在事件循环中关闭，这里直接丢弃，由垃圾回收释放
+        _client = _async_client = _http_client = _async_http_client = None
+        if _endpoint_pool is not None:
+            for endpoint in _endpoint_pool.endpoints:
+                endpoint.client = endpoint.async_client = None
+    return dict(_http_pool_options)
+
+
+def _http_client_kwargs(asynchronous=False):
+    import httpx
+
+    options = _http_pool_options
+    http2 = options['http2']
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("未安装 h2，HTTP/2 不可用，回退到 HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=options['max_connections'],
+        max_keepalive_connections=options['max_keepalive_connections'],
+        keepalive_expiry=options['keepalive_expiry'],
     )
-    return response.choices[0].message.content
+    timeout = httpx.Timeout(options['read_timeout'], connect=options['connect_timeout'])
+    if _cassette is None:
+        return {'limits': limits, 'timeout': timeout, 'http2': http2}
+    # 开启录制/回放时，由 cassette 传输层包装真实的连接池
+    from chatgpt.cassette import AsyncCassetteTransport, CassetteTransport
+    if asynchronous:
+        transport = AsyncCassetteTransport(_cassette, httpx.AsyncHTTPTransport(limits=limits, http2=http2))
+    else:
+        transport = CassetteTransport(_cassette, httpx.HTTPTransport(limits=limits, http2=http2))
+    return {'transport': transport, 'timeout': timeout}
 
 
-def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0):
-    # 调用 OpenAI 的ChatCompletion 端点
-    response = client.chat.completions.create(
+def get_http_client():
+    """返回共享的同步 HTTP 连接池（httpx.Client），也可以传给 LangChain 的 ChatOpenAI、OpenAIEmbeddings"""
+    global _http_client
+    if _http_client is None:
+        _ensure_settings()
+        with _client_lock:
+            if _http_client is None:
+                from openai import DefaultHttpxClient
+                _http_client = DefaultHttpxClient(**_http_client_kwargs())
+    return _http_client
+
+
+def get_async_http_client():
+    """返回共享的异步 HTTP 连接池（httpx.AsyncClient）"""
+    global _async_http_client
+    if _async_http_client is None:
+        _ensure_settings()
+        with _client_lock:
+            if _async_http_client is None:
+                from openai import DefaultAsyncHttpxClient
+                _async_http_client = DefaultAsyncHttpxClient(**_http_client_kwargs(asynchronous=True))
+    return _async_http_client
+
+
+def _request_timeout(timeout):
+    """单次请求的超时：连接超时沿用连接池配置，读取超时不超过剩余的时间预算"""
+    if timeout is None:
+        return None
+    import httpx
+
+    options = _http_pool_options
+    return httpx.Timeout(min(timeout, options['read_timeout']), connect=min(timeout, options['connect_timeout']))
+
+
+# 重试、截止时间与对冲策略；延迟样本用于计算对冲等待时间
+_retry_policy = RetryPolicy()
+_latency_tracker = LatencyTracker()
+
+
+def _ensure_settings():
+    """
+    首次使用时加载 .env 并应用环境变量中的配置（线程安全，只执行一次）
+    支持的环境变量：OPENAI_CACHE_PATH、OPENAI_RPM、OPENAI_TPM、OPENAI_RATE_LIMIT_STATE、
+    OPENAI_MAX_RETRIES、OPENAI_DEADLINE、OPENAI_HEDGE、OPENAI_ASYNC_CONCURRENCY、
+    OPENAI_MAX_CONNECTIONS、OPENAI_MAX_KEEPALIVE_CONNECTIONS、OPENAI_HTTP2、OPENAI_CONNECT_TIMEOUT、OPENAI_READ_TIMEOUT、
+    OPENAI_CASSETTE_MODE、OPENAI_CASSETTE、OPENAI_CASSETTE_LATENCY、OPENAI_METRICS_PORT、OPENAI_METRICS_JSON、
+    OPENAI_PROMPT_BUDGET、OPENAI_ENDPOINTS、OPENAI_ENDPOINT_STRATEGY
+    """
+    global _settings_loaded, _async_concurrency, _cassette, _prompt_budget, _endpoint_pool
+    if _settings_loaded:
+        return
+    with _settings_lock:
+        if _settings_loaded:
+            return
+        # 先置位，下面的 enable_completion_cache 等函数会再次进入本函数
+        _settings_loaded = True
+        load_env()
+        env = os.environ
+        if env.get("OPENAI_CACHE_PATH") and _completion_cache is None:
+            enable_completion_cache()
+        if (env.get("OPENAI_RPM") or env.get("OPENAI_TPM")) and _rate_limiter is None:
+            set_rate_limiter(
+                rpm=int(env.get("OPENAI_RPM") or 0) or None,
+                tpm=int(env.get("OPENAI_TPM") or 0) or None,
+                state_file=env.get("OPENAI_RATE_LIMIT_STATE") or None,
+            )
+        if env.get("OPENAI_MAX_RETRIES"):
+            _retry_policy.max_retries = int(env["OPENAI_MAX_RETRIES"])
+        if env.get("OPENAI_DEADLINE"):
+            _retry_policy.deadline = float(env["OPENAI_DEADLINE"])
+        if env.get("OPENAI_HEDGE"):
+            _retry_policy.hedge = env["OPENAI_HEDGE"].lower() in ("1", "true", "yes")
+        if env.get("OPENAI_ASYNC_CONCURRENCY"):
+            _async_concurrency = int(env["OPENAI_ASYNC_CONCURRENCY"])
+        if env.get("OPENAI_MAX_CONNECTIONS"):
+            _http_pool_options['max_connections'] = int(env["OPENAI_MAX_CONNECTIONS"])
+        if env.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS"):
+            _http_pool_options['max_keepalive_connections'] = int(env["OPENAI_MAX_KEEPALIVE_CONNECTIONS"])
+        if env.get("OPENAI_HTTP2"):
+            _http_pool_options['http2'] = env["OPENAI_HTTP2"].lower() in ("1", "true", "yes")
+        if env.get("OPENAI_CONNECT_TIMEOUT"):
+            _http_pool_options['connect_timeout'] = float(env["OPENAI_CONNECT_TIMEOUT"])
+        if env.get("OPENAI_READ_TIMEOUT"):
+            _http_pool_options['read_timeout'] = float(env["OPENAI_READ_TIMEOUT"])
+        if env.get("OPENAI_CASSETTE_MODE"):
+            from chatgpt.cassette import cassette_from_env
+            _cassette = cassette_from_env()
+        if env.get("OPENAI_PROMPT_BUDGET"):
+            _prompt_budget = int(env["OPENAI_PROMPT_BUDGET"])
+        if env.get("OPENAI_ENDPOINTS") and _endpoint_pool is None:
+            from chatgpt.endpoints import endpoint_pool_from_env
+            _endpoint_pool = endpoint_pool_from_env()
+        metrics.configure_from_env()
+
+
+def get_client():
+    """返回共享的 OpenAI 客户端，首次调用时创建（线程安全）"""
+    global _client
+    if _client is None:
+        http_client = get_http_client()
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                # 重试由 _retry_policy 统一负责，关闭 SDK 自带的重试，避免重试次数相乘
+                _client = OpenAI(api_key=get_openai_api_key(), max_retries=0, http_client=http_client)
+    return _client
+
+
+def get_async_client():
+    """返回共享的 AsyncOpenAI 客户端，首次调用时创建（线程安全）"""
+    global _async_client
+    if _async_client is None:
+        http_client = get_async_http_client()
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(api_key=get_openai_api_key(), max_retries=0, http_client=http_client)
+    return _async_client
+
+
+# 多端点负载均衡，默认关闭（只使用 OPENAI_BASE_URL）；设置环境变量 OPENAI_ENDPOINTS 或调用 configure_endpoints 开启
+_endpoint_pool = None
+
+
+def configure_endpoints(endpoints=None, strategy="least_outstanding", **options):
+    """
+    在多个 OpenAI 兼容端点之间分配请求，见 chatgpt/endpoints.py
+    参数:
+        endpoints: 端点列表，每项为 URL、{'base_url', 'weight', 'api_key'} 字典或 Endpoint；None 表示关闭
+        strategy: least_outstanding 或 ewma
+        options: EndpointPool 的其余参数，如 failure_threshold、cooldown、ewma_alpha、tie_tolerance
+    返回:
+        当前生效的 EndpointPool
+    """
+    global _endpoint_pool
+    _ensure_settings()
+    if not endpoints:
+        _endpoint_pool = None
+        return None
+    from chatgpt.endpoints import EndpointPool
+    _endpoint_pool = EndpointPool(endpoints, strategy=strategy, **options)
+    return _endpoint_pool
+
+
+def get_endpoint_stats():
+    """返回每个端点的状态与负载，未开启多端点时返回 None"""
+    return _endpoint_pool.stats() if _endpoint_pool is not None else None
+
+
+def _endpoint_client(endpoint, asynchronous=False):
+    """返回端点专属的客户端，所有端点共享同一个 HTTP 连接池"""
+    client = endpoint.async_client if asynchronous else endpoint.client
+    if client is not None:
+        return client
+    http_client = get_async_http_client() if asynchronous else get_http_client()
+    with _client_lock:
+        from openai import AsyncOpenAI, OpenAI
+        api_key = endpoint.api_key or get_openai_api_key()
+        if asynchronous:
+            if endpoint.async_client is None:
+                endpoint.async_client = AsyncOpenAI(api_key=api_key, base_url=endpoint.base_url, max_retries=0,
+                                                    http_client=http_client)
+            return endpoint.async_client
+        if endpoint.client is None:
+            endpoint.client = OpenAI(api_key=api_key, base_url=endpoint.base_url, max_retries=0,
+                                     http_client=http_client)
+        return endpoint.client
+
+
+def _release_endpoint(pool, endpoint, started, error=None):
+    if error is None:
+        pool.release(endpoint, time.perf_counter() - started, ok=True)
+    elif isinstance(error, Exception):
+        # 只有连接错误、超时、429、5xx 计入端点的失败，参数错误等与端点健康无关
+        pool.release(endpoint, time.perf_counter() - started, ok=False if is_retryable(error) else None)
+    else:
+        # 被取消（对冲请求的落败方、生成器被提前关闭）
+        pool.release(endpoint, None)
+
+
+@contextlib.contextmanager
+def _routed_client():
+    """为一次请求选择客户端：开启多端点时按负载均衡策略选择端点，并在结束后反馈结果"""
+    pool = _endpoint_pool
+    if pool is None:
+        yield get_client()
+        return
+    endpoint = pool.acquire()
+    started = time.perf_counter()
+    try:
+        yield _endpoint_client(endpoint)
+    except BaseException as e:
+        _release_endpoint(pool, endpoint, started, e)
+        raise
+    _release_endpoint(pool, endpoint, started)
+
+
+@contextlib.asynccontextmanager
+async def _arouted_client():
+    pool = _endpoint_pool
+    if pool is None:
+        yield get_async_client()
+        return
+    endpoint = pool.acquire()
+    started = time.perf_counter()
+    try:
+        yield _endpoint_client(endpoint, asynchronous=True)
+    except BaseException as e:
+        _release_endpoint(pool, endpoint, started, e)
+        raise
+    _release_endpoint(pool, endpoint, started)
+
+
+def __getattr__(name):
+    # 兼容旧代码中的 tool.client / tool.async_client
+    if name == "client":
+        return get_client()
+    if name == "async_client":
+        return get_async_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def configure_retries(**options):
+    """
+    调整重试策略，参数同 RetryPolicy，例如：
+        configure_retries(max_retries=4, deadline=15, hedge=True)
+    单次调用链的截止时间可以使用 deadline 上下文管理器：
+        with deadline(10):
+            ...
+    返回:
+        当前生效的 RetryPolicy
+    """
+    _ensure_settings()
+    for name, value in options.items():
+        if not hasattr(_retry_policy, name):
+            raise TypeError(f"未知的重试参数：{name}")
+        setattr(_retry_policy, name, value)
+    return _retry_policy
+
+
+def _estimate_request_tokens(messages, model, max_tokens):
+    # 服务端按 prompt token 数加上 max_tokens 计入 TPM
+    return count_message_tokens(messages, model) + (max_tokens or 0)
+
+
+def _usage_to_dict(usage):
+    return {
+        'prompt_tokens': usage.prompt_tokens,
+        'completion_tokens': usage.completion_tokens,
+        'total_tokens': usage.total_tokens,
+    }
+
+
+def set_async_concurrency(limit):
+    """
+    设置异步调用的并发上限（同一进程内所有 aget_* 调用共享）
+    参数:
+        limit: 同时在途的请求数
+    """
+    global _async_concurrency
+    _ensure_settings()
+    _async_concurrency = limit
+    _async_semaphores.clear()
+
+
+def _get_async_semaphore():
+    # 异步函数运行时 asyncio 必然已加载，在函数内导入不会拖慢本模块的导入
+    import asyncio
+
+    # asyncio.Semaphore 绑定到事件循环，因此按循环分别创建
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_async_concurrency)
+        _async_semaphores[loop] = semaphore
+    return semaphore
+
+
+def _build_params(messages, model, temperature, max_tokens):
+    params = {
         # 所选模型的ID，如：gpt-4、gpt-3.5-turbo等。注意：不是所有可用的模型都与openai.ChatCompletion兼容
-        model=model,
+        'model': model,
         # 表示对话的消息对象数组。包含两个属性role（可能的值有：system、user、assistant）和content（包含对话消息的字符串）
-        messages=messages,
-        temperature= temperature,
-    )
-    return response.choices[0].message.content
+        'messages': messages,
+        'temperature': temperature,
+    }
+    if max_tokens is not None:
+        params['max_tokens'] = max_tokens
+    return params
+
+
+def _request_key(messages, model, temperature, max_tokens):
+    """确定性请求（temperature=0）的内容寻址键，用于缓存和在途请求合并；其余请求返回 None"""
+    if temperature != 0:
+        return None
+    return make_cache_key(model, messages, temperature, max_tokens)
+
+
+def _cache_lookup(key):
+    """返回命中的 (content, token_dict)，未命中或未开启缓存时返回 None"""
+    cache = _completion_cache
+    if key is None or cache is None:
+        return None
+    return cache.get(key)
+
+
+def _cache_store(key, content, token_dict):
+    cache = _completion_cache
+    if key is not None and cache is not None:
+        cache.set(key, content, token_dict)
+
+
+# 在途请求合并：并发的相同确定性请求只访问一次上游，默认开启
+_singleflight = SingleFlight()
+_coalescing_enabled = True
+
+
+def set_request_coalescing(enabled):
+    """开启或关闭在途请求合并"""
+    global _coalescing_enabled
+    _coalescing_enabled = enabled
+
+
+def get_coalescing_stats():
+    """
+    返回:
+        executed: 真正发往上游的确定性请求数
+        coalesced: 被合并、直接共享其他请求结果的次数
+        coalesce_rate: coalesced 占比
+        in_flight: 当前在途的请求数
+    """
+    return _singleflight.stats()
+
+
+def get_metrics_summary():
+    """
+    返回:
+        按调用方（call_site）汇总的调用次数、token 数与估算费用，完整指标见 chatgpt.metrics
+    """
+    return metrics.registry.summary()
+
+
+# 全局提示词预算，默认不限制；设置环境变量 OPENAI_PROMPT_BUDGET 或调用 set_prompt_budget 开启后，
+# 每次请求前都会按预算裁剪消息列表
+_prompt_budget = None
+# 被裁剪消息的摘要，键为被裁剪消息前缀的滚动哈希，对话变长时只需增量摘要新裁剪的消息
+_summary_cache = OrderedDict()
+_summary_cache_size = 256
+_summary_lock = threading.Lock()
+SUMMARY_MAX_TOKENS = 300
+
+
+def set_prompt_budget(tokens):
+    """
+    设置全局提示词预算（token 数），None 表示不限制
+    """
+    global _prompt_budget
+    _ensure_settings()
+    _prompt_budget = tokens
+
+
+@lru_cache(maxsize=8192)
+def _message_tokens(content, model):
+    # 多轮对话每次都会重新计算历史消息，按内容缓存
+    return TOKENS_PER_MESSAGE + count_text_tokens(content, model)
+
+
+# 历史摘要的系统提示词，fit_messages_to_budget 与 ConversationState 共用
+SUMMARY_PROMPT = '请把下面的对话压缩为简洁的摘要，保留用户身份、需求、已确认的事实和决定，省略寒暄。只输出摘要。'
+
+
+def summarize_messages(messages, model="gpt-4o-mini", previous=None):
+    """
+        把一段对话压缩为摘要，历史裁剪（fit_messages_to_budget）和 ConversationState 都通过本函数生成摘要
+        参数:
+            messages: 需要摘要的消息列表
+            model: 生成摘要的模型
+            previous: 已有的摘要，新的消息在其基础上增量合并
+        返回:
+            摘要文本；调用失败时抛出异常，由调用方决定保留已有摘要还是丢弃消息
+    """
+    transcript = "\n".join(f"{m.get('role')}: {m.get('content') or ''}" for m in messages)
+    if previous:
+        transcript = f"已有摘要：{previous}\n新增对话：\n{transcript}"
+    summary, _ = _chat_completion([
+        {'role': 'system', 'content': SUMMARY_PROMPT},
+        {'role': 'user', 'content': transcript},
+    ], model, 0, SUMMARY_MAX_TOKENS)
+    return summary
+
+
+def _summarize_messages(dropped, model):
+    """返回被裁剪消息的摘要，优先复用缓存中最长前缀的摘要，只对新增的消息调用模型；失败时返回已有摘要或 None"""
+    digest = hashlib.sha256()
+    prefixes = []
+    for message in dropped:
+        digest.update(json.dumps([message.get('role'), message.get('content')], ensure_ascii=False).encode("utf-8"))
+        prefixes.append(digest.hexdigest())
+    base, done = None, 0
+    with _summary_lock:
+        for index in range(len(prefixes) - 1, -1, -1):
+            if prefixes[index] in _summary_cache:
+                _summary_cache.move_to_end(prefixes[index])
+                base, done = _summary_cache[prefixes[index]], index + 1
+                break
+    if done == len(dropped):
+        return base
+
+    try:
+        with metrics.call_site_scope("history_summary"):
+            summary = summarize_messages(dropped[done:], model, base)
+    except Exception:
+        logger.warning("历史消息摘要失败，直接丢弃较早的消息", exc_info=True)
+        return base
+    with _summary_lock:
+        _summary_cache[prefixes[-1]] = summary
+        while len(_summary_cache) > _summary_cache_size:
+            _summary_cache.popitem(last=False)
+    return summary
+
+
+def fit_messages_to_budget(messages, budget=None, model="gpt-4o-mini", keep_last=2, summarize=True):
+    """
+        按 token 预算组装消息列表：开头的 system 消息和最后 keep_last 条消息总是保留，
+        其余消息从新到旧依次放入，放不下的较早消息被丢弃，或替换为一条摘要（摘要会被缓存）
+        参数:
+            messages: 消息列表
+            budget: 提示词 token 预算，默认使用 set_prompt_budget 设置的全局预算，两者都未设置时原样返回
+            model: 模型名称，用于本地计数和生成摘要
+            keep_last: 总是保留的最近消息数
+            summarize: 是否为被丢弃的消息生成摘要
+        返回:
+            新的消息列表，不修改传入的列表
+    """
+    if budget is None:
+        budget = _prompt_budget
+    if budget is None:
+        return list(messages)
+    costs = [_message_tokens(m.get('content') or "", model) for m in messages]
+    if TOKENS_PER_REPLY + sum(costs) <= budget:
+        return list(messages)
+
+    head = 0
+    while head < len(messages) and messages[head].get('role') == 'system':
+        head += 1
+    tail = max(head, len(messages) - keep_last)
+    used = TOKENS_PER_REPLY + sum(costs[:head]) + sum(costs[tail:])
+    start = tail
+    while start > head and used + costs[start - 1] <= budget:
+        start -= 1
+        used += costs[start]
+    if start > head and summarize:
+        # 为摘要预留空间
+        reserve = SUMMARY_MAX_TOKENS + TOKENS_PER_MESSAGE
+        while start < tail and used + reserve > budget:
+            used -= costs[start]
+            start += 1
+
+    kept = list(messages[:head])
+    if start > head and summarize:
+        summary = _summarize_messages(messages[head:start], model)
+        if summary:
+            kept.append({'role': 'system', 'content': f"此前对话的摘要：{summary}"})
+    return kept + list(messages[start:])
+
+
+def _request_completion(params, timeout):
+    """发起一次 ChatCompletion 请求（受限流约束），返回 (content, token_dict)"""
+    limiter = _rate_limiter
+    estimated = 0
+    if limiter is not None:
+        estimated = _estimate_request_tokens(params['messages'], params['model'], params.get('max_tokens'))
+        limiter.acquire(estimated)
+    try:
+        # 调用 OpenAI 的ChatCompletion 端点
+        with _routed_client() as client:
+            response = client.chat.completions.create(timeout=_request_timeout(timeout), **params)
+    except Exception:
+        if limiter is not None:
+            limiter.reconcile(estimated, 0)
+        raise
+    if limiter is not None:
+        limiter.reconcile(estimated, response.usage.total_tokens)
+    return response.choices[0].message.content, _usage_to_dict(response.usage)
+
+
+async def _arequest_completion(params, timeout):
+    limiter = _rate_limiter
+    estimated = 0
+    async with _get_async_semaphore():
+        if limiter is not None:
+            estimated = _estimate_request_tokens(params['messages'], params['model'], params.get('max_tokens'))
+            await limiter.acquire_async(estimated)
+        try:
+            async with _arouted_client() as client:
+                response = await client.chat.completions.create(timeout=_request_timeout(timeout), **params)
+        except Exception:
+            if limiter is not None:
+                limiter.reconcile(estimated, 0)
+            raise
+    if limiter is not None:
+        limiter.reconcile(estimated, response.usage.total_tokens)
+    return response.choices[0].message.content, _usage_to_dict(response.usage)
+
+
+def _chat_completion(messages, model, temperature, max_tokens=None):
+    """
+    所有 ChatCompletion 调用的统一入口：缓存 → 重试/截止时间/对冲 → 限流 → 请求
+    返回:
+        content: 生成的回复内容。
+        token_dict: 包含'prompt_tokens'、'completion_tokens'和'total_tokens'的字典。
+    """
+    _ensure_settings()
+    started = time.perf_counter()
+    site = metrics.infer_call_site()
+    if _prompt_budget is not None:
+        messages = fit_messages_to_budget(messages, model=model)
+    key = _request_key(messages, model, temperature, max_tokens)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        metrics.record_since("chat", model, "cache_hit", started, site)
+        return cached
+    params = _build_params(messages, model, temperature, max_tokens)
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        content, token_dict = call_with_policy(
+            lambda timeout: _request_completion(params, timeout), _retry_policy, _latency_tracker
+        )
+        _cache_store(key, content, token_dict)
+        return content, token_dict
+
+    try:
+        if key is None or not _coalescing_enabled:
+            result = fetch()
+        else:
+            result = _singleflight.do(key, fetch)
+    except Exception:
+        metrics.record_since("chat", model, "error", started, site)
+        raise
+    # fetch 没有执行说明结果来自合并的在途请求，不重复计费
+    if fetched:
+        metrics.record_since("chat", model, "ok", started, site, result[1])
+    else:
+        metrics.record_since("chat", model, "coalesced", started, site)
+    return result
+
+
+async def _achat_completion(messages, model, temperature, max_tokens=None):
+    """_chat_completion 的异步版本，受全局并发上限约束"""
+    _ensure_settings()
+    started = time.perf_counter()
+    site = metrics.infer_call_site()
+    if _prompt_budget is not None:
+        import asyncio
+        # 生成摘要是同步调用，放到线程中执行，避免阻塞事件循环
+        messages = await asyncio.to_thread(fit_messages_to_budget, messages, model=model)
+    key = _request_key(messages, model, temperature, max_tokens)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        metrics.record_since("chat", model, "cache_hit", started, site)
+        return cached
+    params = _build_params(messages, model, temperature, max_tokens)
+    fetched = []
+
+    async def fetch():
+        fetched.append(True)
+        content, token_dict = await acall_with_policy(
+            lambda timeout: _arequest_completion(params, timeout), _retry_policy, _latency_tracker
+        )
+        _cache_store(key, content, token_dict)
+        return content, token_dict
+
+    try:
+        if key is None or not _coalescing_enabled:
+            result = await fetch()
+        else:
+            result = await _singleflight.ado(key, fetch)
+    except Exception:
+        metrics.record_since("chat", model, "error", started, site)
+        raise
+    if fetched:
+        metrics.record_since("chat", model, "ok", started, site, result[1])
+    else:
+        metrics.record_since("chat", model, "coalesced", started, site)
+    return result
+
+
+def get_completion(prompt, model="gpt-4o-mini", temperature=0):
+    content, _ = _chat_completion([{"role": "user", "content": prompt}], model, temperature)
+    return content
+
+
+def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0):
+    content, _ = _chat_completion(messages, model, temperature)
+    return content
 
 
 def get_completion_from_messages_tokens(messages, model="gpt-4o-mini", temperature=0, max_tokens = 500):
@@ -47,16 +779,8 @@ def get_completion_from_messages_tokens(messages, model="gpt-4o-mini", temperatu
         temperature: 这决定模型输出的随机程度，默认为0，表示输出将非常确定。增加温度会使输出更随机。
         max_tokens: 这决定模型输出的最大的 token 数。
     """
-    # 调用 OpenAI 的ChatCompletion 端点
-    response = client.chat.completions.create(
-        # 所选模型的ID，如：gpt-4、gpt-3.5-turbo等。注意：不是所有可用的模型都与openai.ChatCompletion兼容
-        model=model,
-        # 表示对话的消息对象数组。包含两个属性role（可能的值有：system、user、assistant）和content（包含对话消息的字符串）
-        messages=messages,
-        temperature= temperature,
-        max_tokens= max_tokens,
-    )
-    return response.choices[0].message.content
+    content, _ = _chat_completion(messages, model, temperature, max_tokens)
+    return content
 
 
 def get_completion_from_messages_tokens_count(messages, model="gpt-4o-mini", temperature=0, max_tokens = 500):
@@ -71,20 +795,264 @@ def get_completion_from_messages_tokens_count(messages, model="gpt-4o-mini", tem
             content: 生成的回复内容。
             token_dict: 包含'prompt_tokens'、'completion_tokens'和'total_tokens'的字典，分别
             表示提示的 token 数量、生成的回复的 token 数量和总的 token 数量。
+            开启缓存时，命中缓存会回放首次请求时的 token 用量。
     """
-    # 调用 OpenAI 的ChatCompletion 端点
-    response = client.chat.completions.create(
-        # 所选模型的ID，如：gpt-4、gpt-3.5-turbo等。注意：不是所有可用的模型都与openai.ChatCompletion兼容
-        model=model,
-        # 表示对话的消息对象数组。包含两个属性role（可能的值有：system、user、assistant）和content（包含对话消息的字符串）
-        messages=messages,
-        temperature= temperature,
-        max_tokens= max_tokens,
-    )
-    content = response.choices[0].message.content
-    token_dict = {
-        'prompt_tokens': response.usage.prompt_tokens,
-        'completion_tokens': response.usage.completion_tokens,
-        'total_tokens': response.usage.total_tokens,
-    }
-    return content, token_dict
+    return _chat_completion(messages, model, temperature, max_tokens)
+
+
+def get_completions_batch(prompts_or_message_lists, max_concurrency=8, model="gpt-4o-mini", temperature=0,
+                          max_tokens=None):
+    """
+        在有界线程池上批量调用模型，适合对大量评论做校对、情感或实体抽取
+        参数:
+            prompts_or_message_lists: 列表，每一项是一个 prompt 字符串或一个消息列表
+            max_concurrency: 同时在途的请求数
+            model: 调用的模型，默认为 gpt-4o-mini(ChatGPT)
+            temperature: 温度，默认为0
+            max_tokens: 输出的最大 token 数，默认不限制
+        返回:
+            results: 与输入顺序一致的列表，每项为 {'content', 'usage', 'error'}，失败项 content、usage 为 None，error 为异常对象
+            usage: 汇总字典，包含 'prompt_tokens'、'completion_tokens'、'total_tokens'、'succeeded'、'failed'
+    """
+    # 工作线程的调用栈里没有业务代码，在调用方线程推断 call_site
+    site = metrics.infer_call_site()
+
+    def run(item):
+        messages = [{"role": "user", "content": item}] if isinstance(item, str) else item
+        try:
+            with metrics.call_site_scope(site):
+                content, token_dict = _chat_completion(messages, model, temperature, max_tokens)
+            return {'content': content, 'usage': token_dict, 'error': None}
+        except Exception as e:
+            return {'content': None, 'usage': None, 'error': e}
+
+    items = list(prompts_or_message_lists)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items) or 1))) as executor:
+        # executor.map 按输入顺序返回结果
+        results = list(executor.map(run, items))
+
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'succeeded': 0, 'failed': 0}
+    for result in results:
+        if result['error'] is not None:
+            usage['failed'] += 1
+            continue
+        usage['succeeded'] += 1
+        for name in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            usage[name] += result['usage'][name]
+    return results, usage
+
+
+def get_embedding(text, model="text-embedding-3-small"):
+    """
+        调用 OpenAI 的 Embeddings 端点，返回文本的向量（浮点数列表）
+        参数:
+            text: 需要向量化的文本
+            model: 向量化模型，默认为 text-embedding-3-small
+    """
+    _ensure_settings()
+    started = time.perf_counter()
+    site = metrics.infer_call_site()
+    def request(timeout):
+        with _routed_client() as client:
+            return client.embeddings.create(model=model, input=text, timeout=_request_timeout(timeout))
+
+    try:
+        response = call_with_policy(request, _retry_policy)
+    except Exception:
+        metrics.record_since("embedding", model, "error", started, site)
+        raise
+    metrics.record_since("embedding", model, "ok", started, site, {'prompt_tokens': response.usage.prompt_tokens})
+    return response.data[0].embedding
+
+
+def get_moderation(text, model="omni-moderation-latest"):
+    """
+        调用 OpenAI 的 Moderation 端点，检查输入是否违反使用政策
+        参数:
+            text: 需要检查的文本
+            model: 审核模型，默认为 omni-moderation-latest
+        返回:
+            审核结果，flagged 表示是否被标记，categories、category_scores 为各类别的判定和得分
+    """
+    _ensure_settings()
+    started = time.perf_counter()
+    site = metrics.infer_call_site()
+    def request(timeout):
+        with _routed_client() as client:
+            return client.moderations.create(model=model, input=text, timeout=_request_timeout(timeout))
+
+    try:
+        response = call_with_policy(request, _retry_policy)
+    except Exception:
+        metrics.record_since("moderation", model, "error", started, site)
+        raise
+    metrics.record_since("moderation", model, "ok", started, site)
+    return response.results[0]
+
+
+def _open_stream(params, timeout):
+    """
+    发起一次流式 ChatCompletion 请求（受限流约束）并读取第一个分块，建立连接、排队和首个分块的等待都受本次尝试的超时约束
+    返回:
+        (opened, first, chunks, estimated)：opened 为持有端点和响应的 ExitStack，读完或放弃时由调用方关闭；
+        first 为第一个分块（流为空时为 None）；chunks 为其余分块的迭代器；estimated 为限流器预扣的 token 数
+    """
+    limiter = _rate_limiter
+    estimated = 0
+    if limiter is not None:
+        estimated = _estimate_request_tokens(params['messages'], params['model'], params.get('max_tokens'))
+        limiter.acquire(estimated)
+    try:
+        with contextlib.ExitStack() as stack:
+            # 多端点时整个流占用所选端点，直到读完最后一个分块
+            client = stack.enter_context(_routed_client())
+            stream = stack.enter_context(client.chat.completions.create(
+                stream=True,
+                # 让服务端在最后一个分块中返回 token 用量
+                stream_options={"include_usage": True},
+                # 读取超时同样约束之后每两个分块之间的等待
+                timeout=_request_timeout(timeout),
+                **params,
+            ))
+            chunks = iter(stream)
+            first = next(chunks, None)
+            opened = stack.pop_all()
+    except Exception:
+        if limiter is not None:
+            limiter.reconcile(estimated, 0)
+        raise
+    return opened, first, chunks, estimated
+
+
+class CompletionStream:
+    """
+        流式补全：迭代得到模型生成的内容增量，界面可以边生成边渲染
+        与 get_completion 使用同一套重试策略和截止时间：
+            建立连接到收到第一个分块之间的失败（连接错误、超时、429、5xx）按策略重试，每次尝试受单次超时约束；
+            开始输出后不再重试（已经交给调用方的内容无法撤回），每两个分块之间的等待受读取超时约束，
+            并在分块之间检查 deadline()，超过截止时间时关闭连接并抛出 DeadlineExceeded
+        迭代结束后可以读取：
+            content: 完整的回复内容
+            usage: token 用量字典（同 get_completion_from_messages_tokens_count 的 token_dict）
+            time_to_first_token: 从发出请求到收到第一个内容增量的秒数
+            latency: 从发出请求到流结束的总秒数
+        迭代器的返回值（StopIteration.value）即 usage。
+    """
+
+    def __init__(self, messages, model="gpt-4o-mini", temperature=0, max_tokens=None):
+        self.messages = messages
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.content = None
+        self.usage = None
+        self.time_to_first_token = None
+        self.latency = None
+
+    def __iter__(self):
+        return self._generate()
+
+    def _generate(self):
+        started = time.perf_counter()
+        _ensure_settings()
+        site = metrics.infer_call_site()
+        if _prompt_budget is not None:
+            self.messages = fit_messages_to_budget(self.messages, model=self.model)
+        key = _request_key(self.messages, self.model, self.temperature, self.max_tokens)
+        cached = _cache_lookup(key)
+        if cached is not None:
+            self.content, self.usage = cached
+            self.time_to_first_token = self.latency = time.perf_counter() - started
+            metrics.record_since("chat", self.model, "cache_hit", started, site)
+            yield self.content
+            return self.usage
+
+        params = _build_params(self.messages, self.model, self.temperature, self.max_tokens)
+        deadline_at = resolve_deadline(_retry_policy)
+        limiter = _rate_limiter
+        estimated = 0
+        parts = []
+        usage = None
+        try:
+            # 流式请求不做对冲：落败的流无法在同步代码中及时关闭，会白白占用连接和额度
+            opened, first, chunks, estimated = call_with_policy(
+                lambda timeout: _open_stream(params, timeout), _retry_policy
+            )
+            # 调用方提前关闭迭代器（如审核未通过时取消生成）时，with 会关闭响应，服务端随即停止生成
+            with opened:
+                for chunk in itertools.chain(() if first is None else (first,), chunks):
+                    remaining_time(deadline_at)
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - started
+                    parts.append(delta)
+                    yield delta
+        except GeneratorExit:
+            # 已经生成的 token 同样计费，限流器保留预估的额度，不再校正
+            metrics.record_since("chat", self.model, "cancelled", started, site)
+            raise
+        except Exception:
+            if limiter is not None:
+                limiter.reconcile(estimated, 0)
+            metrics.record_since("chat", self.model, "error", started, site)
+            raise
+        self.latency = time.perf_counter() - started
+        self.content = "".join(parts)
+        if usage is not None:
+            self.usage = _usage_to_dict(usage)
+        else:
+            # 部分代理不支持 stream_options，此时在本地估算 token 用量
+            prompt_tokens = count_message_tokens(self.messages, self.model)
+            completion_tokens = count_text_tokens(self.content, self.model)
+            self.usage = {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            }
+        if limiter is not None:
+            limiter.reconcile(estimated, self.usage['total_tokens'])
+        metrics.record_since("chat", self.model, "ok", started, site, self.usage)
+        _cache_store(key, self.content, self.usage)
+        return self.usage
+
+
+def stream_completion_from_messages(messages, model="gpt-4o-mini", temperature=0, max_tokens=None):
+    """
+        get_completion_from_messages 的流式版本
+        用法:
+            stream = stream_completion_from_messages(messages)
+            for delta in stream:
+                print(delta, end="")
+            print(stream.time_to_first_token, stream.latency, stream.usage)
+    """
+    return CompletionStream(messages, model, temperature, max_tokens)
+
+
+# ------------------------ 异步版本 ----------------------
+# 与同步函数参数一致，可在一个事件循环中通过 asyncio.gather 同时发起大量请求
+
+async def aget_completion(prompt, model="gpt-4o-mini", temperature=0):
+    content, _ = await _achat_completion([{"role": "user", "content": prompt}], model, temperature)
+    return content
+
+
+async def aget_completion_from_messages(messages, model="gpt-4o-mini", temperature=0):
+    content, _ = await _achat_completion(messages, model, temperature)
+    return content
+
+
+async def aget_completion_from_messages_tokens(messages, model="gpt-4o-mini", temperature=0, max_tokens = 500):
+    """get_completion_from_messages_tokens 的异步版本"""
+    content, _ = await _achat_completion(messages, model, temperature, max_tokens)
+    return content
+
+
+async def aget_completion_from_messages_tokens_count(messages, model="gpt-4o-mini", temperature=0, max_tokens = 500):
+    """get_completion_from_messages_tokens_count 的异步版本，返回 (content, token_dict)"""
+    return await _achat_completion(messages, model, temperature, max_tokens)
@@ -0,0 +1,200 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 10:00
+@Version: v1.0
+@Description: pytest 公共夹具
+    fake_completions: 把 tool.py 共享客户端的 chat.completions.create 替换为本地函数，不访问网络
+    stub_server: 在随机端口启动本地 OpenAI 兼容桩服务（见 chatgpt/stub_server.py），
+    把 tool.py 的共享客户端指向它，测试结束后关闭服务并丢弃客户端
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 从任意目录运行 pytest 时都能导入 chatgpt 包
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# end_to_end_chatbot 按脚本方式 import util_zh
+sys.path.append(os.path.join(ROOT, "chatgpt", "phase02"))
+
+
+class FakeCompletions:
+    """
+    本地的 chat.completions.create，同步与异步客户端共用：
+        reply: 回复内容；delay: 每次请求的耗时（秒），流式请求为首个分块前的等待；error: 不为 None 时抛出该异常
+        token_delay: 流式请求相邻分块之间的等待（秒）
+        requests: 每次请求的参数；peak: 同时在途请求数的最大值；streams: 创建过的 FakeStream
+    """
+
+    def __init__(self, reply="您好！"):
+        self.reply = reply
+        self.delay = 0.0
+        self.token_delay = 0.0
+        self.streams = []
+        self.error = None
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, params):
+        with self._lock:
+            self.requests.append(params)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def __call__(self, **params):
+        if params.get('stream'):
+            with self._lock:
+                self.requests.append(params)
+            if self.error is not None:
+                raise self.error
+            stream = FakeStream(self, params)
+            self.streams.append(stream)
+            return stream
+        self._enter(params)
+        try:
+            time.sleep(self.delay)
+        finally:
+            self._exit()
+        return self._respond(params)
+
+    async def acreate(self, **params):
+        self._enter(params)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._exit()
+        return self._respond(params)
+
+    def _reply(self, params):
+        return self.reply[:params['max_tokens']] if params.get('max_tokens') else self.reply
+
+    def _usage(self, params):
+        prompt_tokens = sum(len(m.get('content') or "") for m in params['messages'])
+        completion_tokens = len(self._reply(params))
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens}
+
+    def _respond(self, params):
+        from openai.types.chat import ChatCompletion
+
+        if self.error is not None:
+            raise self.error
+        reply = self._reply(params)
+        return ChatCompletion.model_validate({
+            'id': "chatcmpl-test", 'object': "chat.completion", 'created': int(time.time()), 'model': params['model'],
+            'choices': [{'index': 0, 'finish_reason': "stop",
+                         'message': {'role': "assistant", 'content': reply}}],
+            'usage': self._usage(params),
+        })
+
+
+class FakeStream:
+    """
+    流式请求的响应：每 4 个字符一个分块，请求 stream_options.include_usage 时最后一个分块只带 usage；
+    等待下一个分块的时间超过请求的读取超时时，与 httpx 一样抛出 ReadTimeout
+    """
+
+    def __init__(self, completions, params):
+        self.completions = completions
+        self.params = params
+        self.sent = 0
+        self.closed = False
+        self._chunks = self._generate()
+
+    def _chunk(self, choices, usage=None):
+        from openai.types.chat import ChatCompletionChunk
+
+        return ChatCompletionChunk.model_validate({
+            'id': "chatcmpl-test", 'object': "chat.completion.chunk", 'created': int(time.time()),
+            'model': self.params['model'], 'choices': choices, 'usage': usage,
+        })
+
+    def _wait(self, seconds):
+        import httpx
+
+        timeout = self.params.get('timeout')
+        if isinstance(timeout, httpx.Timeout):
+            timeout = timeout.read
+        if isinstance(timeout, (int, float)) and seconds > timeout:
+            time.sleep(timeout)
+            raise httpx.ReadTimeout("读取超时")
+        time.sleep(seconds)
+
+    def _generate(self):
+        completions = self.completions
+        self._wait(completions.delay)
+        reply = completions._reply(self.params)
+        yield self._chunk([{'index': 0, 'delta': {'role': "assistant", 'content': ""}, 'finish_reason': None}])
+        for i in range(0, len(reply), 4):
+            if i:
+                self._wait(completions.token_delay)
+            self.sent += 1
+            yield self._chunk([{'index': 0, 'delta': {'content': reply[i:i + 4]}, 'finish_reason': None}])
+        yield self._chunk([{'index': 0, 'delta': {}, 'finish_reason': "stop"}])
+        if (self.params.get('stream_options') or {}).get('include_usage'):
+            yield self._chunk([], completions._usage(self.params))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        return next(self._chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_completions(monkeypatch):
+    """返回 FakeCompletions，tool.py 的 ChatCompletion 请求都由它应答"""
+    from chatgpt import tool
+
+    fake = FakeCompletions()
+    monkeypatch.setattr(tool.client.chat.completions, "create", fake)
+    monkeypatch.setattr(tool.async_client.chat.completions, "create", fake.acreate)
+    return fake
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """
+    返回启动函数 start(**options)，参数同 StubConfig，返回 server；
+    请求计数在 server.RequestHandlerClass.state.counts 中
+    """
+    from chatgpt import tool
+    from chatgpt.stub_server import start_server
+
+    servers = []
+
+    def start(**options):
+        server, base_url = start_server("127.0.0.1", 0, **options)
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        # 丢弃已创建的客户端，下次调用时按新的 OPENAI_BASE_URL 重建
+        tool.configure_http_pool()
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    tool.configure_http_pool()
@@ -0,0 +1,128 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 17:00
+@Version: v1.0
+@Description: 回答评估策略（chatgpt/phase02/answer_evaluation.py）的测试，模型评估替换为本地函数
+"""
+import logging
+
+import pytest
+
+from chatgpt.phase02 import answer_evaluation
+from chatgpt.phase02.answer_evaluation import (NAME_WEIGHT, PRICE_WEIGHT, EvaluationPolicy, extract_prices,
+                                               local_score, parse_product_information)
+from chatgpt.phase02.catalog import Product, parse_table
+
+TV = Product("CineView 4K TV", "Televisions and Home Theater Systems", brand="CineView", price=599.99,
+             features=("55 英寸", "HDR"), description="清晰的 4K 画面")
+SOUNDBAR = Product("SoundMax Soundbar", "Audio Equipment", brand="SoundMax", price=199.99)
+PHONE = Product("SmartX ProPhone", "Smartphones and Accessories", price=899.99)
+
+
+def information(*products, fmt="json"):
+    return "\n".join(product.serialize(fmt) for product in products)
+
+
+class Grader:
+    """记录调用次数、返回固定结论的模型评估"""
+
+    def __init__(self, verdict=True):
+        self.verdict = verdict
+        self.calls = 0
+
+    def __call__(self, user_input, answer):
+        self.calls += 1
+        return self.verdict
+
+
+@pytest.mark.parametrize("fmt", ["json", "table"])
+def test_parse_product_information(fmt):
+    assert parse_product_information(information(TV, SOUNDBAR, fmt=fmt)) == \
+        [("CineView 4K TV", 599.99), ("SoundMax Soundbar", 199.99)]
+
+
+def test_parse_skips_lines_without_a_name():
+    assert parse_product_information('\n{"price": 1}\n{broken\nprice:5\n{"name":"A"}') == [("A", None)]
+
+
+def test_table_values_may_contain_separators():
+    product = Product("Zeta | Pro", "Cat", description="第一行\n第二行 | 续 \\ 结尾", price=99.5,
+                      features=("a|b", "c"))
+    line = product.serialize("table")
+    assert "\n" not in line
+    assert parse_table(line) == {'name': "Zeta | Pro", 'category': "Cat", 'features': "a|b,c",
+                                 'description': "第一行\n第二行 | 续 \\ 结尾", 'price': "99.5"}
+    assert parse_product_information(line) == [("Zeta | Pro", 99.5)]
+
+
+def test_extract_prices():
+    assert extract_prices("售价 $1,299.99，另一款 599 美元，还有 ￥88 和 12 USD") == [1299.99, 599.0, 88.0, 12.0]
+    assert extract_prices("没有价格") == []
+
+
+def test_local_score():
+    info = information(TV, SOUNDBAR, PHONE)
+    assert local_score("CineView 4K TV 售价 $599.99", info) == pytest.approx(NAME_WEIGHT / 3 + PRICE_WEIGHT)
+    # 两个商品的差价同样可以核对
+    answer = "CineView 4K TV（$599.99）比 SoundMax Soundbar 贵 $400.00，SmartX ProPhone 售价 $899.99"
+    assert local_score(answer, info) == pytest.approx(1.0)
+    # 对不上的价格按比例扣分
+    assert local_score("CineView 4K TV 售价 $499.99", info) == pytest.approx(NAME_WEIGHT / 3)
+    assert local_score("CineView 4K TV 有两年保修", info) == pytest.approx(NAME_WEIGHT / 3)
+    assert local_score("任何回答", "") is None
+
+
+def test_always_mode_grades_every_answer():
+    grader = Grader(False)
+    policy = EvaluationPolicy(grader, mode="always")
+    assert policy.evaluate("问题", "回答") == {'passed': False, 'method': "llm", 'score': None}
+    assert grader.calls == 1
+
+
+def test_sampled_mode():
+    grader = Grader()
+    policy = EvaluationPolicy(grader, mode="sampled", sample_rate=0.25, seed=7)
+    methods = [policy.evaluate("问题", "回答")['method'] for _ in range(400)]
+    assert grader.calls == methods.count("llm")
+    assert 60 < grader.calls < 140
+    assert set(methods) == {"llm", "skipped"}
+    stats = policy.stats()
+    assert stats['skipped'] == 400 - grader.calls and stats['llm_call_rate'] == pytest.approx(grader.calls / 400)
+    assert EvaluationPolicy(grader, mode="sampled", sample_rate=0).evaluate("问题", "回答")['method'] == "skipped"
+
+
+def test_local_mode_only_grades_low_scores():
+    grader = Grader(False)
+    policy = EvaluationPolicy(grader, mode="local", threshold=0.7)
+    info = information(TV, SOUNDBAR)
+    passed = policy.evaluate("电视多少钱", "CineView 4K TV 售价 $599.99", info)
+    assert passed == {'passed': True, 'method': "local", 'score': pytest.approx(NAME_WEIGHT / 2 + PRICE_WEIGHT)}
+    assert grader.calls == 0
+    # 只提到商品名、没有可核对的价格，交给模型评估
+    graded = policy.evaluate("电视怎么样", "CineView 4K TV 和 SoundMax Soundbar 都很好", info)
+    assert graded['method'] == "llm" and graded['passed'] is False and graded['score'] == pytest.approx(NAME_WEIGHT)
+    # 没有商品信息时无法本地打分
+    assert policy.evaluate("你好", "您好！", "")['method'] == "llm"
+    assert grader.calls == 2
+    stats = policy.stats()
+    assert (stats['evaluated'], stats['llm_calls'], stats['local_passed']) == (3, 2, 1)
+    assert stats['pass_rate'] == pytest.approx(1 / 3) and stats['llm_pass_rate'] == 0.0
+
+
+def test_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        EvaluationPolicy(Grader(), mode="never")
+
+
+def test_warns_when_names_alone_could_pass(caplog):
+    with caplog.at_level(logging.WARNING, logger=answer_evaluation.logger.name):
+        EvaluationPolicy(Grader(), mode="local", threshold=NAME_WEIGHT)
+    assert "NAME_WEIGHT" in caplog.text
+
+
+def test_logs_stats_periodically(caplog):
+    policy = EvaluationPolicy(Grader(), mode="always", log_every=2)
+    with caplog.at_level(logging.INFO, logger=answer_evaluation.logger.name):
+        for _ in range(5):
+            policy.evaluate("问题", "回答")
+    assert len([record for record in caplog.records if "回答评估" in record.message]) == 2
@@ -0,0 +1,72 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 19:20
+@Version: v1.0
+@Description: 异步补全函数（tool.aget_*）的测试：返回值、共享的并发上限，以及与同步函数共用的补全缓存
+"""
+import asyncio
+
+import pytest
+
+from chatgpt import tool
+
+REPLY = "我们有 CineView 4K TV 和 CineView OLED TV 两款电视。"
+
+
+def messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+@pytest.fixture
+def concurrency():
+    """返回 set_async_concurrency，测试结束后恢复原来的并发上限"""
+    saved = tool._async_concurrency
+    yield tool.set_async_concurrency
+    tool.set_async_concurrency(saved)
+
+
+def test_async_helpers_return_content_and_usage(fake_completions):
+    fake_completions.reply = REPLY
+
+    async def main():
+        return await asyncio.gather(
+            tool.aget_completion("介绍一下你们的电视"),
+            tool.aget_completion_from_messages(messages("电视有哪些")),
+            tool.aget_completion_from_messages_tokens(messages("电视多少钱"), max_tokens=5),
+            tool.aget_completion_from_messages_tokens_count(messages("电视有保修吗")),
+        )
+
+    completion, from_messages, truncated, (content, usage) = asyncio.run(main())
+    assert completion == from_messages == content == REPLY
+    assert truncated == REPLY[:5]
+    assert usage['total_tokens'] == usage['prompt_tokens'] + usage['completion_tokens'] > 0
+
+
+def test_calls_share_one_concurrency_limit(fake_completions, concurrency):
+    fake_completions.delay = 0.05
+    concurrency(3)
+
+    async def main():
+        # 不同的入口函数共用同一个信号量
+        return await asyncio.gather(*[tool.aget_completion(f"问题 {i}") for i in range(6)],
+                                    *[tool.aget_completion_from_messages(messages(f"消息 {i}")) for i in range(6)])
+
+    assert asyncio.run(main()) == ["您好！"] * 12
+    assert fake_completions.peak == 3
+    # 信号量按事件循环创建，新的事件循环同样受限
+    fake_completions.peak = 0
+    asyncio.run(main())
+    assert fake_completions.peak == 3
+
+
+def test_async_calls_share_the_completion_cache(fake_completions, tmp_path):
+    tool.enable_completion_cache(str(tmp_path / "completions.sqlite3"))
+    try:
+        content, usage = tool.get_completion_from_messages_tokens_count(messages("你好"))
+        assert asyncio.run(tool.aget_completion_from_messages_tokens_count(messages("你好"))) == (content, usage)
+        assert len(fake_completions.requests) == 1
+        # temperature 不为 0 的请求不走缓存
+        asyncio.run(tool.aget_completion_from_messages(messages("你好"), temperature=0.7))
+        assert len(fake_completions.requests) == 2
+    finally:
+        tool.disable_completion_cache()
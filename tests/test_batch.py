@@ -0,0 +1,63 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 10:30
+@Version: v1.0
+@Description: 批量调用 get_completions_batch 的测试
+"""
+import random
+import threading
+import time
+
+from chatgpt import tool
+
+
+def _echo(monkeypatch, fail_on=(), delay=0.02):
+    """把 _chat_completion 替换为按随机延迟回显输入的函数，返回记录最大并发数的字典"""
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def fake(messages, model, temperature, max_tokens=None):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        try:
+            time.sleep(random.uniform(0, delay))
+            content = messages[-1]['content']
+            if content in fail_on:
+                raise RuntimeError(content)
+            return content, {'prompt_tokens': len(content), 'completion_tokens': 1, 'total_tokens': len(content) + 1}
+        finally:
+            with lock:
+                state['active'] -= 1
+
+    monkeypatch.setattr(tool, "_chat_completion", fake)
+    return state
+
+
+def test_results_keep_input_order(monkeypatch):
+    _echo(monkeypatch)
+    prompts = [f"评论 {i}" for i in range(40)]
+    results, usage = tool.get_completions_batch(prompts, max_concurrency=8)
+    assert [result['content'] for result in results] == prompts
+    assert usage['succeeded'] == 40 and usage['failed'] == 0
+    assert usage['total_tokens'] == sum(len(prompt) + 1 for prompt in prompts)
+
+
+def test_failures_are_reported_per_item(monkeypatch):
+    _echo(monkeypatch, fail_on={"坏"})
+    results, usage = tool.get_completions_batch(["好", "坏", [{'role': 'user', 'content': "也好"}]])
+    assert [result['content'] for result in results] == ["好", None, "也好"]
+    assert isinstance(results[1]['error'], RuntimeError)
+    assert results[1]['usage'] is None
+    assert (usage['succeeded'], usage['failed']) == (2, 1)
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    state = _echo(monkeypatch, delay=0.05)
+    tool.get_completions_batch([f"p{i}" for i in range(30)], max_concurrency=4)
+    assert 1 < state['peak'] <= 4
+
+
+def test_empty_batch():
+    assert tool.get_completions_batch([]) == ([], {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0,
+                                                   'succeeded': 0, 'failed': 0})
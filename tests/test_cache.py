@@ -0,0 +1,112 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 10:10
+@Version: v1.0
+@Description: 持久化补全缓存（chatgpt/cache.py）的测试
+"""
+import time
+
+import pytest
+
+from chatgpt import tool
+from chatgpt.cache import CompletionCache, make_cache_key
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+USAGE = {'prompt_tokens': 8, 'completion_tokens': 2, 'total_tokens': 10}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_key_is_stable_and_covers_every_parameter():
+    key = make_cache_key("gpt-4o-mini", MESSAGES, 0, 100)
+    assert key == make_cache_key("gpt-4o-mini", [dict(MESSAGES[0])], 0, 100)
+    assert key != make_cache_key("gpt-4o", MESSAGES, 0, 100)
+    assert key != make_cache_key("gpt-4o-mini", [{'role': 'user', 'content': '您好'}], 0, 100)
+    assert key != make_cache_key("gpt-4o-mini", MESSAGES, 0.5, 100)
+    assert key != make_cache_key("gpt-4o-mini", MESSAGES, 0, None)
+
+
+def test_hit_replays_content_and_usage(cache):
+    key = make_cache_key("gpt-4o-mini", MESSAGES, 0)
+    assert cache.get(key) is None
+    cache.set(key, "您好！", USAGE)
+    assert cache.get(key) == ("您好！", USAGE)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['bytes'] == len("您好！".encode("utf-8"))
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = CompletionCache(path)
+    first.set("key", "内容", USAGE)
+    first.close()
+    second = CompletionCache(path)
+    try:
+        assert second.get("key") == ("内容", USAGE)
+    finally:
+        second.close()
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.sqlite3"), max_age=0.05)
+    try:
+        cache.set("key", "内容", USAGE)
+        time.sleep(0.1)
+        assert cache.get("key") is None
+        assert cache.stats()['entries'] == 0
+    finally:
+        cache.close()
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    try:
+        for key in ("a", "b", "c"):
+            cache.set(key, key, USAGE)
+            time.sleep(0.01)
+        # 访问 a 之后，最久未使用的是 b
+        cache.get("a")
+        time.sleep(0.01)
+        cache.set("d", "d", USAGE)
+        cache.evict()
+        assert cache.get("b") is None
+        assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    finally:
+        cache.close()
+
+
+def test_evicts_down_to_the_byte_limit(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    try:
+        for key in ("a", "b", "c"):
+            cache.set(key, key * 4, USAGE)
+            time.sleep(0.01)
+        cache.evict()
+        assert cache.stats()['bytes'] <= 10
+        assert cache.get("a") is None
+        assert cache.get("c") == ("cccc", USAGE)
+    finally:
+        cache.close()
+
+
+def test_deterministic_completion_is_served_from_cache(fake_completions, tmp_path):
+    fake_completions.reply = "缓存的回答"
+    tool.enable_completion_cache(str(tmp_path / "completions.sqlite3"))
+    try:
+        first = tool.get_completion_from_messages_tokens_count(MESSAGES)
+        second = tool.get_completion_from_messages_tokens_count(MESSAGES)
+        assert first == second
+        assert first[0] == "缓存的回答"
+        assert len(fake_completions.requests) == 1
+        assert tool.get_completion_cache_stats()['hits'] == 1
+        # temperature 不为 0 的请求不走缓存
+        tool.get_completion_from_messages(MESSAGES, temperature=0.7)
+        assert len(fake_completions.requests) == 2
+    finally:
+        tool.disable_completion_cache()
@@ -0,0 +1,124 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 17:30
+@Version: v1.0
+@Description: OpenAI 流量录制/回放（chatgpt/cassette.py）的测试：对本地桩服务录制，关闭服务后回放
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from chatgpt import tool
+from chatgpt.cassette import Cassette, CassetteMiss, request_key
+
+MESSAGES = [{'role': 'user', 'content': '介绍一下你们的电视'}]
+REPLY = "我们有 CineView 4K TV 和 CineView OLED TV 两款电视。"
+
+
+@pytest.fixture
+def use_cassette(monkeypatch):
+    """返回 use(cassette)：让 tool.py 的客户端经过该 cassette，测试结束后恢复"""
+
+    def use(cassette):
+        monkeypatch.setattr(tool, "_cassette", cassette)
+        tool.configure_http_pool()
+        return cassette
+
+    yield use
+    monkeypatch.setattr(tool, "_cassette", None)
+    tool.configure_http_pool()
+
+
+def stream_once():
+    stream = tool.stream_completion_from_messages(MESSAGES)
+    deltas = list(stream)
+    return stream, deltas
+
+
+def test_request_key_ignores_host_and_key_order():
+    first = request_key("POST", httpx.URL("http://a/v1/chat/completions"), b'{"a":1,"b":2}')
+    second = request_key("POST", httpx.URL("https://b/v1/chat/completions"), b'{"b": 2, "a": 1}')
+    assert first == second
+    assert first != request_key("POST", httpx.URL("http://a/v1/embeddings"), b'{"a":1,"b":2}')
+
+
+def test_stream_round_trip_keeps_time_to_first_token(tmp_path, stub_server, use_cassette):
+    path = str(tmp_path / "openai.jsonl.gz")
+    server = stub_server(reply=REPLY, first_token_latency="fixed:0.3", token_latency=0.05)
+    recording = use_cassette(Cassette(path, mode="record"))
+    recorded, recorded_deltas = stream_once()
+    # 录制时照常边收边转发
+    assert 0.25 < recorded.time_to_first_token < recorded.latency - 0.2
+    recording.save()
+    server.shutdown()
+
+    entry, = [entry for entries in recording._entries.values() for entry in entries]
+    assert len(entry["chunks"]) > 2
+    assert entry["header_latency"] < entry["chunks"][0][0] < entry["latency"]
+
+    use_cassette(Cassette(path, mode="replay", latency_scale=1.0))
+    replayed, replayed_deltas = stream_once()
+    assert replayed_deltas == recorded_deltas and replayed.content == REPLY
+    # 首个分块按录制时的时间到达，而不是等到总耗时之后一次性返回
+    assert replayed.time_to_first_token == pytest.approx(entry["chunks"][0][0], abs=0.1)
+    assert replayed.latency == pytest.approx(entry["latency"], abs=0.15)
+    assert replayed.latency - replayed.time_to_first_token > 0.2
+
+
+def test_replay_without_latency_is_immediate(tmp_path, stub_server, use_cassette):
+    path = str(tmp_path / "openai.jsonl.gz")
+    stub_server(reply=REPLY, first_token_latency="fixed:0.3", token_latency=0.05)
+    use_cassette(Cassette(path, mode="record"))
+    content = tool.get_completion_from_messages(MESSAGES)
+    stream_once()
+    tool._cassette.save()
+
+    use_cassette(Cassette(path, mode="replay"))
+    started = time.perf_counter()
+    assert tool.get_completion_from_messages(MESSAGES) == content
+    assert stream_once()[0].content == REPLY
+    assert time.perf_counter() - started < 0.2
+
+
+def test_async_stream_round_trip(tmp_path, stub_server):
+    from chatgpt.cassette import AsyncCassetteTransport
+
+    path = str(tmp_path / "openai.jsonl.gz")
+    stub_server(reply=REPLY, first_token_latency="fixed:0.2", token_latency=0.02)
+    url = f"{tool.get_client().base_url}chat/completions"
+    body = {'model': "gpt-4o-mini", 'messages': MESSAGES, 'stream': True}
+
+    async def fetch(cassette):
+        transport = AsyncCassetteTransport(cassette, httpx.AsyncHTTPTransport())
+        async with httpx.AsyncClient(transport=transport) as client:
+            started = time.perf_counter()
+            async with client.stream("POST", url, json=body) as response:
+                chunks = [(time.perf_counter() - started, chunk) async for chunk in response.aiter_bytes()]
+        return chunks
+
+    recording = Cassette(path, mode="record")
+    recorded = asyncio.run(fetch(recording))
+    recording.save()
+    replayed = asyncio.run(fetch(Cassette(path, mode="replay", latency_scale=1.0)))
+    assert b"".join(chunk for _, chunk in replayed) == b"".join(chunk for _, chunk in recorded)
+    assert replayed[0][0] == pytest.approx(recorded[0][0], abs=0.1)
+    assert replayed[-1][0] - replayed[0][0] > 0.1
+
+
+def test_replay_miss_raises(tmp_path, use_cassette, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    use_cassette(Cassette(str(tmp_path / "empty.jsonl.gz"), mode="replay"))
+    with pytest.raises(Exception) as info:
+        tool.get_completion_from_messages([{'role': 'user', 'content': '没有录制过的问题'}])
+    assert isinstance(info.value, CassetteMiss) or isinstance(info.value.__cause__, CassetteMiss)
+
+
+def test_abandoned_stream_is_not_recorded(tmp_path, stub_server, use_cassette):
+    stub_server(reply=REPLY, token_latency=0.01)
+    cassette = use_cassette(Cassette(str(tmp_path / "openai.jsonl.gz"), mode="record"))
+    stream = iter(tool.stream_completion_from_messages(MESSAGES))
+    next(stream)
+    stream.close()
+    assert cassette.recorded == 0
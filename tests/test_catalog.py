@@ -0,0 +1,75 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:30
+@Version: v1.0
+@Description: 商品目录的索引与紧凑序列化（chatgpt/phase02/catalog.py）的测试
+"""
+import json
+import os
+
+import pytest
+
+from chatgpt.phase02.catalog import Catalog, Product
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "chatgpt", "phase02", "products.json")
+
+
+@pytest.fixture(scope="module")
+def raw_products():
+    with open(PRODUCTS_PATH, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return Catalog.from_json(PRODUCTS_PATH)
+
+
+def test_lookup_by_exact_and_normalized_name(catalog):
+    assert catalog.get("SmartX ProPhone").model_number == "SX-PP10"
+    assert catalog.get("smartx pro phone") is catalog.get("SmartX ProPhone")
+    assert catalog.get("ＳｍａｒｔＸ ＰｒｏＰｈｏｎｅ") is catalog.get("SmartX ProPhone")
+    assert catalog.get("Unknown Phone") is None
+    assert "cineview 4k tv" in catalog
+
+
+def test_category_index(catalog):
+    names = catalog.category_names["Televisions and Home Theater Systems"]
+    assert len(names) == 5
+    assert [p.name for p in catalog.by_category("televisions and home theater systems")] == names
+    assert catalog.by_category("Drones") == []
+    assert catalog.category_sample("Televisions and Home Theater Systems", 2) == names[:2]
+
+
+def test_to_dict_round_trips_products_json(catalog, raw_products):
+    assert [product.to_dict() for product in catalog] == raw_products
+
+
+def test_json_serialization_is_compact_and_lossless(catalog, raw_products):
+    product = catalog.get("CineView 8K TV")
+    text = product.serialize("json")
+    assert "\n" not in text and ", " not in text and ": " not in text
+    assert json.loads(text) == next(p for p in raw_products if p['name'] == "CineView 8K TV")
+    assert len(text) < len(json.dumps(product.to_dict(), indent=4))
+
+
+def test_table_serialization_lists_every_present_field():
+    product = Product.from_dict({'name': "Zeta Phone", 'category': "Phones", 'features': ["5G", "OLED"], 'price': 99.5})
+    assert product.serialize("table") == "name:Zeta Phone|category:Phones|features:5G,OLED|price:99.5"
+
+
+def test_serialization_is_cached(catalog):
+    product = catalog.get("SoundMax Soundbar")
+    assert product.serialize("json") is product.serialize("json")
+    assert product.serialize("table") is product.serialize("table")
+
+
+def test_unknown_format_is_rejected(catalog):
+    with pytest.raises(ValueError):
+        catalog.get("SoundMax Soundbar").serialize("xml")
+
+
+def test_repeated_strings_are_interned(catalog):
+    first, second = catalog.by_category("Televisions and Home Theater Systems")[:2]
+    assert first.category is second.category
@@ -0,0 +1,67 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:40
+@Version: v1.0
+@Description: 候选商品检索（chatgpt/phase02/catalog_retrieval.py）的测试
+"""
+import pytest
+
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.catalog_retrieval import CatalogRetriever
+
+BRANDS = ("SmartX", "FotoSnap", "CineView", "SoundMax", "TechPro", "BlueWave")
+CATEGORIES = ("Smartphones and Accessories", "Cameras and Camcorders", "Televisions and Home Theater Systems",
+              "Audio Equipment", "Computers and Laptops", "Gaming Consoles and Accessories")
+KINDS = ("Phone", "Camera", "TV", "Speaker", "Laptop", "Console")
+
+
+def _product(i):
+    kind = i % len(KINDS)
+    return {
+        'name': f"{BRANDS[i % len(BRANDS)]} {KINDS[kind]} {i}",
+        'category': CATEGORIES[kind],
+        'brand': BRANDS[i % len(BRANDS)],
+        'model_number': f"MX-{i:04d}",
+        'features': [],
+        'price': 100 + i,
+    }
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    return CatalogRetriever(Catalog(_product(i) for i in range(600)))
+
+
+def test_small_catalog_returns_every_product():
+    catalog = Catalog(_product(i) for i in range(10))
+    assert CatalogRetriever(catalog).candidates("随便看看", top_n=20) is catalog.category_names
+
+
+def test_search_finds_the_named_product_first(retriever):
+    hits = retriever.search("CineView TV 122 多少钱", top_n=5)
+    assert hits[0][0].name == "CineView TV 122"
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_by_model_number(retriever):
+    assert retriever.search("型号 MX-0345 还有货吗", top_n=3)[0][0].model_number == "MX-0345"
+
+
+def test_candidates_are_a_small_subset(retriever):
+    candidates = retriever.candidates("SmartX Phone 120 和 BlueWave Console 347 哪个好", top_n=10)
+    names = [name for products in candidates.values() for name in products]
+    assert len(names) <= 10
+    assert "SmartX Phone 120" in candidates["Smartphones and Accessories"]
+    assert "BlueWave Console 347" in candidates["Gaming Consoles and Accessories"]
+
+
+def test_mentioned_category_adds_examples(retriever):
+    candidates = retriever.candidates("你们有哪些相机", top_n=10, per_category=3)
+    assert len(candidates["Cameras and Camcorders"]) >= 3
+
+
+def test_no_hits_fall_back_to_category_samples(retriever):
+    candidates = retriever.candidates("你好", top_n=10, per_category=2)
+    assert set(candidates) == set(CATEGORIES)
+    assert all(len(names) == 2 for names in candidates.values())
@@ -0,0 +1,152 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 12:00
+@Version: v1.0
+@Description: 内存映射商品目录快照与热更新（chatgpt/phase02/catalog_snapshot.py）的测试
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.catalog_snapshot import ReloadableCatalog, SnapshotCatalog, read_snapshot_header, write_snapshot
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "chatgpt", "phase02", "products.json")
+
+EXTRA = {'name': "Zeta Phone", 'category': "Smartphones and Accessories", 'brand': "Zeta", 'model_number': "ZP-1",
+         'warranty': "1 year", 'rating': 4.0, 'features': ["5G"], 'description': "测试用手机", 'price': 199.0}
+
+
+@pytest.fixture
+def products():
+    with open(PRODUCTS_PATH, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def source(tmp_path, products):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps(products, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def test_snapshot_matches_the_in_memory_catalog(tmp_path, products):
+    catalog = Catalog(products)
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(catalog, path, version=7)
+    snapshot = SnapshotCatalog(path)
+    assert snapshot.version == 7 and len(snapshot) == len(catalog)
+    for product in catalog:
+        found = snapshot.get(product.name)
+        assert found.to_dict() == product.to_dict()
+        assert found.serialize("json") == product.serialize("json")
+    assert snapshot.get("cineview 4k tv").name == "CineView 4K TV"
+    assert snapshot.get("Unknown") is None
+    assert snapshot.categories() == catalog.categories()
+    assert snapshot.category_names == catalog.category_names
+    assert [p.name for p in snapshot.by_category("cameras and camcorders")] == ["FotoSnap DSLR Camera"]
+    assert [p.name for p in snapshot] == [p.name for p in catalog]
+    with pytest.raises(IndexError):
+        snapshot[len(catalog)]
+
+
+def test_header(tmp_path, products):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(Catalog(products), path, version=3, source_signature=(123, 456))
+    assert read_snapshot_header(path) == {'version': 3, 'source_signature': (123, 456), 'count': len(products)}
+    (tmp_path / "other").write_bytes(b"not a snapshot")
+    assert read_snapshot_header(str(tmp_path / "other")) is None
+    assert read_snapshot_header(str(tmp_path / "missing")) is None
+
+
+def test_reload_switches_versions_and_notifies(tmp_path, source, products):
+    reloadable = ReloadableCatalog(str(source), str(tmp_path / "catalog.snapshot"), poll_interval=60)
+    old = reloadable.current()
+    notified = []
+    reloadable.subscribe(notified.append)
+    assert old.version == 1 and "Zeta Phone" not in old
+    assert reloadable.reload() is False
+
+    source.write_text(json.dumps(products + [EXTRA], ensure_ascii=False), encoding="utf-8")
+    assert reloadable.reload() is True
+    new = reloadable.current()
+    assert new.version == 2 and new.get("Zeta Phone").price == 199.0
+    assert notified == [new]
+    # 正在使用旧版本的读者不受影响
+    assert "Zeta Phone" not in old and len(old) == len(products)
+
+
+def test_access_polls_the_source_after_the_interval(tmp_path, source, products):
+    reloadable = ReloadableCatalog(str(source), str(tmp_path / "catalog.snapshot"), poll_interval=0)
+    assert reloadable.version == 1
+    source.write_text(json.dumps(products[:3], ensure_ascii=False), encoding="utf-8")
+    assert len(reloadable.current()) == 3
+    assert reloadable.version == 2
+
+
+def test_workers_share_one_snapshot(tmp_path, source):
+    snapshot_path = str(tmp_path / "catalog.snapshot")
+    first = ReloadableCatalog(str(source), snapshot_path).current()
+    written = os.stat(snapshot_path).st_mtime_ns
+    # 另一个进程对同一份源文件直接映射已有快照，不重新生成
+    second = ReloadableCatalog(str(source), snapshot_path).current()
+    assert os.stat(snapshot_path).st_mtime_ns == written
+    assert second.version == first.version
+
+
+def test_broken_source_keeps_the_current_version(tmp_path, source):
+    reloadable = ReloadableCatalog(str(source), str(tmp_path / "catalog.snapshot"))
+    current = reloadable.current()
+    source.write_text("[{", encoding="utf-8")
+    assert reloadable.reload() is False
+    assert reloadable.current() is current
+
+
+def test_without_snapshot_path_loads_in_memory(source, products):
+    reloadable = ReloadableCatalog(str(source), None)
+    assert isinstance(reloadable.current(), Catalog)
+    source.write_text(json.dumps(products + [EXTRA], ensure_ascii=False), encoding="utf-8")
+    assert reloadable.reload() is True
+    assert reloadable.version == 2 and "Zeta Phone" in reloadable.current()
+
+
+def test_force_reload_bumps_the_version(tmp_path, source):
+    reloadable = ReloadableCatalog(str(source), str(tmp_path / "catalog.snapshot"))
+    assert reloadable.version == 1
+    assert reloadable.reload(force=True) is True
+    assert reloadable.version == 2
+
+
+def test_snapshot_writable_by_others_is_not_trusted(tmp_path, source, products):
+    snapshot_path = tmp_path / "catalog.snapshot"
+    # 伪造一个头部与源文件一致、内容被篡改的快照
+    forged = [dict(product, price=0.01) for product in products]
+    write_snapshot(Catalog(forged), str(snapshot_path), version=1, source_signature=(
+        os.stat(source).st_mtime_ns, os.stat(source).st_size))
+    os.chmod(snapshot_path, 0o666)
+    with pytest.raises(PermissionError):
+        SnapshotCatalog(str(snapshot_path), verify_owner=True)
+    catalog = ReloadableCatalog(str(source), str(snapshot_path)).current()
+    assert isinstance(catalog, Catalog)
+    assert catalog.get("CineView 4K TV").price == 599.99
+
+
+def test_own_snapshot_passes_the_owner_check(tmp_path, source):
+    snapshot_path = str(tmp_path / "catalog.snapshot")
+    ReloadableCatalog(str(source), snapshot_path).current()
+    assert os.stat(snapshot_path).st_mode & 0o777 == 0o644
+    assert isinstance(ReloadableCatalog(str(source), snapshot_path).current(), SnapshotCatalog)
+
+
+def test_util_zh_does_not_use_a_snapshot_by_default():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {name: value for name, value in os.environ.items() if name != "PRODUCTS_SNAPSHOT_PATH"}
+    output = subprocess.run(
+        [sys.executable, "-c", "from chatgpt.phase02 import util_zh; "
+                               "print(util_zh.SNAPSHOT_PATH, type(util_zh.get_catalog()).__name__)"],
+        cwd=root, env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["None", "Catalog"]
@@ -0,0 +1,133 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:50
+@Version: v1.0
+@Description: 多轮对话滚动状态 ConversationState 的测试，摘要调用替换为本地函数
+"""
+import threading
+import zlib
+
+import pytest
+
+from chatgpt.phase02 import conversation
+from chatgpt.phase02.conversation import ConversationState
+
+
+def _turns(count):
+    messages = []
+    for i in range(count):
+        messages.append({'role': 'user', 'content': f"第 {i} 个问题：CineView 4K TV 多少钱？"})
+        messages.append({'role': 'assistant', 'content': f"第 {i} 个回答：$599.99。"})
+    return messages
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """把摘要替换为拼接被淘汰消息条数的本地函数，返回每次调用的 (previous, 消息数) 列表"""
+    calls = []
+
+    def fake(messages, model="gpt-4o-mini", previous=None):
+        calls.append((previous, len(messages)))
+        return f"{previous or ''}+{len(messages)}"
+
+    monkeypatch.setattr(conversation, "summarize_messages", fake)
+    return calls
+
+
+def test_window_keeps_running_token_total():
+    state = ConversationState()
+    state.extend(_turns(3))
+    assert len(state) == 6
+    assert state.total_tokens == sum(state._tokens) > 0
+    assert state.messages() == _turns(3)
+
+
+def test_evicts_oldest_messages_beyond_max_messages():
+    state = ConversationState(max_messages=4)
+    state.extend(_turns(5))
+    assert state.messages() == _turns(5)[-4:]
+    assert state.evicted == 6
+
+
+def test_token_budget_keeps_min_messages():
+    state = ConversationState(max_tokens=1, min_messages=2)
+    state.extend(_turns(3))
+    assert len(state) == 2
+    assert state.total_tokens > 1
+
+
+def test_round_trip_preserves_window_and_settings():
+    state = ConversationState(max_tokens=200, max_messages=8, min_messages=3, model="gpt-4o")
+    state.extend(_turns(10))
+    state.summary = "用户在比较电视价格"
+    data = state.to_bytes()
+    restored = ConversationState.from_bytes(data)
+    assert restored.to_dict() == state.to_dict()
+    assert restored.messages() == state.messages()
+    assert restored.total_tokens == state.total_tokens
+    assert (restored.max_tokens, restored.max_messages, restored.min_messages, restored.model) == (200, 8, 3, "gpt-4o")
+    # 追加消息后按同样的规则继续淘汰
+    restored.append({'role': 'user', 'content': "还有别的吗？"})
+    assert len(restored) <= 8
+
+
+def test_serialized_form_is_compressed():
+    state = ConversationState()
+    state.extend(_turns(50))
+    data = state.to_bytes()
+    assert len(data) < len(zlib.decompress(data)) / 3
+
+
+def test_unknown_format_version_is_rejected():
+    data = ConversationState().to_dict()
+    data['version'] += 1
+    with pytest.raises(ValueError):
+        ConversationState.from_dict(data)
+
+
+def test_evicted_messages_are_summarized_in_the_background(summaries):
+    state = ConversationState(max_messages=2, summarize=True)
+    for message in _turns(4):
+        state.append(message)
+    state.wait_for_summary(5)
+    # 6 条消息被淘汰，可能分多次合并进同一份摘要
+    assert sum(count for _, count in summaries) == 6
+    assert state.summary.count("+") == len(summaries)
+    messages = state.messages()
+    assert messages[0]['role'] == 'system' and state.summary in messages[0]['content']
+    assert messages[1:] == _turns(4)[-2:]
+
+
+def test_failed_summary_keeps_the_previous_summary(monkeypatch):
+    def fail(messages, model="gpt-4o-mini", previous=None):
+        raise RuntimeError("上游错误")
+
+    monkeypatch.setattr(conversation, "summarize_messages", fail)
+    state = ConversationState(max_messages=2, summarize=True)
+    state.summary = "原摘要"
+    state.extend(_turns(2))
+    state.wait_for_summary(5)
+    assert state.summary == "原摘要"
+
+
+def test_pending_messages_survive_serialization(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def slow(messages, model="gpt-4o-mini", previous=None):
+        calls.append(len(messages))
+        release.wait(5)
+        return f"摘要 {len(messages)}"
+
+    monkeypatch.setattr(conversation, "summarize_messages", slow)
+    state = ConversationState(max_messages=2, summarize=True)
+    state.extend(_turns(2))
+    # 摘要还在进行中时序列化，尚未合并的消息随状态一起保存
+    data = state.to_dict()
+    assert len(data['pending']) == 2
+    release.set()
+    state.wait_for_summary(5)
+    restored = ConversationState.from_dict(data)
+    restored.wait_for_summary(5)
+    assert restored.summary == "摘要 2"
+    assert calls == [2, 2]
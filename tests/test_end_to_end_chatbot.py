@@ -0,0 +1,158 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 16:30
+@Version: v1.0
+@Description: 端到端问答流水线的测试：输入检查与生成并行、检查未通过时取消生成、拒答与后台评估，
+    模型调用全部替换为本地函数
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from chatgpt.phase02 import end_to_end_chatbot as e2e
+from chatgpt.semantic_cache import SemanticCache
+
+QUESTION = "CineView 4K TV 多少钱"
+ANSWER = ["CineView 4K TV ", "的价格是 ", "$599.99。"]
+
+
+class FakeStream:
+    """按固定间隔产出增量的流，记录已产出的增量以及是否被提前关闭"""
+
+    def __init__(self, deltas, delay=0.0):
+        self.deltas = deltas
+        self.delay = delay
+        self.sent = []
+        self.closed = False
+        self.content = None
+
+    def __iter__(self):
+        return self._generate()
+
+    def _generate(self):
+        try:
+            for delta in self.deltas:
+                time.sleep(self.delay)
+                self.sent.append(delta)
+                yield delta
+            self.content = "".join(self.deltas)
+        finally:
+            self.closed = len(self.sent) < len(self.deltas)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    替换模型调用，返回可调整的设置：
+        flagged: Moderation 检查的结论；check_delay: 检查耗时；extract_delay: 商品抽取耗时；
+        stream_delay: 每个增量的间隔；streams: 创建过的 FakeStream
+    """
+    config = {'flagged': False, 'check_delay': 0.0, 'extract_delay': 0.0, 'stream_delay': 0.0, 'streams': []}
+
+    def moderation(user_input):
+        time.sleep(config['check_delay'])
+        if isinstance(config['flagged'], Exception):
+            raise config['flagged']
+        return config['flagged']
+
+    def extract(user_input):
+        time.sleep(config['extract_delay'])
+        return [{'category': "Televisions and Home Theater Systems", 'products': ["CineView 4K TV"]}]
+
+    def stream(messages):
+        created = FakeStream(ANSWER, config['stream_delay'])
+        config['streams'].append(created)
+        return created
+
+    monkeypatch.setattr(e2e, "answer_cache", SemanticCache(lambda text: np.ones(4)))
+    monkeypatch.setattr(e2e, "check_moderation", moderation)
+    monkeypatch.setattr(e2e, "check_injection", lambda user_input: False)
+    monkeypatch.setattr(e2e.util_zh, "extract_category_and_products", extract)
+    monkeypatch.setattr(e2e.util_zh, "generate_output_string",
+                        lambda data: '{"name":"CineView 4K TV","price":599.99}')
+    monkeypatch.setattr(e2e.util_zh, "get_catalog_version", lambda: 1)
+    monkeypatch.setattr(e2e, "stream_completion_from_messages", stream)
+    monkeypatch.setattr(e2e.evaluation_policy, "evaluate",
+                        lambda *args: {'passed': True, 'method': "local", 'score': 1.0})
+    return config
+
+
+def test_answer_is_streamed_after_checks_pass(pipeline):
+    pipeline['check_delay'] = 0.1
+    received = []
+    response, history = e2e.process_user_message_ch(QUESTION, [], debug=False, on_delta=received.append)
+    assert response == "".join(ANSWER)
+    # 检查通过前生成的增量先缓存，通过后合并推送
+    assert "".join(received) == response
+    assert len(history) == 2
+
+
+def test_generation_is_cancelled_when_input_is_flagged(pipeline):
+    pipeline.update(flagged=True, check_delay=0.15, stream_delay=0.1)
+    received = []
+    response, history = e2e.process_user_message_ch(QUESTION, [], debug=False, on_delta=received.append)
+    assert response == e2e.REFUSAL
+    assert history == []
+    assert received == []
+    stream, = pipeline['streams']
+    assert stream.closed and len(stream.sent) < len(ANSWER)
+
+
+def test_flagged_input_is_refused_before_generation(pipeline):
+    pipeline.update(flagged=True, extract_delay=0.1)
+    response, history = e2e.process_user_message_ch(QUESTION, [], debug=False)
+    assert response == e2e.REFUSAL and history == []
+    assert pipeline['streams'] == []
+
+
+def test_check_errors_follow_the_policy(pipeline, monkeypatch):
+    pipeline['flagged'] = ConnectionError("Moderation 端点不可用")
+    response, _ = e2e.process_user_message_ch(QUESTION, [], debug=False)
+    assert response == "".join(ANSWER)
+    monkeypatch.setattr(e2e, "INPUT_CHECK_ON_ERROR", "refuse")
+    response, _ = e2e.process_user_message_ch(QUESTION, [], debug=False)
+    assert response == e2e.REFUSAL
+    with pytest.raises(ValueError):
+        e2e.InputChecks(QUESTION, {}, on_error="ignore")
+
+
+def test_cached_answer_still_waits_for_the_checks(pipeline):
+    e2e.process_user_message_ch(QUESTION, [], debug=False)
+    pipeline.update(flagged=True, check_delay=0.1)
+    response, _ = e2e.process_user_message_ch(QUESTION, [], debug=False)
+    assert response == e2e.REFUSAL
+    assert len(pipeline['streams']) == 1
+
+
+def test_background_evaluation_does_not_block_the_answer(pipeline, monkeypatch):
+    release = threading.Event()
+    evaluated = []
+
+    def slow_evaluate(user_input, answer, product_information):
+        release.wait(5)
+        evaluated.append(threading.current_thread().name)
+        return {'passed': True, 'method': "llm", 'score': None}
+
+    monkeypatch.setattr(e2e.evaluation_policy, "evaluate", slow_evaluate)
+    started = time.perf_counter()
+    response, _ = e2e.process_user_message_ch(QUESTION, [], debug=False, background_evaluation=True)
+    assert response == "".join(ANSWER)
+    assert time.perf_counter() - started < 1
+    assert evaluated == [] and e2e.answer_cache.stats()['entries'] == 0
+    release.set()
+    e2e.wait_for_background_evaluations(5)
+    assert evaluated[0].startswith("end_to_end_evaluation")
+    # 评估通过后才写入语义缓存
+    assert e2e.answer_cache.stats()['entries'] == 1
+
+
+def test_failed_background_evaluation_is_not_cached(pipeline, monkeypatch):
+    monkeypatch.setattr(e2e.evaluation_policy, "evaluate",
+                        lambda *args: {'passed': False, 'method': "llm", 'score': None})
+    response, _ = e2e.process_user_message_ch(QUESTION, [], debug=False, background_evaluation=True)
+    # 回答已经返回给用户，后台评估的结论不再替换回答
+    assert response == "".join(ANSWER)
+    e2e.wait_for_background_evaluations(5)
+    assert e2e.answer_cache.stats()['entries'] == 0
@@ -0,0 +1,131 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:10
+@Version: v1.0
+@Description: 多端点负载均衡与熔断（chatgpt/endpoints.py）的测试
+"""
+import time
+from collections import Counter
+
+import pytest
+
+from chatgpt.endpoints import CLOSED, HALF_OPEN, OPEN, Endpoint, EndpointPool, parse_endpoints
+
+
+def _serial(pool, count, latency=0.1):
+    """串行发送 count 个成功的请求，返回每个端点收到的请求数"""
+    counts = Counter()
+    for _ in range(count):
+        endpoint = pool.acquire()
+        counts[endpoint.base_url] += 1
+        pool.release(endpoint, latency)
+    return counts
+
+
+def _fail(pool, endpoint, times):
+    """串行发送请求，直到 endpoint 失败 times 次，其他端点的请求都成功"""
+    while times:
+        chosen = pool.acquire()
+        ok = chosen is not endpoint
+        pool.release(chosen, 0.1, ok=ok)
+        times -= not ok
+
+
+def test_parse_endpoints(monkeypatch):
+    monkeypatch.setenv("PROXY_API_KEY", "sk-proxy")
+    endpoints = parse_endpoints("https://a/v1, https://b/v1|3|PROXY_API_KEY,")
+    assert [(e.base_url, e.weight, e.api_key) for e in endpoints] == [
+        ("https://a/v1", 1.0, None), ("https://b/v1", 3.0, "sk-proxy")]
+
+
+def test_rejects_unknown_strategy_and_empty_pool():
+    with pytest.raises(ValueError):
+        EndpointPool(["https://a/v1"], strategy="random")
+    with pytest.raises(ValueError):
+        EndpointPool([])
+
+
+def test_serial_traffic_is_split_by_weight():
+    pool = EndpointPool([{'base_url': "a", 'weight': 1}, {'base_url': "b", 'weight': 3}, "c"])
+    assert _serial(pool, 50) == {"a": 10, "b": 30, "c": 10}
+
+
+def test_ewma_sends_less_traffic_to_the_slow_endpoint():
+    pool = EndpointPool(["fast", "slow"], strategy="ewma")
+    counts = Counter()
+    for _ in range(100):
+        endpoint = pool.acquire()
+        counts[endpoint.base_url] += 1
+        pool.release(endpoint, 0.1 if endpoint.base_url == "fast" else 0.4)
+    assert counts["fast"] > 3 * counts["slow"] > 0
+
+
+def test_least_outstanding_prefers_idle_endpoints():
+    pool = EndpointPool(["a", "b"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.base_url, second.base_url} == {"a", "b"}
+
+
+def test_breaker_opens_after_consecutive_failures():
+    pool = EndpointPool(["a", "b"], failure_threshold=3, cooldown=60)
+    a = pool.endpoints[0]
+    _fail(pool, a, 2)
+    assert a.state == CLOSED
+    _fail(pool, a, 1)
+    assert a.state == OPEN
+    assert _serial(pool, 10) == {"b": 10}
+
+
+def test_success_resets_the_failure_count():
+    pool = EndpointPool(["a"], failure_threshold=2)
+    a = pool.endpoints[0]
+    _fail(pool, a, 1)
+    pool.release(pool.acquire(), 0.1)
+    _fail(pool, a, 1)
+    assert a.state == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens_the_breaker():
+    pool = EndpointPool(["a", "b"], failure_threshold=1, cooldown=0.05)
+    a = pool.endpoints[0]
+    _fail(pool, a, 1)
+    assert a.state == OPEN
+    time.sleep(0.06)
+    # 冷却结束后放行一个探测请求
+    probe = pool.acquire()
+    assert probe is a and a.state == HALF_OPEN
+    pool.release(probe, 0.1, ok=False)
+    assert a.state == OPEN
+    time.sleep(0.06)
+    probe = pool.acquire()
+    assert probe is a
+    pool.release(probe, 0.1)
+    assert a.state == CLOSED and a.failures == 0
+
+
+def test_inconclusive_probe_keeps_the_endpoint_open():
+    pool = EndpointPool(["a", "b"], failure_threshold=1, cooldown=0.05)
+    a = pool.endpoints[0]
+    _fail(pool, a, 1)
+    time.sleep(0.06)
+    probe = pool.acquire()
+    pool.release(probe, None)
+    assert a.state == OPEN and a.outstanding == 0
+
+
+def test_all_open_falls_back_to_the_earliest_opened():
+    pool = EndpointPool(["a", "b"], failure_threshold=1, cooldown=60)
+    a, b = pool.endpoints
+    _fail(pool, a, 1)
+    _fail(pool, b, 1)
+    assert pool.acquire() is a
+
+
+def test_stats_report_requests_and_errors():
+    pool = EndpointPool([Endpoint("a")])
+    pool.release(pool.acquire(), 0.2)
+    _fail(pool, pool.endpoints[0], 1)
+    stats = pool.stats()[0]
+    assert (stats['requests'], stats['errors'], stats['outstanding']) == (2, 1, 0)
+    assert stats['ewma_latency'] is not None
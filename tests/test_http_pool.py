@@ -0,0 +1,61 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 16:00
+@Version: v1.0
+@Description: tool.py 共享 HTTP 连接池的测试
+"""
+import pytest
+
+from chatgpt import tool
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+
+@pytest.fixture
+def pool():
+    """返回 configure_http_pool，测试结束后恢复原来的连接池配置"""
+    saved = dict(tool._http_pool_options)
+    yield tool.configure_http_pool
+    tool.configure_http_pool(**saved)
+
+
+def test_defaults_match_the_sdk_timeout(pool):
+    options = pool()
+    assert options['read_timeout'] == 600.0
+    timeout = tool.get_http_client().timeout
+    assert (timeout.read, timeout.connect) == (600.0, options['connect_timeout'])
+
+
+def test_rejects_unknown_options(pool):
+    with pytest.raises(TypeError):
+        pool(max_conections=10)
+
+
+def test_reconfiguring_rebuilds_the_clients(pool, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    client = tool.get_client()
+    assert client._client is tool.get_http_client()
+    assert tool.get_client() is client
+    pool(max_connections=7, read_timeout=30.0)
+    rebuilt = tool.get_client()
+    assert rebuilt is not client
+    assert rebuilt._client._transport._pool._max_connections == 7
+    assert rebuilt._client.timeout.read == 30.0
+
+
+def test_request_timeout_is_bounded_by_the_pool(pool):
+    pool(connect_timeout=5.0, read_timeout=600.0)
+    assert tool._request_timeout(None) is None
+    timeout = tool._request_timeout(30.0)
+    assert (timeout.read, timeout.connect) == (30.0, 5.0)
+    timeout = tool._request_timeout(1.0)
+    assert (timeout.read, timeout.connect) == (1.0, 1.0)
+    pool(read_timeout=10.0)
+    assert tool._request_timeout(30.0).read == 10.0
+
+
+def test_sequential_requests_reuse_one_connection(stub_server):
+    stub_server()
+    for i in range(3):
+        tool.get_completion_from_messages([{'role': 'user', 'content': f"第 {i} 个问题"}])
+    assert len(tool.get_http_client()._transport._pool.connections) == 1
@@ -0,0 +1,55 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 18:00
+@Version: v1.0
+@Description: tool.py 延迟加载的测试：导入时不读取 .env、不创建客户端、不加载 openai 和 tiktoken
+"""
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chatgpt import token_count, tool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_side_effects():
+    env = {name: value for name, value in os.environ.items() if not name.startswith("OPENAI_")}
+    code = ("import sys\n"
+            "from chatgpt import tool\n"
+            "loaded = [name for name in ('openai', 'httpx', 'tiktoken', 'dotenv') if name in sys.modules]\n"
+            "print(loaded, tool._client, tool._http_client, tool._settings_loaded)")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == "[] None None False"
+
+
+def test_clients_are_created_once(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    tool.configure_http_pool()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: tool.get_client(), range(32)))
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].api_key == "sk-test" and clients[0].max_retries == 0
+    tool.configure_http_pool()
+
+
+@pytest.fixture
+def without_tiktoken(monkeypatch):
+    # sys.modules 中的 None 让 import 抛出 ImportError
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    token_count._get_encoding.cache_clear()
+    yield
+    token_count._get_encoding.cache_clear()
+
+
+def test_counts_fall_back_to_estimates(without_tiktoken):
+    assert not token_count.uses_tiktoken()
+    assert token_count.count_text_tokens("你好，world") == 3 + 2
+    assert token_count.count_text_tokens("") == 0
+    messages = [{'role': 'user', 'content': "你好"}, {'role': 'assistant', 'content': None}]
+    assert token_count.count_message_tokens(messages) == token_count.TOKENS_PER_REPLY + 2 * \
+        token_count.TOKENS_PER_MESSAGE + 2
@@ -0,0 +1,179 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 18:40
+@Version: v1.0
+@Description: 模型调用指标（chatgpt/metrics.py、chatgpt/langchain_metrics.py）的测试
+"""
+import uuid
+
+import pytest
+
+from chatgpt import metrics, tool
+from chatgpt.metrics import MetricsRegistry, estimate_cost, infer_call_site
+
+MESSAGES = [{'role': 'user', 'content': '介绍一下你们的电视'}]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """替换全局注册表，避免与其他测试的调用互相影响"""
+    fresh = MetricsRegistry()
+    monkeypatch.setattr(metrics, "registry", fresh)
+    return fresh
+
+
+def series(registry, **labels):
+    return [item for item in registry.snapshot() if all(item[k] == v for k, v in labels.items())]
+
+
+def test_estimate_cost_uses_the_longest_prefix():
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert estimate_cost("gpt-4o-2024-08-06", 1_000_000) == pytest.approx(2.50)
+    assert estimate_cost("unknown-model", 1_000_000, 1_000_000) == 0.0
+
+
+def test_registry_aggregates_by_labels():
+    registry = MetricsRegistry()
+    registry.record("chat", "gpt-4o-mini", "ok", 0.2, 100, 20, call_site="a")
+    registry.record("chat", "gpt-4o-mini", "ok", 3.0, 50, 10, call_site="a")
+    # 只有 ok 调用计入 token 与费用
+    registry.record("chat", "gpt-4o-mini", "error", 0.01, 100, 20, call_site="a")
+    registry.record("chat", "gpt-4o-mini", "cache_hit", 0.001, 100, 20, call_site="b")
+
+    ok, = series(registry, call_site="a", outcome="ok")
+    assert (ok['count'], ok['prompt_tokens'], ok['completion_tokens']) == (2, 150, 30)
+    assert ok['latency_sum'] == pytest.approx(3.2)
+    assert ok['cost_usd'] == pytest.approx(estimate_cost("gpt-4o-mini", 150, 30))
+    # 直方图的桶是累计计数
+    assert ok['latency_buckets']["0.1"] == 0 and ok['latency_buckets']["0.25"] == 1
+    assert ok['latency_buckets']["5.0"] == 2 and ok['latency_buckets']["+Inf"] == 2
+    error, = series(registry, outcome="error")
+    assert error['count'] == 1 and error['prompt_tokens'] == 0 and error['cost_usd'] == 0
+
+    summary = registry.summary()
+    assert list(summary) == ["a", "b"]
+    assert summary["a"]['calls'] == 3 and summary["b"] == {'calls': 1, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                           'cost_usd': 0.0}
+    registry.reset()
+    assert registry.snapshot() == []
+
+
+def test_infer_call_site_skips_infrastructure_frames():
+    assert infer_call_site().endswith("test_metrics.test_infer_call_site_skips_infrastructure_frames")
+
+    # 模拟 tool.py 内部的辅助函数：它的帧被跳过，标签落在调用它的测试函数上
+    namespace = {'__name__': "chatgpt.tool", 'infer_call_site': infer_call_site}
+    exec("def helper():\n    return infer_call_site()", namespace)
+    assert namespace['helper']().endswith("test_metrics.test_infer_call_site_skips_infrastructure_frames")
+
+
+def test_call_site_scope_overrides_and_restores():
+    with metrics.call_site_scope("evaluate"):
+        assert infer_call_site() == "evaluate"
+        with metrics.call_site_scope("inner"):
+            assert infer_call_site() == "inner"
+        assert infer_call_site() == "evaluate"
+    assert infer_call_site() != "evaluate"
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.record("chat", "gpt-4o-mini", "ok", 0.2, 100, 20, call_site='phase"02\\x\n')
+    text = registry.render_prometheus()
+    labels = 'kind="chat",model="gpt-4o-mini",call_site="phase\\"02\\\\x\\n",outcome="ok"'
+    assert text.endswith("\n")
+    assert "# TYPE llm_requests_total counter" in text
+    assert "# TYPE llm_request_latency_seconds histogram" in text
+    assert f"llm_requests_total{{{labels}}} 1" in text.splitlines()
+    assert f'llm_request_latency_seconds_bucket{{{labels},le="0.1"}} 0' in text.splitlines()
+    assert f'llm_request_latency_seconds_bucket{{{labels},le="0.25"}} 1' in text.splitlines()
+    assert f'llm_request_latency_seconds_bucket{{{labels},le="+Inf"}} 1' in text.splitlines()
+    assert f"llm_request_latency_seconds_count{{{labels}}} 1" in text.splitlines()
+    assert f'llm_tokens_total{{{labels},type="prompt"}} 100' in text.splitlines()
+    assert f'llm_tokens_total{{{labels},type="completion"}} 20' in text.splitlines()
+    # 每个指标值都在标签之后，以空格分隔
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1])
+
+
+def test_tool_calls_are_recorded(stub_server, registry, monkeypatch):
+    stub_server(reply="您好！")
+    assert tool.get_completion_from_messages(MESSAGES) == "您好！"
+    ok, = series(registry, kind="chat", outcome="ok")
+    assert ok['call_site'].endswith("test_metrics.test_tool_calls_are_recorded")
+    assert ok['prompt_tokens'] > 0 and ok['completion_tokens'] > 0 and ok['cost_usd'] > 0
+
+    stub_server(error_ratio=1.0)
+    monkeypatch.setattr(tool._retry_policy, "max_retries", 0)
+    with metrics.call_site_scope("failing"), pytest.raises(Exception):
+        tool.get_completion_from_messages(MESSAGES)
+    error, = series(registry, call_site="failing")
+    assert error['outcome'] == "error" and error['prompt_tokens'] == 0
+
+
+@pytest.fixture
+def langchain_metrics():
+    pytest.importorskip("langchain_core")
+    from chatgpt import langchain_metrics
+    return langchain_metrics
+
+
+def test_callback_records_llm_output_usage(langchain_metrics, registry):
+    from langchain_core.outputs import ChatGeneration, LLMResult
+    from langchain_core.messages import AIMessage
+
+    handler = langchain_metrics.MetricsCallbackHandler()
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [[]], run_id=run_id, invocation_params={'model_name': "gpt-4o-mini"})
+    result = LLMResult(generations=[[ChatGeneration(message=AIMessage(content="您好"))]],
+                       llm_output={'model_name': "gpt-4o-mini-2024-07-18",
+                                   'token_usage': {'prompt_tokens': 12, 'completion_tokens': 3}})
+    handler.on_llm_end(result, run_id=run_id)
+    ok, = series(registry, outcome="ok")
+    assert ok['model'] == "gpt-4o-mini-2024-07-18"
+    assert (ok['prompt_tokens'], ok['completion_tokens']) == (12, 3)
+    # 调用方在调用开始时推断
+    assert ok['call_site'].endswith("test_metrics.test_callback_records_llm_output_usage")
+    # 未知的 run_id 不记录
+    handler.on_llm_end(result, run_id=uuid.uuid4())
+    assert [item['count'] for item in registry.snapshot()] == [1]
+
+
+def test_callback_reads_streamed_usage_metadata_and_errors(langchain_metrics, registry):
+    from langchain_core.outputs import ChatGeneration, LLMResult
+    from langchain_core.messages import AIMessage
+
+    handler = langchain_metrics.MetricsCallbackHandler()
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [[]], run_id=run_id, invocation_params={'model': "gpt-4o-mini"})
+    message = AIMessage(content="您好", usage_metadata={'input_tokens': 7, 'output_tokens': 2, 'total_tokens': 9})
+    handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+    ok, = series(registry, outcome="ok")
+    assert (ok['model'], ok['prompt_tokens'], ok['completion_tokens']) == ("gpt-4o-mini", 7, 2)
+
+    run_id = uuid.uuid4()
+    handler.on_llm_start({}, ["你好"], run_id=run_id, invocation_params={'model_name': "gpt-4o-mini"})
+    handler.on_llm_error(RuntimeError("上游错误"), run_id=run_id)
+    error, = series(registry, outcome="error")
+    assert error['count'] == 1 and error['prompt_tokens'] == 0
+
+
+def test_metered_embeddings(langchain_metrics, registry):
+    class FakeEmbeddings:
+        model = "text-embedding-3-small"
+
+        def embed_documents(self, texts):
+            return [[1.0, 0.0] for _ in texts]
+
+        def embed_query(self, text):
+            raise ConnectionError("Embedding 端点不可用")
+
+    embeddings = langchain_metrics.MeteredEmbeddings(FakeEmbeddings())
+    assert embeddings.embed_documents(["电视", "音响"]) == [[1.0, 0.0], [1.0, 0.0]]
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("电视")
+    ok, = series(registry, kind="embedding", outcome="ok")
+    assert ok['model'] == "text-embedding-3-small" and ok['prompt_tokens'] > 0
+    error, = series(registry, kind="embedding", outcome="error")
+    assert error['count'] == 1
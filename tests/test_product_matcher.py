@@ -0,0 +1,79 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 14:00
+@Version: v1.0
+@Description: 本地商品/类别匹配 ProductMatcher 的测试
+"""
+import os
+
+import pytest
+
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.product_matcher import ProductMatcher, normalize, normalize_words
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "chatgpt", "phase02", "products.json")
+
+PHONES = "Smartphones and Accessories"
+TVS = "Televisions and Home Theater Systems"
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return ProductMatcher(Catalog.from_json(PRODUCTS_PATH))
+
+
+def test_normalize_words_records_boundaries():
+    assert normalize("SmartX Pro-Phone！") == "smartxprophone"
+    assert normalize_words("SmartX Pro-Phone！") == ("smartxprophone", {0, 6, 9, 14})
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("请告诉我关于 smartx pro phone 和 the fotosnap camera 的信息。另外，请告诉我关于你们的tvs的情况。",
+     [{'category': TVS}, {'category': PHONES, 'products': ["SmartX ProPhone"]},
+      {'category': "Cameras and Camcorders", 'products': ["FotoSnap DSLR Camera"]}]),
+    ("介绍一下 SX-PP10", [{'category': PHONES, 'products': ["SmartX ProPhone"]}]),
+    ("ＣｉｎｅＶｉｅｗ ４Ｋ ＴＶ 多少钱", [{'category': TVS, 'products': ["CineView 4K TV"]}]),
+    ("CineView4KTV 多少钱", [{'category': TVS, 'products': ["CineView 4K TV"]}]),
+    ("我想买个手机", [{'category': PHONES}]),
+    ("do you sell phones?", [{'category': PHONES}]),
+    ("fotosnap dslr camra 怎么样", [{'category': "Cameras and Camcorders", 'products': ["FotoSnap DSLR Camera"]}]),
+])
+def test_confident_matches(matcher, query, expected):
+    assert matcher.match(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "你好",
+    # 品牌对应多个商品
+    "cineview 有哪些",
+    # 型号、类别别名落在更长的单词中间
+    "do you sell earphones",
+    "microphones?",
+    "SX-PP100 有吗",
+    "do you have a tvstand",
+])
+def test_uncertain_input_falls_back(matcher, query):
+    assert matcher.match(query) is None
+
+
+@pytest.mark.parametrize("query", ["Do you sell headphones?", "I need new headphones for my run", "有耳机吗"])
+def test_aliases_of_categories_without_products(matcher, query):
+    assert matcher.match(query) == [{'category': "Audio Equipment"}]
+
+
+def test_custom_aliases_replace_the_defaults():
+    catalog = Catalog([{'name': "Zeta Phone 1", 'category': PHONES}, {'name': "Zeta Phone 2", 'category': PHONES}])
+    matcher = ProductMatcher(catalog, category_aliases={PHONES: ["handsets"]})
+    assert matcher.match("any handsets?") == [{'category': PHONES}]
+    assert matcher.match("我想买个手机") is None
+
+
+def test_stats(matcher):
+    matcher = ProductMatcher(matcher.catalog)
+    matcher.record(True)
+    matcher.record(True)
+    matcher.record(False)
+    stats = matcher.stats()
+    assert (stats['local'], stats['llm_fallback'], stats['llm_calls_saved']) == (2, 1, 2)
+    assert stats['local_rate'] == pytest.approx(2 / 3)
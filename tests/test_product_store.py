@@ -0,0 +1,214 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 12:10
+@Version: v1.0
+@Description: SQLite FTS5 商品库（chatgpt/phase02/product_store.py）的测试
+"""
+import json
+import os
+import time
+
+import pytest
+
+from chatgpt.phase02 import util_zh
+from chatgpt.phase02.answer_evaluation import NAME_WEIGHT, PRICE_WEIGHT, local_score
+from chatgpt.phase02.catalog import Catalog
+from chatgpt.phase02.product_matcher import ProductMatcher
+from chatgpt.phase02.product_store import FullTextMatcher, FullTextRetriever, ProductStore, cjk_bigrams
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "chatgpt", "phase02", "products.json")
+
+ULTRABOOK = {'name': "TechPro 超极本", 'category': "Computers and Laptops", 'brand': "TechPro",
+             'model_number': "TP-UB100", 'warranty': "1 year", 'rating': 4.5,
+             'features': ["13.3 英寸显示屏", "8GB 内存"], 'description': "一款适用于日常使用的时尚轻便的超极本。",
+             'price': 799.99}
+
+QUERIES = [
+    "请告诉我关于 smartx pro phone 和 the fotosnap camera 的信息。另外，请告诉我关于你们的tvs的情况。",
+    "介绍一下 SX-PP10",
+    "cineview 有哪些电视",
+    "CineView 4K TV 多少钱",
+    "soundmax soundbar",
+    "我想买个手机",
+    "fotosnap dslr camra 怎么样",
+    "你好",
+    "相机和摄像机都有什么",
+]
+
+
+@pytest.fixture(scope="module")
+def products():
+    with open(PRODUCTS_PATH, "r", encoding="utf-8") as file:
+        return json.load(file) + [ULTRABOOK]
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory, products):
+    store = ProductStore(str(tmp_path_factory.mktemp("store") / "products.db"))
+    store.load_products(products)
+    yield store
+    store.close()
+
+
+def test_cjk_bigrams():
+    assert cjk_bigrams("智能手机") == " 智能 能手 手机 "
+    assert cjk_bigrams("TechPro 超极本") == "TechPro  超极 极本 "
+    assert cjk_bigrams("4K TV") == "4K TV"
+    assert cjk_bigrams(None) is None
+
+
+def test_rejects_unknown_tokenizer(tmp_path):
+    with pytest.raises(ValueError):
+        ProductStore(str(tmp_path / "products.db"), tokenize="porter")
+
+
+def test_lookups_match_the_in_memory_catalog(store, products):
+    catalog = Catalog(products)
+    assert len(store) == len(catalog)
+    for product in catalog:
+        assert store.get(product.name).to_dict() == product.to_dict()
+    assert store.get("smartx pro phone").name == "SmartX ProPhone"
+    assert store.get("Unknown") is None
+    assert store.category_names == catalog.category_names
+    assert [p.name for p in store.by_category("TELEVISIONS AND HOME THEATER SYSTEMS")] == \
+        catalog.category_names["Televisions and Home Theater Systems"]
+    assert store.category_sample("Televisions and Home Theater Systems", 2) == \
+        catalog.category_sample("Televisions and Home Theater Systems", 2)
+    assert store[0].name == products[0]['name']
+    with pytest.raises(IndexError):
+        store[len(products)]
+
+
+@pytest.mark.parametrize("tokenize", ["unicode61", "trigram"])
+@pytest.mark.parametrize("query, expected", [
+    ("smartx phone", "SmartX ProPhone"),
+    ("型号 CV-OLED55 怎么样", "CineView OLED TV"),
+    ("请介绍一下超极本", "TechPro 超极本"),
+    ("有 13.3 英寸显示屏的电脑吗", "TechPro 超极本"),
+])
+def test_search(tmp_path, products, tokenize, query, expected):
+    store = ProductStore(str(tmp_path / "products.db"), tokenize=tokenize)
+    store.load_products(products)
+    hits = store.search(query, limit=5)
+    assert hits[0][0].name == expected
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+    store.close()
+
+
+def test_search_without_hits(store):
+    assert store.search("无关的问题", limit=5) == []
+    assert store.search("", limit=5) == []
+
+
+def test_reload_replaces_products_and_bumps_version(tmp_path, products):
+    store = ProductStore(str(tmp_path / "products.db"))
+    store.load_products(products)
+    version = store.version
+    store.load_products(products[:2])
+    assert store.version == version + 1
+    assert len(store) == 2
+    assert store.search("cineview", limit=5) == []
+    store.load_products([ULTRABOOK], replace=False)
+    assert len(store) == 3 and store.search("超极本")[0][0].name == "TechPro 超极本"
+    store.close()
+
+
+def test_load_csv(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("name,category,brand,features,price\n"
+                    "Zeta Phone,Smartphones and Accessories,Zeta,5G; OLED,199\n"
+                    "Zeta Tab,Tablets,,,\n", encoding="utf-8")
+    store = ProductStore(str(tmp_path / "products.db"))
+    store.load_csv(str(path))
+    phone = store.get("Zeta Phone")
+    assert phone.features == ("5G", "OLED") and phone.price == 199.0
+    assert store.get("Zeta Tab").brand is None
+    store.close()
+
+
+def test_category_spelling_is_the_first_products(tmp_path):
+    store = ProductStore(str(tmp_path / "products.db"))
+    store.load_products([
+        {'name': "A", 'category': "Audio Equipment"},
+        {'name': "B", 'category': "audio  equipment"},
+        {'name': "C", 'category': "AUDIO EQUIPMENT"},
+    ])
+    assert store.categories() == ["Audio Equipment"]
+    assert [p.name for p in store.by_category("audio equipment")] == ["A", "B", "C"]
+    store.close()
+
+
+def test_full_text_matcher_agrees_with_product_matcher(store, products):
+    expected = ProductMatcher(Catalog(products))
+    matcher = FullTextMatcher(store)
+    for query in QUERIES:
+        assert matcher.match(query) == expected.match(query), query
+
+
+def test_full_text_matcher_on_a_larger_store(tmp_path):
+    brands = ("SmartX", "FotoSnap", "CineView", "SoundMax", "TechPro", "BlueWave", "Zeta")
+    kinds = (("Phone", "Smartphones and Accessories"), ("Camera", "Cameras and Camcorders"),
+             ("TV", "Televisions and Home Theater Systems"), ("Laptop", "Computers and Laptops"))
+    products = [{'name': f"{brand} {kind} {i}", 'category': category, 'brand': brand, 'model_number': f"{brand[:2]}-{i}"}
+                for i in range(40) for brand in brands for kind, category in kinds]
+    store = ProductStore(str(tmp_path / "products.db"))
+    store.load_products(products)
+    expected = ProductMatcher(Catalog(products))
+    matcher = FullTextMatcher(store, candidates=10)
+    queries = [f"{p['name']} 怎么样" for p in products[::37]] + [f"型号 {p['model_number']}" for p in products[::53]]
+    for query in queries + QUERIES:
+        assert matcher.match(query) == expected.match(query), query
+    store.close()
+
+
+def test_full_text_retriever_candidates(store):
+    candidates = FullTextRetriever(store).candidates("CineView OLED TV 和 SoundMax Soundbar", top_n=3)
+    names = [name for products in candidates.values() for name in products]
+    assert "CineView OLED TV" in names and "SoundMax Soundbar" in names
+
+
+def test_util_zh_uses_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(util_zh, "PRODUCT_STORE_PATH", str(tmp_path / "products.db"))
+    monkeypatch.setattr(util_zh, "_product_store", None)
+    monkeypatch.setattr(util_zh, "_matcher", None)
+    monkeypatch.setattr(util_zh, "_retriever", None)
+
+    def no_model(*args, **kwargs):
+        raise AssertionError("本地匹配应当直接返回，不调用模型")
+
+    monkeypatch.setattr(util_zh, "find_category_and_product_only", no_model)
+    assert isinstance(util_zh.get_catalog(), ProductStore)
+    assert isinstance(util_zh.get_product_matcher(), FullTextMatcher)
+    assert util_zh.extract_category_and_products("请告诉我关于 smartx pro phone 的信息") == \
+        [{'category': "Smartphones and Accessories", 'products': ["SmartX ProPhone"]}]
+    assert util_zh.get_product_by_name("CineView 8K TV")['price'] == 2999.99
+
+
+def test_category_expansion_is_capped(tmp_path, monkeypatch):
+    products = [{'name': f"Zeta Phone {i}", 'category': "Smartphones and Accessories", 'price': 100.0 + i}
+                for i in range(50)]
+    store = ProductStore(str(tmp_path / "products.db"))
+    store.load_products(products)
+    catalog = Catalog(products)
+    assert len(catalog.by_category("smartphones and accessories", 5)) == 5
+    assert len(catalog.by_category("smartphones and accessories")) == 50
+    monkeypatch.setattr(util_zh, "get_catalog", lambda: store)
+    monkeypatch.setattr(util_zh, "CATEGORY_PRODUCT_LIMIT", 10)
+    lines = util_zh.generate_output_string([{'category': "Smartphones and Accessories"}]).splitlines()
+    assert len(lines) == 10 and "Zeta Phone 0" in lines[0]
+    # 明确提到的商品不受上限影响
+    named = [{'category': "Smartphones and Accessories", 'products': [f"Zeta Phone {i}" for i in range(20)]}]
+    assert len(util_zh.generate_output_string(named).splitlines()) == 20
+    store.close()
+
+
+def test_local_score_scales_to_large_product_information():
+    lines = "\n".join(json.dumps({'name': f"Zeta Phone {i}", 'price': 100 + i * 0.5}) for i in range(20000))
+    started = time.perf_counter()
+    # 差价 $2500.00 = $10099.50 - $7599.50
+    assert local_score("Zeta Phone 1 的价格是 $100.50，比 Zeta Phone 0 贵 $0.50，差价 $2500.00", lines) == \
+        pytest.approx(NAME_WEIGHT * 2 / 3 + PRICE_WEIGHT)
+    assert local_score("差价 $0.25", lines) == pytest.approx(0.0)
+    assert time.perf_counter() - started < 2
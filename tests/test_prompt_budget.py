@@ -0,0 +1,111 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 18:20
+@Version: v1.0
+@Description: 按 token 预算裁剪历史（tool.fit_messages_to_budget）的测试，摘要调用替换为本地函数
+"""
+import logging
+from collections import OrderedDict
+
+import pytest
+
+from chatgpt import tool
+from chatgpt.token_count import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+
+MODEL = "gpt-4o-mini"
+# 消息足够多，摘要预留的空间放不下全部历史
+LONG = 60
+SYSTEM = {'role': 'system', 'content': "您是一家电子商店的客户服务助理。"}
+
+
+def conversation(count):
+    return [SYSTEM] + [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"第 {i:02d} 条消息" + "x" * 40}
+                       for i in range(count)]
+
+
+def cost(*messages):
+    return sum(tool._message_tokens(m['content'], MODEL) for m in messages)
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """把摘要调用替换为本地函数，返回每次调用收到的对话文本"""
+    transcripts = []
+
+    def fake(messages, model, temperature, max_tokens=None):
+        assert max_tokens == tool.SUMMARY_MAX_TOKENS
+        transcripts.append(messages[-1]['content'])
+        return f"摘要{len(transcripts)}", {}
+
+    monkeypatch.setattr(tool, "_chat_completion", fake)
+    monkeypatch.setattr(tool, "_summary_cache", OrderedDict())
+    return transcripts
+
+
+def test_within_budget_is_unchanged():
+    messages = conversation(4)
+    fitted = tool.fit_messages_to_budget(messages, budget=10_000)
+    assert fitted == messages and fitted is not messages
+
+
+def test_no_budget_is_unchanged(monkeypatch):
+    monkeypatch.setattr(tool, "_prompt_budget", None)
+    messages = conversation(20)
+    assert tool.fit_messages_to_budget(messages) == messages
+
+
+def test_drops_oldest_messages_first():
+    messages = conversation(10)
+    budget = TOKENS_PER_REPLY + cost(SYSTEM, *messages[-4:])
+    assert tool.fit_messages_to_budget(messages, budget=budget, summarize=False) == [SYSTEM] + messages[-4:]
+    assert tool.fit_messages_to_budget(messages, budget=budget - 1, summarize=False) == [SYSTEM] + messages[-3:]
+
+
+def test_keep_last_is_kept_over_budget():
+    messages = conversation(10)
+    assert tool.fit_messages_to_budget(messages, budget=1, keep_last=3, summarize=False) == [SYSTEM] + messages[-3:]
+    # 只有 system 消息也不会被丢弃
+    assert tool.fit_messages_to_budget(messages, budget=1, keep_last=0, summarize=False) == [SYSTEM]
+
+
+def test_summary_replaces_dropped_messages_within_its_reservation(summaries):
+    messages = conversation(LONG)
+    reserve = tool.SUMMARY_MAX_TOKENS + TOKENS_PER_MESSAGE
+    budget = TOKENS_PER_REPLY + cost(SYSTEM, *messages[-4:]) + reserve
+    fitted = tool.fit_messages_to_budget(messages, budget=budget)
+    assert fitted == [SYSTEM, {'role': 'system', 'content': "此前对话的摘要：摘要1"}] + messages[-4:]
+    # 被摘要的正是被丢弃的消息
+    assert [line for line in summaries[0].splitlines() if "消息" in line] == \
+        [f"{m['role']}: {m['content']}" for m in messages[1:-4]]
+    # 预算少一个 token 时，为摘要预留空间而多丢弃一条消息
+    assert tool.fit_messages_to_budget(messages, budget=budget - 1)[2:] == messages[-3:]
+
+
+def test_cached_prefix_summaries_are_extended_incrementally(summaries):
+    messages = conversation(LONG)
+    budget = TOKENS_PER_REPLY + cost(SYSTEM, *messages[-4:]) + tool.SUMMARY_MAX_TOKENS + TOKENS_PER_MESSAGE
+    tool.fit_messages_to_budget(messages, budget=budget)
+    # 同样的历史再裁剪一次，直接使用缓存的摘要
+    tool.fit_messages_to_budget(messages, budget=budget)
+    assert len(summaries) == 1
+    # 对话继续两条，只把新丢弃的两条消息与已有摘要合并
+    longer = conversation(LONG + 2)
+    fitted = tool.fit_messages_to_budget(longer, budget=budget)
+    assert len(summaries) == 2
+    assert summaries[1].startswith("已有摘要：摘要1\n新增对话：")
+    assert [line for line in summaries[1].splitlines() if "消息" in line] == \
+        [f"{m['role']}: {m['content']}" for m in longer[-6:-4]]
+    assert fitted[1]['content'] == "此前对话的摘要：摘要2"
+
+
+def test_failed_summary_drops_messages(monkeypatch, caplog):
+    def fail(*args, **kwargs):
+        raise RuntimeError("上游错误")
+
+    monkeypatch.setattr(tool, "_chat_completion", fail)
+    monkeypatch.setattr(tool, "_summary_cache", OrderedDict())
+    messages = conversation(LONG)
+    budget = TOKENS_PER_REPLY + cost(SYSTEM, *messages[-4:]) + tool.SUMMARY_MAX_TOKENS + TOKENS_PER_MESSAGE
+    with caplog.at_level(logging.WARNING, logger=tool.logger.name):
+        assert tool.fit_messages_to_budget(messages, budget=budget) == [SYSTEM] + messages[-4:]
+    assert "摘要失败" in caplog.text
@@ -0,0 +1,95 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 10:40
+@Version: v1.0
+@Description: RPM/TPM 令牌桶限流器（chatgpt/rate_limit.py）的测试
+"""
+import logging
+import threading
+import time
+
+import pytest
+
+from chatgpt import rate_limit
+from chatgpt.rate_limit import TokenBucketLimiter
+
+
+def test_unlimited_limiter_never_waits():
+    limiter = TokenBucketLimiter()
+    assert all(limiter.acquire(10_000) == 0 for _ in range(100))
+
+
+def test_rpm_blocks_once_the_bucket_is_empty():
+    # 每分钟 600 次，即每 0.1 秒补充一次
+    limiter = TokenBucketLimiter(rpm=600)
+    limiter._requests = 1.0
+    assert limiter.acquire() == 0
+    started = time.monotonic()
+    waited = limiter.acquire()
+    assert waited == pytest.approx(0.1, abs=0.03)
+    assert time.monotonic() - started >= 0.08
+
+
+def test_tpm_wait_is_proportional_to_the_missing_tokens():
+    limiter = TokenBucketLimiter(tpm=60_000)
+    assert limiter._try_take(60_000) == 0
+    # 桶已空，1000 个 token 需要等待 1 秒
+    assert limiter._try_take(1000) == pytest.approx(1.0, abs=0.05)
+
+
+def test_oversized_request_is_capped_at_bucket_capacity():
+    limiter = TokenBucketLimiter(tpm=1000)
+    assert limiter.acquire(5000) == 0
+    assert limiter._tokens == pytest.approx(0, abs=1)
+
+
+def test_reconcile_refunds_and_charges_the_difference():
+    limiter = TokenBucketLimiter(tpm=60_000)
+    limiter.acquire(10_000)
+    limiter.reconcile(10_000, 2_000)
+    assert limiter._tokens == pytest.approx(58_000, abs=10)
+    limiter.reconcile(0, 70_000)
+    # 余量可以为负，后续请求等待
+    assert limiter._tokens < 0
+    assert limiter._try_take(1) > 0
+
+
+def test_threads_share_one_budget():
+    limiter = TokenBucketLimiter(rpm=20)
+    limiter._requests = 20.0
+    taken = []
+
+    def worker():
+        taken.append(limiter._try_take(0) == 0)
+
+    threads = [threading.Thread(target=worker) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert taken.count(True) == 20
+
+
+@pytest.mark.skipif(rate_limit.fcntl is None, reason="需要 fcntl")
+def test_state_file_is_shared_between_limiters(tmp_path):
+    path = str(tmp_path / "limiter.state")
+    # 两个实例模拟两个工作进程
+    first = TokenBucketLimiter(rpm=60, state_file=path)
+    second = TokenBucketLimiter(rpm=60, state_file=path)
+    for _ in range(30):
+        assert first._try_take(0) == 0
+    for _ in range(30):
+        assert second._try_take(0) == 0
+    assert first._try_take(0) > 0
+    assert second._try_take(0) > 0
+
+
+def test_missing_fcntl_falls_back_to_process_local_limiter(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(rate_limit, "fcntl", None)
+    path = tmp_path / "limiter.state"
+    with caplog.at_level(logging.WARNING, logger=rate_limit.__name__):
+        limiter = TokenBucketLimiter(rpm=60, state_file=str(path))
+    assert limiter.state_file is None
+    assert "fcntl" in caplog.text
+    assert limiter.acquire() == 0
+    assert not path.exists()
@@ -0,0 +1,56 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:20
+@Version: v1.0
+@Description: 思维链回复的流式抽取 CustomerReplyExtractor 的测试
+"""
+import pytest
+
+from chatgpt.phase02.handle_input import CustomerReplyExtractor
+
+REASONING = ("步骤 1: ==== 用户在询问特定产品的价格差异。\n"
+             "步骤 2: ==== 两款产品都在列表中。\n"
+             "步骤 3: ==== 没有假设。\n"
+             "步骤 4: ==== 无需纠正。\n")
+REPLY = "BlueWave Chromebook 比 TechPro 台式电脑便宜 $750。"
+OUTPUT = f"{REASONING}回复客户: ==== {REPLY}"
+
+
+def _feed(text, size):
+    extractor = CustomerReplyExtractor()
+    visible = [extractor.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    visible.append(extractor.finish())
+    return extractor, "".join(visible)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, len(OUTPUT)])
+def test_only_the_reply_is_visible_for_any_chunking(size):
+    extractor, visible = _feed(OUTPUT, size)
+    assert visible == REPLY
+    assert extractor.reply == REPLY
+    assert extractor.reasoning.startswith(REASONING)
+    assert REPLY not in extractor.reasoning
+
+
+def test_nothing_is_visible_before_the_marker():
+    extractor = CustomerReplyExtractor()
+    assert all(extractor.feed(char) == "" for char in REASONING + "回复客户: ==")
+    assert extractor.feed("==") == ""
+    assert extractor.feed(" 您好") == "您好"
+
+
+def test_full_width_colon_and_missing_space():
+    _, visible = _feed(f"{REASONING}回复客户：===={REPLY}", 4)
+    assert visible == REPLY
+
+
+def test_missing_marker_falls_back_to_the_last_delimiter():
+    extractor, visible = _feed(f"{REASONING}步骤 5: ==== {REPLY}", 6)
+    assert visible == REPLY
+    assert extractor.reply == REPLY
+
+
+def test_custom_delimiter():
+    extractor = CustomerReplyExtractor(delimiter="####")
+    visible = extractor.feed("步骤 1: #### 推理\n回复客户: #### 好的") + extractor.finish()
+    assert visible == "好的"
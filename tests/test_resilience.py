@@ -0,0 +1,239 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 15:30
+@Version: v1.0
+@Description: 重试、截止时间与对冲请求（chatgpt/resilience.py）的测试，请求替换为本地函数
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from chatgpt.resilience import (DeadlineExceeded, LatencyTracker, RetryPolicy, acall_with_policy, call_with_policy,
+                                deadline, is_read_timeout, is_retryable)
+
+REQUEST = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+
+
+def status_error(cls, status, headers=None):
+    return cls("上游错误", response=httpx.Response(status, headers=headers, request=REQUEST), body=None)
+
+
+def sdk_timeout(cause):
+    """模拟 SDK 把 httpx 的超时包装为 APITimeoutError"""
+    try:
+        raise openai.APITimeoutError(request=REQUEST) from cause
+    except openai.APITimeoutError as e:
+        return e
+
+
+def failing(errors, result="ok"):
+    """依次抛出 errors 中的错误，之后返回 result；calls 记录每次收到的 timeout"""
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def fast_policy(**options):
+    return RetryPolicy(base_delay=0.001, max_delay=0.002, **options)
+
+
+def test_retryable_errors():
+    assert is_retryable(status_error(openai.RateLimitError, 429))
+    assert is_retryable(status_error(openai.InternalServerError, 503))
+    assert is_retryable(httpx.RemoteProtocolError("连接中断"))
+    assert not is_retryable(status_error(openai.BadRequestError, 400))
+    assert not is_retryable(ValueError())
+
+
+def test_read_timeouts():
+    assert is_read_timeout(httpx.ReadTimeout("读取超时"))
+    assert is_read_timeout(sdk_timeout(httpx.ReadTimeout("读取超时")))
+    assert not is_read_timeout(sdk_timeout(httpx.ConnectTimeout("连接超时")))
+    assert not is_read_timeout(sdk_timeout(httpx.PoolTimeout("连接池已满")))
+    assert not is_read_timeout(httpx.ConnectTimeout("连接超时"))
+
+
+def test_retries_until_success():
+    fn, calls = failing([status_error(openai.InternalServerError, 500), status_error(openai.RateLimitError, 429)])
+    assert call_with_policy(fn, fast_policy(max_retries=2)) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_max_retries():
+    error = status_error(openai.InternalServerError, 500)
+    fn, calls = failing([error] * 5)
+    with pytest.raises(openai.InternalServerError):
+        call_with_policy(fn, fast_policy(max_retries=2))
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    fn, calls = failing([status_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        call_with_policy(fn, fast_policy())
+    assert len(calls) == 1
+
+
+def test_read_timeouts_are_not_retried_by_default():
+    fn, calls = failing([sdk_timeout(httpx.ReadTimeout("读取超时"))])
+    with pytest.raises(openai.APITimeoutError):
+        call_with_policy(fn, fast_policy())
+    assert len(calls) == 1
+    # 连接超时时请求没有发出，可以放心重试
+    fn, calls = failing([sdk_timeout(httpx.ConnectTimeout("连接超时"))])
+    assert call_with_policy(fn, fast_policy()) == "ok"
+    assert len(calls) == 2
+    fn, calls = failing([sdk_timeout(httpx.ReadTimeout("读取超时"))])
+    assert call_with_policy(fn, fast_policy(retry_read_timeouts=True)) == "ok"
+    assert len(calls) == 2
+
+
+def test_backoff_honours_retry_after():
+    policy = RetryPolicy(max_delay=5.0)
+    assert policy.backoff(0, status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert policy.backoff(0, status_error(openai.RateLimitError, 429, {"retry-after": "30"})) == 5.0
+    assert 0 <= policy.backoff(3) <= 4.0
+
+
+def test_attempt_timeout_is_bounded_by_the_deadline():
+    fn, calls = failing([])
+    call_with_policy(fn, RetryPolicy())
+    assert calls == [600.0]
+    with deadline(2):
+        call_with_policy(fn, RetryPolicy())
+    assert 1.5 < calls[-1] <= 2
+    call_with_policy(fn, RetryPolicy(deadline=1, attempt_timeout=None))
+    assert 0.5 < calls[-1] <= 1
+
+
+def test_expired_deadline_does_not_call():
+    fn, calls = failing([])
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0):
+            call_with_policy(fn, RetryPolicy())
+    assert calls == []
+
+
+def test_backoff_past_the_deadline_raises():
+    fn, calls = failing([status_error(openai.RateLimitError, 429, {"retry-after": "5"})])
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_policy(fn, RetryPolicy(deadline=1, max_delay=5))
+    assert len(calls) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_timeout_cut_short_by_the_deadline_raises_deadline_exceeded():
+    def fn(timeout):
+        time.sleep(timeout)
+        raise sdk_timeout(httpx.ReadTimeout("读取超时"))
+
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.1):
+            call_with_policy(fn, RetryPolicy())
+
+
+def test_nested_deadlines_keep_the_earlier_one():
+    fn, calls = failing([])
+    with deadline(1):
+        with deadline(10):
+            call_with_policy(fn, RetryPolicy())
+    assert calls[-1] <= 1
+
+
+def test_latency_tracker_quantile():
+    tracker = LatencyTracker(window=4)
+    assert tracker.quantile(0.95) is None
+    for seconds in (5, 1, 2, 3, 4):
+        tracker.record(seconds)
+    assert len(tracker) == 4
+    assert tracker.quantile(0.5) == 3
+    assert tracker.quantile(0.95) == 4
+
+
+def _warm_tracker(seconds=0.01, count=3):
+    tracker = LatencyTracker()
+    for _ in range(count):
+        tracker.record(seconds)
+    return tracker
+
+
+def test_slow_request_is_hedged():
+    calls = []
+    lock = threading.Lock()
+
+    def fn(timeout):
+        with lock:
+            calls.append(timeout)
+            first = len(calls) == 1
+        if first:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    policy = RetryPolicy(hedge=True, hedge_min_samples=3, hedge_min_delay=0.05)
+    started = time.monotonic()
+    assert call_with_policy(fn, policy, _warm_tracker()) == "fast"
+    assert time.monotonic() - started < 0.5
+    assert len(calls) == 2
+    # 对冲请求的超时扣除已经等待的时间
+    assert calls[1] < calls[0]
+
+
+def test_no_hedge_before_enough_samples():
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        time.sleep(0.1)
+        return "ok"
+
+    policy = RetryPolicy(hedge=True, hedge_min_samples=3, hedge_min_delay=0.01)
+    assert call_with_policy(fn, policy, _warm_tracker(count=2)) == "ok"
+    assert len(calls) == 1
+
+
+def test_hedged_call_raises_when_both_fail():
+    def fn(timeout):
+        time.sleep(0.1)
+        raise status_error(openai.BadRequestError, 400)
+
+    policy = RetryPolicy(hedge=True, hedge_min_samples=3, hedge_min_delay=0.05)
+    with pytest.raises(openai.BadRequestError):
+        call_with_policy(fn, policy, _warm_tracker())
+
+
+def test_successful_calls_feed_the_tracker():
+    tracker = LatencyTracker()
+    fn, _ = failing([])
+    call_with_policy(fn, RetryPolicy(), tracker)
+    assert len(tracker) == 1
+
+
+def test_async_retries_and_read_timeouts():
+    errors = [status_error(openai.InternalServerError, 500)]
+    calls = []
+
+    async def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    assert asyncio.run(acall_with_policy(fn, fast_policy())) == "ok"
+    assert len(calls) == 2
+    calls.clear()
+    errors[:] = [sdk_timeout(httpx.ReadTimeout("读取超时"))]
+    with pytest.raises(openai.APITimeoutError):
+        asyncio.run(acall_with_policy(fn, fast_policy()))
+    assert len(calls) == 1
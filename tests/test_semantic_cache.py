@@ -0,0 +1,143 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 15:00
+@Version: v1.0
+@Description: 语义答案缓存 SemanticCache 及其在端到端问答中的使用的测试，Embedding 替换为本地的字符计数向量
+"""
+import logging
+
+import numpy as np
+import pytest
+
+from chatgpt import semantic_cache
+from chatgpt.phase02 import end_to_end_chatbot as e2e
+from chatgpt.semantic_cache import SemanticCache
+
+
+def embed(text):
+    """按字符计数的 64 维向量，只差一两个字的问题相似度很高"""
+    vector = np.zeros(64)
+    for char in text.lower():
+        vector[ord(char) % 64] += 1
+    return vector
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动拨动的 time.time"""
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_similar_questions_hit():
+    cache = SemanticCache(embed)
+    value, embedding = cache.lookup("SmartX ProPhone 多少钱")
+    assert value is None
+    cache.store("SmartX ProPhone 多少钱", "$899.99", embedding)
+    assert cache.lookup("smartx prophone 多少钱？")[0] == "$899.99"
+    assert cache.lookup("有哪些游戏机")[0] is None
+    assert (cache.stats()['hits'], cache.stats()['misses'], cache.stats()['entries']) == (1, 2, 1)
+
+
+def test_key_must_match():
+    cache = SemanticCache(embed)
+    question_4k, question_8k = "CineView 4K TV 多少钱", "CineView 8K TV 多少钱"
+    assert cache.embed(question_4k) @ cache.embed(question_8k) >= cache.threshold
+    cache.store(question_4k, "$599.99", key={"CineView 4K TV"})
+    assert cache.lookup(question_8k, key={"CineView 8K TV"})[0] is None
+    assert cache.lookup(question_4k, key={"CineView 8K TV"})[0] is None
+    assert cache.lookup(question_8k, key={"CineView 4K TV"})[0] == "$599.99"
+    # 相似度更高但 key 不同的条目不会挡住 key 相同的条目
+    cache.store(question_8k, "$2999.99", key={"CineView 8K TV"})
+    assert cache.lookup(question_8k, key={"CineView 4K TV"})[0] == "$599.99"
+
+
+def test_version_change_invalidates():
+    cache = SemanticCache(embed)
+    cache.store("有哪些电视", "很多", version=1)
+    assert cache.lookup("有哪些电视", version=1)[0] == "很多"
+    assert cache.lookup("有哪些电视", version=2)[0] is None
+    assert cache.stats()['entries'] == 0 and cache.version == 2
+
+
+def test_expired_entries_miss(clock):
+    cache = SemanticCache(embed, ttl=10)
+    cache.store("有哪些电视", "很多")
+    clock[0] += 5
+    assert cache.lookup("有哪些电视")[0] == "很多"
+    clock[0] += 6
+    assert cache.lookup("有哪些电视")[0] is None
+
+
+def test_evicts_least_recently_used(clock):
+    cache = SemanticCache(embed, max_entries=2, ttl=None)
+    cache.store("aaaa", 1)
+    clock[0] += 1
+    cache.store("bbbb", 2)
+    clock[0] += 1
+    assert cache.lookup("aaaa")[0] == 1
+    clock[0] += 1
+    cache.store("cccc", 3)
+    assert cache.lookup("aaaa")[0] == 1
+    assert cache.lookup("bbbb")[0] is None
+    assert cache.lookup("cccc")[0] == 3
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    把端到端问答中的模型调用替换为本地函数，语义缓存换成使用 embed 的新缓存
+    返回:
+        每次生成回答时收到的用户问题列表
+    """
+    generated = []
+    products = {"CineView 4K TV": 599.99, "CineView 8K TV": 2999.99}
+
+    def extract(user_input):
+        return [{'category': "Televisions and Home Theater Systems",
+                 'products': [name for name in products if name.split()[1] in user_input]}]
+
+    def generate(messages, checks, on_delta=None):
+        generated.append(messages[-2]['content'])
+        name = next(name for name in products if name in messages[-1]['content'])
+        return f"{name} 的价格是 ${products[name]}"
+
+    monkeypatch.setattr(e2e, "answer_cache", SemanticCache(embed))
+    monkeypatch.setattr(e2e, "check_moderation", lambda user_input: False)
+    monkeypatch.setattr(e2e, "check_injection", lambda user_input: False)
+    monkeypatch.setattr(e2e.util_zh, "extract_category_and_products", extract)
+    monkeypatch.setattr(e2e.util_zh, "generate_output_string",
+                        lambda data: "\n".join(f"name:{name}" for name in data[0]['products']))
+    monkeypatch.setattr(e2e.util_zh, "get_catalog_version", lambda: 1)
+    monkeypatch.setattr(e2e, "_generate_answer", generate)
+    monkeypatch.setattr(e2e.evaluation_policy, "evaluate",
+                        lambda *args: {'passed': True, 'method': "llm", 'score': None})
+    return generated
+
+
+def test_pipeline_serves_repeated_questions_from_cache(pipeline):
+    first, _ = e2e.process_user_message_ch("CineView 4K TV 多少钱", [], debug=False)
+    again, history = e2e.process_user_message_ch("cineview 4K TV 多少钱？", [], debug=False)
+    assert again == first == "CineView 4K TV 的价格是 $599.99"
+    assert len(pipeline) == 1
+    assert history[-1]['content'].endswith("name:CineView 4K TV")
+
+
+def test_pipeline_does_not_answer_another_product_from_cache(pipeline):
+    e2e.process_user_message_ch("CineView 4K TV 多少钱", [], debug=False)
+    response, _ = e2e.process_user_message_ch("CineView 8K TV 多少钱", [], debug=False)
+    assert response == "CineView 8K TV 的价格是 $2999.99"
+    assert len(pipeline) == 2
+
+
+def test_pipeline_skips_the_cache_when_embedding_fails(pipeline, monkeypatch, caplog):
+    def broken(text):
+        raise ConnectionError("embedding 服务不可用")
+
+    monkeypatch.setattr(e2e, "answer_cache", SemanticCache(broken))
+    with caplog.at_level(logging.WARNING, logger=e2e.logger.name):
+        response, _ = e2e.process_user_message_ch("CineView 4K TV 多少钱", [], debug=False)
+    assert response == "CineView 4K TV 的价格是 $599.99"
+    assert "语义缓存查找失败" in caplog.text
+    assert e2e.answer_cache.stats()['entries'] == 0
@@ -0,0 +1,105 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 11:00
+@Version: v1.0
+@Description: 在途请求合并（chatgpt/singleflight.py）的测试
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chatgpt import tool
+from chatgpt.singleflight import SingleFlight
+
+
+def _blocking(calls, release, result="结果"):
+    """返回一个等待 release 后才返回的函数，calls 记录真正执行的次数"""
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return result
+
+    return fn
+
+
+def _wait_for_followers(flight, count):
+    # follower 在进入等待前先计数，计数到齐即可放行 leader
+    for _ in range(500):
+        if flight.coalesced >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError("follower 没有到齐")
+
+
+def test_concurrent_identical_calls_execute_once():
+    flight = SingleFlight()
+    calls, release = [], threading.Event()
+    fn = _blocking(calls, release)
+    with ThreadPoolExecutor(8) as executor:
+        futures = [executor.submit(flight.do, "key", fn) for _ in range(8)]
+        _wait_for_followers(flight, 7)
+        release.set()
+        assert [future.result() for future in futures] == ["结果"] * 8
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert (stats['executed'], stats['coalesced'], stats['in_flight']) == (1, 7, 0)
+    assert stats['coalesce_rate'] == pytest.approx(7 / 8)
+
+
+def test_different_keys_are_not_merged():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key=key: key) for key in ("a", "b", "a")] == ["a", "b", "a"]
+    # 调用结束后不再合并，第二次 "a" 重新执行
+    assert flight.stats()['executed'] == 3
+
+
+def test_error_is_shared_with_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("上游错误")
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(flight.do, "key", fail) for _ in range(4)]
+        _wait_for_followers(flight, 3)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="上游错误"):
+                future.result()
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_calls_are_merged():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "结果"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["结果"] * 5
+    assert len(calls) == 1
+    assert flight.stats()['coalesced'] == 4
+
+
+def test_tool_coalesces_identical_deterministic_requests(fake_completions):
+    fake_completions.reply = "合并的回答"
+    fake_completions.delay = 0.2
+    messages = [{'role': 'user', 'content': '合并测试'}]
+    before = tool.get_coalescing_stats()
+    with ThreadPoolExecutor(6) as executor:
+        results = list(executor.map(lambda _: tool.get_completion_from_messages(messages), range(6)))
+    assert results == ["合并的回答"] * 6
+    assert len(fake_completions.requests) == 1
+    after = tool.get_coalescing_stats()
+    assert after['coalesced'] - before['coalesced'] == 5
@@ -0,0 +1,69 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 12:30
+@Version: v1.0
+@Description: 流式补全的重试策略与截止时间的测试
+"""
+import time
+
+import httpx
+import pytest
+from openai import InternalServerError
+
+from chatgpt import tool
+from chatgpt.resilience import DeadlineExceeded, deadline
+
+MESSAGES = [{'role': 'user', 'content': '介绍一下你们的电视'}]
+
+
+@pytest.fixture
+def retries():
+    """返回 configure_retries，测试结束后恢复原来的重试策略"""
+    policy = tool.configure_retries()
+    saved = dict(vars(policy))
+    yield tool.configure_retries
+    tool.configure_retries(**saved)
+
+
+def server_error():
+    request = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+    return InternalServerError("The server had an error", response=httpx.Response(500, request=request), body=None)
+
+
+def test_failed_stream_is_retried_per_policy(fake_completions, retries):
+    fake_completions.error = server_error()
+    retries(max_retries=2, base_delay=0.01, max_delay=0.02)
+    with pytest.raises(InternalServerError):
+        list(tool.stream_completion_from_messages(MESSAGES))
+    assert len(fake_completions.requests) == 3
+
+
+def test_each_attempt_gets_the_attempt_timeout(fake_completions, retries):
+    retries(attempt_timeout=30)
+    assert "".join(tool.stream_completion_from_messages(MESSAGES)) == fake_completions.reply
+    assert fake_completions.requests[0]['timeout'].read == 30
+
+
+def test_deadline_interrupts_a_slow_stream(fake_completions):
+    fake_completions.reply = "很长的回答" * 50
+    fake_completions.token_delay = 0.02
+    stream = tool.stream_completion_from_messages(MESSAGES)
+    received = []
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.3):
+            for delta in stream:
+                received.append(delta)
+    assert received
+    assert time.monotonic() - started < 1.0
+    # 超过截止时间后关闭响应
+    assert fake_completions.streams[0].closed
+
+
+def test_deadline_covers_the_first_chunk(fake_completions):
+    fake_completions.delay = 2
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.3):
+            list(tool.stream_completion_from_messages(MESSAGES))
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,57 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 10:50
+@Version: v1.0
+@Description: 流式补全 CompletionStream 的测试
+"""
+from chatgpt import tool
+
+MESSAGES = [{'role': 'user', 'content': '介绍一下你们的电视'}]
+REPLY = "我们有 CineView 4K TV、CineView 8K TV 和 CineView OLED TV 三款电视。"
+
+
+def test_stream_yields_the_whole_reply(fake_completions):
+    fake_completions.reply = REPLY
+    fake_completions.delay = 0.05
+    fake_completions.token_delay = 0.005
+    stream = tool.stream_completion_from_messages(MESSAGES)
+    deltas = list(stream)
+    assert len(deltas) > 1
+    assert "".join(deltas) == stream.content == REPLY
+    assert stream.usage['total_tokens'] == stream.usage['prompt_tokens'] + stream.usage['completion_tokens']
+    assert stream.usage['completion_tokens'] > 0
+    assert 0.05 <= stream.time_to_first_token <= stream.latency
+    assert fake_completions.requests[0]['stream_options'] == {'include_usage': True}
+
+
+def test_iterator_returns_usage(fake_completions):
+    fake_completions.reply = REPLY
+    iterator = iter(tool.stream_completion_from_messages(MESSAGES))
+    try:
+        while True:
+            next(iterator)
+    except StopIteration as stop:
+        usage = stop.value
+    assert usage['completion_tokens'] == len(REPLY)
+
+
+def test_usage_is_estimated_without_a_usage_chunk(fake_completions, monkeypatch):
+    # 部分代理忽略 stream_options，不返回 usage 分块
+    create = fake_completions.__call__
+    monkeypatch.setattr(tool.client.chat.completions, "create",
+                        lambda **params: create(**{k: v for k, v in params.items() if k != 'stream_options'}))
+    fake_completions.reply = REPLY
+    stream = tool.stream_completion_from_messages(MESSAGES)
+    assert "".join(stream) == REPLY
+    assert stream.usage['completion_tokens'] > 0 and stream.usage['prompt_tokens'] > 0
+
+
+def test_closing_early_stops_the_stream(fake_completions):
+    fake_completions.reply = REPLY * 20
+    fake_completions.token_delay = 0.01
+    stream = tool.stream_completion_from_messages(MESSAGES)
+    iterator = iter(stream)
+    first = next(iterator)
+    iterator.close()
+    assert REPLY.startswith(first)
+    assert stream.content is None and stream.latency is None
@@ -0,0 +1,151 @@
+"""
+@Author： Michael J H Duan[JunHua]
+@Date: 2026-10-19 19:00
+@Version: v1.0
+@Description: 本地 OpenAI 兼容桩服务（chatgpt/stub_server.py）的测试：直接用 httpx 和 OpenAI SDK 访问
+"""
+import base64
+import json
+import struct
+import threading
+
+import httpx
+import pytest
+from openai import OpenAI, RateLimitError
+
+from chatgpt.stub_server import hash_embedding, parse_latency, start_server
+
+MESSAGES = [{'role': 'user', 'content': '介绍一下你们的电视'}]
+REPLY = "我们有 CineView 4K TV 和 CineView OLED TV 两款电视。"
+
+
+@pytest.fixture
+def serve():
+    """返回 serve(**options)：启动桩服务，返回 (server, base_url)，测试结束后关闭"""
+    servers = []
+
+    def serve(**options):
+        server, base_url = start_server("127.0.0.1", 0, **options)
+        servers.append(server)
+        return server, base_url
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client(base_url):
+    return OpenAI(api_key="sk-stub", base_url=base_url, max_retries=0)
+
+
+def test_parse_latency():
+    assert parse_latency(None)() == 0.0
+    assert parse_latency("fixed:0.05")() == 0.05
+    assert all(0.02 <= parse_latency("uniform:0.02,0.2")() <= 0.2 for _ in range(100))
+    assert all(parse_latency("normal:0.0,1.0")() >= 0 for _ in range(100))
+    assert all(parse_latency("lognormal:-2.5,0.5")() > 0 for _ in range(100))
+    with pytest.raises(ValueError):
+        parse_latency("poisson:1")
+
+
+def test_hash_embedding_is_deterministic_and_normalized():
+    first = hash_embedding("CineView 4K TV", 64)
+    assert first == hash_embedding("CineView 4K TV", 64) and len(first) == 64
+    assert sum(v * v for v in first) == pytest.approx(1.0)
+
+    def similarity(a, b):
+        return sum(x * y for x, y in zip(hash_embedding(a, 256), hash_embedding(b, 256)))
+
+    # 字面相近的文本相似度更高
+    assert similarity("CineView 4K TV", "CineView 4K TV 多少钱") > similarity("CineView 4K TV", "蓝牙耳机")
+    assert hash_embedding([101, 2023, 102], 64) == hash_embedding([101, 2023, 102], 64)
+
+
+def test_chat_completion(serve):
+    _, base_url = serve(reply=REPLY)
+    response = client(base_url).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+    assert response.choices[0].message.content == REPLY
+    usage = response.usage
+    assert usage.prompt_tokens > 0 and usage.completion_tokens > 0
+    assert usage.total_tokens == usage.prompt_tokens + usage.completion_tokens
+    truncated = client(base_url).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES, max_tokens=5)
+    assert truncated.choices[0].message.content == REPLY[:5]
+
+
+def test_streamed_chat_completion(serve):
+    _, base_url = serve(reply=REPLY)
+    stream = client(base_url).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES, stream=True,
+                                                      stream_options={'include_usage': True})
+    chunks = list(stream)
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices) == REPLY
+    assert [chunk.choices[0].finish_reason for chunk in chunks if chunk.choices][-1] == "stop"
+    # 最后一个分块只带 usage
+    assert chunks[-1].choices == [] and chunks[-1].usage.completion_tokens > 0
+
+    with httpx.stream("POST", f"{base_url}/chat/completions",
+                      json={'model': "gpt-4o-mini", 'messages': MESSAGES, 'stream': True}) as response:
+        assert response.headers["content-type"] == "text/event-stream"
+        events = [line for line in response.iter_lines() if line]
+    assert events[-1] == "data: [DONE]"
+    assert all(event.startswith("data: ") for event in events)
+    assert "usage" not in json.loads(events[-2][len("data: "):])
+
+
+def test_embeddings(serve):
+    _, base_url = serve(dimensions=32)
+    openai_client = client(base_url)
+    response = openai_client.embeddings.create(model="text-embedding-3-small", input=["电视", "音响"],
+                                               encoding_format="float")
+    assert [item.embedding for item in response.data] == [hash_embedding("电视", 32), hash_embedding("音响", 32)]
+    assert response.usage.prompt_tokens > 0
+
+    encoded = httpx.post(f"{base_url}/embeddings", json={'input': "电视", 'encoding_format': "base64",
+                                                         'dimensions': 8}).json()
+    vector = struct.unpack("<8f", base64.b64decode(encoded["data"][0]["embedding"]))
+    assert vector == pytest.approx(hash_embedding("电视", 8), abs=1e-6)
+
+
+def test_models_moderations_and_stats(serve):
+    _, base_url = serve()
+    models = client(base_url).models.list()
+    assert "gpt-4o-mini" in [model.id for model in models]
+    moderation = client(base_url).moderations.create(input=["你好", "谢谢"])
+    assert [result.flagged for result in moderation.results] == [False, False]
+    assert httpx.post(f"{base_url}/unknown", json={}).status_code == 404
+    stats = httpx.get(f"{base_url}/stats").json()
+    assert stats == {'requests': 1, 'ok': 1, 'rate_limited': 0, 'errors': 0, 'in_flight': 0}
+
+
+def test_rps_limit_returns_retry_after(serve):
+    _, base_url = serve(max_rps=2)
+    body = {'model': "gpt-4o-mini", 'messages': MESSAGES}
+    statuses = [httpx.post(f"{base_url}/chat/completions", json=body) for _ in range(3)]
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    # Retry-After 与令牌桶补满一个令牌所需的时间一致
+    assert 0 < float(statuses[-1].headers["Retry-After"]) <= 0.5
+    with pytest.raises(RateLimitError):
+        client(base_url).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+
+
+def test_concurrency_limit(serve):
+    server, base_url = serve(latency="fixed:0.3", max_concurrency=2)
+    body = {'model': "gpt-4o-mini", 'messages': MESSAGES}
+    statuses = []
+
+    def post():
+        statuses.append(httpx.post(f"{base_url}/chat/completions", json=body).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [200, 200, 429, 429]
+    assert server.RequestHandlerClass.state.counts['rate_limited'] == 2
+
+
+def test_error_ratio(serve):
+    _, base_url = serve(error_ratio=1.0)
+    response = httpx.post(f"{base_url}/chat/completions", json={'model': "gpt-4o-mini", 'messages': MESSAGES})
+    assert response.status_code == 500 and response.json()["error"]["type"] == "server_error"